@@ -0,0 +1,181 @@
+# -*- coding: utf-8 -*-
+"""
+app/analytics.py
+
+Activity statistics computed with NumPy. The (timestamp, quantity) history
+of an activity type is loaded once into arrays and every statistic is
+derived from them with vectorized operations, so even multi-year histories
+take milliseconds.
+"""
+
+# Built-in module imports
+from dataclasses import dataclass
+from datetime import date, datetime
+from typing import Any, Dict, Iterable, Optional
+
+# 3rd party module imports
+import numpy as np
+from psycopg2.extensions import connection
+
+# local module imports
+from app.db.activity_queries import get_activity_series
+from app.db.timezone import local_today, to_local
+
+WEEKDAYS = ("Monday", "Tuesday", "Wednesday", "Thursday", "Friday",
+            "Saturday", "Sunday")
+PERCENTILES = (10, 25, 50, 75, 90)
+
+@dataclass
+class ActivitySeries:
+    """
+    History of one activity type as NumPy arrays.
+
+    Attributes:
+        timestamps (np.ndarray): datetime64[us] log timestamps as wall
+            times in APP_TIMEZONE, ascending.
+        quantities (np.ndarray): float64 canonical quantities.
+    """
+    timestamps: np.ndarray
+    quantities: np.ndarray
+
+    def daily_totals(self, until: Optional[date] = None) -> tuple:
+        """
+        Buckets the quantities per calendar day into a dense array that has
+        one slot for every day from the first log through until (defaults to
+        the last logged day), including days without activity.
+
+        Returns:
+            tuple: (first_day, totals) where first_day is a datetime64[D]
+                and totals a float64 array.
+        """
+        days = self.timestamps.astype("datetime64[D]")
+        first = days[0]
+        last = days[-1] if until is None \
+            else max(days[-1], np.datetime64(until, "D"))
+        offsets = (days - first).astype(np.int64)
+        totals = np.bincount(offsets, weights=self.quantities,
+                             minlength=int((last - first).astype(int)) + 1)
+        return first, totals
+
+def load_series(conn: connection, user_id: int, activity_type_id: int,
+        start: Optional[datetime] = None, end: Optional[datetime] = None,
+        tags: Optional[Iterable[str]] = None) -> ActivitySeries:
+    """
+    Bulk-loads the history of an activity type into NumPy arrays.
+
+    Args:
+        conn (connection): Handle for psql database connection.
+        user_id (int): ID of the user owning the logs.
+        activity_type_id (int): ID value for the activity of interest.
+        start (Optional[datetime]): Earliest timestamp to include.
+        end (Optional[datetime]): Timestamp to stop at (exclusive).
+        tags (Optional[Iterable[str]]): Only include logs carrying all of
+            these tags.
+
+    Returns:
+        ActivitySeries: The loaded arrays.
+    """
+    timestamps, quantities = get_activity_series(
+        conn, user_id, activity_type_id, start, end, tags)
+    # NumPy datetimes have no zone; they hold APP_TIMEZONE wall times, so
+    # that whole days are local days.
+    return ActivitySeries(
+        np.array([to_local(ts).replace(tzinfo=None) for ts in timestamps],
+                 dtype="datetime64[us]"),
+        np.array(quantities, dtype=np.float64),
+    )
+
+def rolling_average(daily: np.ndarray, window: int) -> np.ndarray:
+    """
+    Trailing moving average of daily totals. The first window - 1 days are
+    averaged over the days available so far.
+
+    Args:
+        daily (np.ndarray): Dense daily totals.
+        window (int): Window length in days.
+
+    Returns:
+        np.ndarray: Average for the window ending on each day.
+    """
+    cumulative = np.concatenate(([0.0], np.cumsum(daily)))
+    ends = np.arange(1, len(daily) + 1)
+    starts = np.maximum(ends - window, 0)
+    return (cumulative[ends] - cumulative[starts]) / (ends - starts)
+
+def streaks(daily: np.ndarray) -> tuple:
+    """
+    Finds the current and longest runs of consecutive active days. A streak
+    is still current if the last day has no activity yet but the day before
+    does.
+
+    Args:
+        daily (np.ndarray): Dense daily totals ending today.
+
+    Returns:
+        tuple: (current, longest) streak lengths in days.
+    """
+    active = np.concatenate(([0], (daily > 0).astype(np.int8), [0]))
+    edges = np.diff(active)
+    starts = np.flatnonzero(edges == 1)
+    ends = np.flatnonzero(edges == -1)
+    if len(starts) == 0:
+        return 0, 0
+    lengths = ends - starts
+    current = int(lengths[-1]) if ends[-1] >= len(daily) - 1 else 0
+    return current, int(lengths.max())
+
+def weekday_distribution(first_day: np.datetime64,
+        daily: np.ndarray) -> Dict[str, Dict[str, float]]:
+    """
+    Totals and per-day averages of the daily totals, grouped by weekday.
+    """
+    # 1970-01-01 was a Thursday, weekday index 3 with Monday as 0.
+    weekdays = (np.arange(len(daily)) + first_day.astype(np.int64) + 3) % 7
+    totals = np.bincount(weekdays, weights=daily, minlength=7)
+    counts = np.bincount(weekdays, minlength=7)
+    averages = np.divide(totals, counts, out=np.zeros(7), where=counts > 0)
+    return {name: {"total": float(totals[i]), "average": float(averages[i])}
+            for i, name in enumerate(WEEKDAYS)}
+
+def compute_stats(series: ActivitySeries, factor: float = 1.0,
+        today: Optional[date] = None) -> Dict[str, Any]:
+    """
+    Computes the activity statistics of a loaded history.
+
+    Args:
+        series (ActivitySeries): The history to analyze.
+        factor (float): Canonical units per display unit. Quantities are
+            divided by it.
+        today (Optional[date]): Day that current streaks and trailing
+            averages end on. Defaults to today.
+
+    Returns:
+        Dict[str, Any]: Rolling 7/30-day averages, current and longest
+            streaks, per-weekday distribution and session size percentiles.
+    """
+    if len(series.quantities) == 0:
+        return {"sessions": 0}
+    today = today or local_today()
+    first_day, daily = series.daily_totals(until=today)
+    daily = daily / factor
+    sessions = series.quantities / factor
+    # Logs after today (e.g. a later end bound) don't count towards "now".
+    daily_to_today = daily[:max(int((np.datetime64(today, "D") - first_day)
+                                    .astype(int)) + 1, 1)]
+    current, longest = streaks(daily_to_today)
+    return {
+        "sessions": int(len(sessions)),
+        "total": float(sessions.sum()),
+        "first_day": str(first_day),
+        "rolling_average_7": float(rolling_average(daily_to_today, 7)[-1]),
+        "rolling_average_30": float(rolling_average(daily_to_today, 30)[-1]),
+        "current_streak": current,
+        "longest_streak": longest,
+        "weekdays": weekday_distribution(first_day, daily),
+        "session_percentiles": {
+            str(p): float(v) for p, v in
+            zip(PERCENTILES, np.percentile(sessions, PERCENTILES))
+        },
+    }
+
+# EOF
@@ -0,0 +1,87 @@
+# -*- coding: utf-8 -*-
+"""
+app/budget.py
+
+Per-route query time budgets. A budgeted route checks a connection of its
+own out of the app's pool (app.db_pool) and queries it through request_db().
+Every statement it runs is limited to the route's budget with a transaction
+local statement_timeout, so one pathological query cannot hold a connection
+indefinitely and the limit never reaches other requests. A route exceeding
+its budget answers with its fallback, e.g. a truncated result with a notice,
+or with 503 if it has none.
+"""
+
+# built-in module imports
+import functools
+import os
+from typing import Any, Callable, Optional
+
+# 3rd party module imports
+from flask import current_app, g
+
+# local module imports
+from app.db.connection import QueryTimeout, statement_timeout
+
+TIMEOUT_MESSAGE = "The request took too long, try a narrower range"
+
+def default_budget() -> int:
+    """
+    Returns the default per-statement budget in milliseconds
+    (QUERY_TIME_BUDGET_MS).
+    """
+    return int(os.getenv("QUERY_TIME_BUDGET_MS", "2000"))
+
+def request_db() -> Any:
+    """
+    Returns the connection the current request queries: the one checked out
+    for its time budget, or the app's shared connection.
+    """
+    return g.get("db") or current_app.db
+
+def _run_budgeted(view: Callable[..., Any],
+        fallback: Optional[Callable[..., Any]], conn: Any, budget: int,
+        *args, **kwargs) -> Any:
+    try:
+        with statement_timeout(conn, budget):
+            return view(*args, **kwargs)
+    except QueryTimeout:
+        current_app.logger.warning("%s exceeded its %d ms budget",
+                                   view.__name__, budget)
+        if fallback is None:
+            return TIMEOUT_MESSAGE, 503
+    try:
+        with statement_timeout(conn, budget):
+            return fallback(*args, **kwargs)
+    except QueryTimeout:
+        return TIMEOUT_MESSAGE, 503
+
+def time_budget(milliseconds: Optional[int] = None,
+        fallback: Optional[Callable[..., Any]] = None) -> Callable:
+    """
+    Decorates a view so its queries run under a time budget.
+
+    Args:
+        milliseconds (Optional[int]): Time allowed per statement. Defaults to
+            default_budget().
+        fallback (Optional[Callable[..., Any]]): View called with the same
+            arguments when the budget is exceeded. It runs under the same
+            budget and should only issue cheap queries.
+
+    Returns:
+        Callable: The decorator.
+    """
+    def decorator(view: Callable[..., Any]) -> Callable[..., Any]:
+        @functools.wraps(view)
+        def wrapper(*args, **kwargs):
+            budget = milliseconds or default_budget()
+            with current_app.db_pool.connection() as conn:
+                g.db = conn
+                try:
+                    return _run_budgeted(view, fallback, conn, budget,
+                                         *args, **kwargs)
+                finally:
+                    g.pop("db", None)
+        return wrapper
+    return decorator
+
+# EOF
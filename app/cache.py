@@ -0,0 +1,298 @@
+# -*- coding: utf-8 -*-
+"""
+app/cache.py
+
+In-process caches for rendered output and query results. The htmx partials
+that fill dropdowns are requested on every selection, but their inputs rarely
+change, so the rendered HTML is cached and keyed on the template, the request
+arguments and the data version of the tables the partial is built from.
+
+Dashboard aggregations are cached the same way by ResultCache, keyed on the
+function and its arguments. A log write only invalidates the results of the
+activity types and users it touched.
+"""
+
+# Built-in module imports
+import dataclasses
+import inspect
+import os
+import sys
+import tempfile
+import threading
+from collections import OrderedDict, defaultdict
+from typing import Any, Callable, Dict, Hashable, Iterable, List, Optional
+
+# 3rd party module imports
+import numpy as np
+from flask import current_app, render_template
+from jinja2 import FileSystemBytecodeCache
+
+# local module imports
+from app.db.events import Change, data_version
+
+class LRUCache:
+    """
+    Thread safe least-recently-used cache bounded by the total size of its
+    values.
+
+    Args:
+        max_size (int): Upper bound for the summed size of cached values.
+        sizeof (Callable[[Any], int]): Measures a value. Defaults to counting
+            entries.
+    """
+
+    def __init__(self, max_size: int,
+            sizeof: Callable[[Any], int] = lambda value: 1):
+        self.max_size = max_size
+        self.sizeof = sizeof
+        self.size = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def get(self, key: Hashable) -> Optional[Any]:
+        """
+        Returns the cached value for key, or None on a miss.
+        """
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            self._entries.move_to_end(key)
+            return entry[0]
+
+    def put(self, key: Hashable, value: Any) -> None:
+        """
+        Stores a value, evicting the least recently used entries until the
+        cache fits in max_size again. Values larger than max_size are not
+        cached.
+        """
+        size = self.sizeof(value)
+        if size > self.max_size:
+            return
+        with self._lock:
+            old = self._entries.pop(key, None)
+            if old is not None:
+                self.size -= old[1]
+            self._entries[key] = (value, size)
+            self.size += size
+            while self.size > self.max_size:
+                _, (_, evicted_size) = self._entries.popitem(last=False)
+                self.size -= evicted_size
+
+    def pop(self, key: Hashable) -> None:
+        """
+        Removes the entry for key, if cached.
+        """
+        with self._lock:
+            entry = self._entries.pop(key, None)
+            if entry is not None:
+                self.size -= entry[1]
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+            self.size = 0
+
+class FragmentCache:
+    """
+    Cache of rendered template fragments.
+
+    Args:
+        max_bytes (int): Memory budget for rendered HTML.
+    """
+
+    def __init__(self, max_bytes: int):
+        self.entries = LRUCache(max_bytes, sizeof=len)
+
+    def render(self, template: str, tables: Iterable[str],
+            loader: Callable[[], Dict[str, Any]], **args: Any) -> str:
+        """
+        Renders template with args and the context produced by loader, or
+        returns the cached HTML of an identical earlier render. loader is
+        only called on a miss, so hits skip the database entirely.
+
+        Args:
+            template (str): Template name.
+            tables (Iterable[str]): Tables the loader reads from.
+            loader (Callable[[], Dict[str, Any]]): Fetches the data needed by
+                the template.
+            args: Request arguments passed to the template. They must fully
+                determine what loader returns.
+
+        Returns:
+            str: Rendered HTML.
+        """
+        tables = tuple(tables)
+        key = (template, tuple(sorted(args.items())), tables,
+               data_version(*tables))
+        html = self.entries.get(key)
+        if html is None:
+            html = render_template(template, **args, **loader())
+            self.entries.put(key, html)
+        return html
+
+def render_fragment(template: str, tables: Iterable[str],
+        loader: Callable[[], Dict[str, Any]], **args: Any) -> str:
+    """
+    Renders a fragment through the cache of the current app. See
+    FragmentCache.render.
+    """
+    return current_app.fragment_cache.render(template, tables, loader, **args)
+
+def estimate_size(value: Any) -> int:
+    """
+    Approximates the memory held by a query result in bytes: containers,
+    dataclasses and NumPy arrays are measured with their contents.
+    """
+    if isinstance(value, np.ndarray):
+        return sys.getsizeof(value) + (0 if value.base is None
+                                       else value.nbytes)
+    if dataclasses.is_dataclass(value):
+        return sys.getsizeof(value) + sum(
+            estimate_size(getattr(value, field.name))
+            for field in dataclasses.fields(value))
+    if isinstance(value, dict):
+        return sys.getsizeof(value) + sum(
+            estimate_size(k) + estimate_size(v) for k, v in value.items())
+    if isinstance(value, (list, tuple, set, frozenset)):
+        return sys.getsizeof(value) + sum(estimate_size(v) for v in value)
+    return sys.getsizeof(value)
+
+def _freeze(value: Any) -> Hashable:
+    if isinstance(value, (list, tuple)):
+        return tuple(_freeze(v) for v in value)
+    if isinstance(value, (set, frozenset)):
+        return frozenset(value)
+    return value
+
+class ResultCache:
+    """
+    Cache of query function results, bounded by their estimated size.
+
+    Entries are scoped to the activity type or, failing that, the user the
+    function was called for (its activity_type_id or user_id argument), or
+    else to all logs. A write reporting the changed logs (see
+    events.record_write) invalidates the scopes of those logs only; any
+    other write to one of TABLES invalidates everything.
+
+    Args:
+        max_bytes (int): Memory budget for cached results.
+
+    Attributes:
+        hits (int): Calls answered from the cache.
+        misses (int): Calls that ran the function.
+    """
+
+    # Tables the cached aggregations read from.
+    TABLES = ("activity_logs", "activity_types", "units", "unit_groups",
+              "users")
+
+    def __init__(self, max_bytes: int):
+        self.entries = LRUCache(max_bytes, sizeof=estimate_size)
+        self.hits = 0
+        self.misses = 0
+        # Bumping the generation of a scope makes its entries unreachable;
+        # they age out of the LRU.
+        self._generations: Dict[Hashable, int] = defaultdict(int)
+        self._lock = threading.Lock()
+
+    def call(self, func: Callable, conn: Any, *args: Any,
+            **kwargs: Any) -> Any:
+        """
+        Returns func(conn, *args, **kwargs), from the cache if it has been
+        computed since the last write affecting it. The result is shared
+        with other callers; do not modify it.
+
+        Args:
+            func (Callable): Function taking the connection first. Its other
+                arguments must be hashable, lists and sets are accepted.
+            conn (Any): Database connection passed through to func.
+        """
+        bound = inspect.signature(func).bind(conn, *args, **kwargs)
+        bound.apply_defaults()
+        params = dict(bound.arguments)
+        params.pop(next(iter(params)))
+        scope = self._scope(params)
+        with self._lock:
+            # Read before func runs: a write committing meanwhile bumps the
+            # generation afterwards, so the result is never reachable as
+            # newer than it is.
+            key = (func.__module__, func.__qualname__,
+                   tuple((name, _freeze(value))
+                         for name, value in params.items()),
+                   self._generations[scope], self._generations[None])
+        result = self.entries.get(key)
+        if result is not None:
+            with self._lock:
+                self.hits += 1
+            return result
+        with self._lock:
+            self.misses += 1
+        result = func(conn, *args, **kwargs)
+        self.entries.put(key, result)
+        return result
+
+    @staticmethod
+    def _scope(params: Dict[str, Any]) -> Hashable:
+        for name, scope in (("activity_type_id", "activity_type"),
+                            ("user_id", "user")):
+            try:
+                return (scope, int(params[name]))
+            except (KeyError, TypeError, ValueError):
+                continue
+        # Depends on every log.
+        return ("activity_logs",)
+
+    def apply(self, table: str, changes: Optional[List[Change]],
+            external: bool = False) -> None:
+        """
+        Write callback (see events.on_write): invalidates the results that
+        depend on the written rows, whichever process wrote them.
+        """
+        if table not in self.TABLES:
+            return
+        with self._lock:
+            if table != "activity_logs" or changes is None:
+                self._generations[None] += 1
+                return
+            self._generations[("activity_logs",)] += 1
+            for change in changes:
+                for log in change:
+                    if log is not None:
+                        self._generations[
+                            ("activity_type", log["activity_type_id"])] += 1
+                        self._generations[("user", log["user_id"])] += 1
+
+    def stats(self) -> Dict[str, int]:
+        """
+        Returns the hit and miss counters and the memory use, for sizing
+        RESULT_CACHE_BYTES.
+        """
+        with self._lock:
+            return {"hits": self.hits, "misses": self.misses,
+                    "entries": len(self.entries),
+                    "bytes": self.entries.size,
+                    "max_bytes": self.entries.max_size}
+
+def cached_result(func: Callable, conn: Any, *args: Any,
+        **kwargs: Any) -> Any:
+    """
+    Calls a query function through the result cache of the current app. See
+    ResultCache.call.
+    """
+    return current_app.result_cache.call(func, conn, *args, **kwargs)
+
+def template_bytecode_cache() -> FileSystemBytecodeCache:
+    """
+    Returns a bytecode cache under TEMPLATE_CACHE_DIR, so that freshly
+    started workers load compiled templates instead of compiling them again.
+    """
+    directory = os.getenv("TEMPLATE_CACHE_DIR") or os.path.join(
+        tempfile.gettempdir(), "resolution_tracker_templates")
+    os.makedirs(directory, exist_ok=True)
+    return FileSystemBytecodeCache(directory)
+
+# EOF
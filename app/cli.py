@@ -0,0 +1,102 @@
+# -*- coding: utf-8 -*-
+"""
+app/cli.py
+
+Command line tool for bulk data work, run next to the web service:
+
+    python -m app.cli import export.csv --config mapping.json [--user ID]
+    python -m app.cli dump snapshots/2026-10-19
+    python -m app.cli restore snapshots/2026-10-19
+    python -m app.cli export exports/2026-10-19 [--user ID]
+    python -m app.cli password [--user ID]
+
+See app/importer.py for the mapping config, app/db/snapshot.py for the
+snapshot format and app/export.py for the columnar export. The database is
+configured with the same environment variables as the web service.
+"""
+
+# built-in module imports
+import argparse
+import getpass
+import sys
+from typing import List, Optional
+
+# local module imports
+from app.db.connection import db_connect, db_close
+from app.db.schema import DEFAULT_USER_ID, initialize_schema
+from app.db.snapshot import dump_snapshot, restore_snapshot
+from app.db.user_queries import set_user_password
+from app.export import export_history
+from app.importer import import_csv, load_config
+
+def build_parser() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(prog="python -m app.cli")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    importer = commands.add_parser(
+            "import", help="Import activity logs from a CSV file.")
+    importer.add_argument("csv_path")
+    importer.add_argument("--config", required=True,
+                          help="JSON column mapping config.")
+    importer.add_argument("--user", type=int, default=DEFAULT_USER_ID,
+                          help="ID of the user the logs belong to.")
+
+    dump = commands.add_parser(
+            "dump", help="Write a snapshot of all tables to a directory.")
+    dump.add_argument("directory")
+
+    restore = commands.add_parser(
+            "restore", help="Replace all data with a snapshot.")
+    restore.add_argument("directory")
+
+    export = commands.add_parser(
+            "export", help="Write the activity history as .npy columns.")
+    export.add_argument("directory")
+    export.add_argument("--user", type=int, default=DEFAULT_USER_ID,
+                        help="ID of the user whose history is exported.")
+
+    password = commands.add_parser(
+            "password", help="Set the password required to select a user.")
+    password.add_argument("--user", type=int, default=DEFAULT_USER_ID,
+                          help="ID of the user.")
+    return parser
+
+def main(argv: Optional[List[str]] = None) -> int:
+    args = build_parser().parse_args(argv)
+    conn = db_connect()
+    try:
+        initialize_schema(conn)
+        match args.command:
+            case "import":
+                count = import_csv(conn, args.user, args.csv_path,
+                                   load_config(args.config))
+                print(f"Imported {count} activity logs.")
+            case "dump":
+                for path in dump_snapshot(conn, args.directory):
+                    print(f"Wrote {path}")
+            case "restore":
+                restore_snapshot(conn, args.directory)
+                print(f"Restored snapshot from {args.directory}.")
+            case "export":
+                for entry in export_history(conn, args.user, args.directory):
+                    print(f"Exported {entry['rows']} logs of "
+                          f"{entry['name']}.")
+            case "password":
+                new_password = getpass.getpass("New password: ")
+                if not new_password \
+                        or new_password != getpass.getpass("Repeat: "):
+                    raise ValueError("Passwords are empty or differ.")
+                if not set_user_password(conn, args.user, new_password):
+                    raise ValueError(f"Unknown user {args.user}.")
+                print(f"Password of user {args.user} set.")
+    except ValueError as e:
+        print(f"Error: {e}", file=sys.stderr)
+        return 1
+    finally:
+        db_close(conn)
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
+
+# EOF
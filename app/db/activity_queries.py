@@ -6,11 +6,28 @@ All the psql queries for database transactions related to activities.
 """
 
 # Built-in module imports
-from typing import Any, Dict, List, Optional
+import uuid
+from datetime import date, datetime
+from heapq import merge
+from itertools import chain
+from collections import defaultdict
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Tuple
 
 # 3rd party module imports
 from psycopg2.extensions import connection
 
+# local module imports
+from app.db.connection import read_only
+from app.db.archive import get_archived_daily_totals, get_archived_logs, \
+        iter_archived_logs, reaches_archive
+from app.db.events import record_write, write_in_progress
+from app.db.schema import DEFAULT_USER_ID
+from app.db.sqlite_backend import is_sqlite
+from app.db.timezone import to_local
+
+# Rows fetched per round trip when streaming query results.
+STREAM_BATCH_SIZE = 500
+
 # Parametrized Query Strings
 
 ## Queries for activity_types
@@ -23,15 +40,22 @@ SELECT
     type.goal_quantity
 FROM activity_types type
 JOIN unit_groups ug ON type.unit_group_id = ug.id
-WHERE type.id = %s;
+WHERE type.user_id = %s AND type.id = %s;
 """
 GET_ALL_ACTIVITY_TYPES = """
 SELECT id, name, unit_group_id, goal_quantity
-FROM activity_types;
+FROM activity_types
+WHERE user_id = %s;
+"""
+GET_ACTIVITY_TYPES_BY_IDS = """
+SELECT id, name, unit_group_id, goal_quantity
+FROM activity_types
+WHERE user_id = %s AND id = ANY(%s)
+ORDER BY id;
 """
 INSERT_ACTIVITY_TYPE = """
-INSERT INTO activity_types (name, unit_group_id, goal_quantity)
-VALUES (%s, %s, %s) RETURNING id;
+INSERT INTO activity_types (user_id, name, unit_group_id, goal_quantity)
+VALUES (%s, %s, %s, %s) RETURNING id;
 """
 UPDATE_ACTIVITY_TYPE = """
 UPDATE activity_types
@@ -39,10 +63,10 @@ SET
     name = %s,
     unit_group_id = %s,
     goal_quantity = %s
-WHERE id = %s;
+WHERE user_id = %s AND id = %s;
 """
 DELETE_ACTIVITY_TYPE = """
-DELETE FROM activity_types WHERE id = %s;
+DELETE FROM activity_types WHERE user_id = %s AND id = %s;
 """
 
 ## Queries for activity_log
@@ -52,34 +76,66 @@ SELECT
     act.activity_type_id,
     act.canonical_quantity,
     act.timestamp,
+    act.notes,
+    act.tags,
     disp.id AS display_unit_group_id,
     disp.name AS display_unit_name,
     act.canonical_quantity / disp.factor AS display_quantity
 FROM activity_logs act
 JOIN activity_types type ON act.activity_type_id = type.id
 JOIN units disp ON disp.id = %s
-WHERE act.id = %s;
+WHERE act.user_id = %s AND act.id = %s;
+"""
+GET_ACTIVITY_LOGS_BY_IDS = """
+SELECT
+    act.id,
+    act.activity_type_id,
+    act.canonical_quantity,
+    act.timestamp,
+    act.notes,
+    act.tags
+FROM activity_logs act
+WHERE act.user_id = %s AND act.id = ANY(%s)
+ORDER BY act.id;
 """
+# The owner of a log is taken from its activity type, so a log can only be
+# filed under a type that belongs to the user.
 INSERT_ACTIVITY_LOG = """
-INSERT INTO activity_logs (activity_type_id, canonical_quantity)
+INSERT INTO activity_logs
+    (user_id, activity_type_id, canonical_quantity, notes, tags)
 SELECT
-    %s AS activity_type_id,
-    %s * unit.factor AS canonical_quantity
-FROM units unit
-WHERE unit.id = %s
-RETURNING id;
+    type.user_id,
+    type.id AS activity_type_id,
+    %s * unit.factor AS canonical_quantity,
+    %s,
+    %s::text[]
+FROM activity_types type
+JOIN units unit ON unit.id = %s
+WHERE type.user_id = %s AND type.id = %s
+RETURNING id, user_id, activity_type_id, canonical_quantity, timestamp;
+"""
+# Locks a log and reads the fields that aggregates over it depend on.
+LOCK_ACTIVITY_LOG = """
+SELECT user_id, activity_type_id, canonical_quantity, timestamp
+FROM activity_logs
+WHERE user_id = %s AND id = %s
+FOR UPDATE;
 """
 UPDATE_ACTIVITY_LOG = """
 UPDATE activity_logs as act
 SET
-    activity_type_id = %s,
-    canonical_quantity = %s * unit.factor
-FROM units unit
+    activity_type_id = type.id,
+    canonical_quantity = %s * unit.factor,
+    notes = COALESCE(%s, act.notes),
+    tags = COALESCE(%s::text[], act.tags)
+FROM units unit, activity_types type
 WHERE unit.id = %s
-AND act.id = %s;
+AND type.user_id = %s AND type.id = %s
+AND act.user_id = type.user_id AND act.id = %s;
 """
 DELETE_ACTIVITY_LOG = """
-DELETE FROM activity_logs WHERE id = %s;
+DELETE FROM activity_logs WHERE user_id = %s AND id = %s
+RETURNING user_id, activity_type_id, canonical_quantity, timestamp;
 """
 GET_ACTIVITY_LOGS_FOR_TYPE = """
 SELECT
@@ -87,25 +143,169 @@ SELECT
     act.activity_type_id,
     act.canonical_quantity,
     act.timestamp,
+    act.notes,
+    act.tags,
     disp.id AS display_unit_group_id,
     disp.name AS display_unit_name,
     act.canonical_quantity / disp.factor AS display_quantity
 FROM activity_logs act
 JOIN activity_types type ON act.activity_type_id = type.id
 JOIN units disp ON disp.id = %s
-WHERE act.activity_type_id = %s;
+WHERE act.user_id = %s
+    AND act.activity_type_id = %s
+    AND (%s IS NULL OR act.timestamp >= %s)
+    AND (%s IS NULL OR act.timestamp < %s)
+    AND (%s::text[] IS NULL OR act.tags @> %s::text[])
+ORDER BY act.timestamp;
+"""
+GET_RECENT_ACTIVITY_LOGS_FOR_TYPE = """
+SELECT
+    act.id,
+    act.activity_type_id,
+    act.canonical_quantity,
+    act.timestamp,
+    act.notes,
+    act.tags,
+    disp.id AS display_unit_group_id,
+    disp.name AS display_unit_name,
+    act.canonical_quantity / disp.factor AS display_quantity
+FROM activity_logs act
+JOIN units disp ON disp.id = %s
+WHERE act.user_id = %s
+    AND act.activity_type_id = %s
+    AND (%s IS NULL OR act.timestamp >= %s)
+    AND (%s IS NULL OR act.timestamp < %s)
+    AND (%s::text[] IS NULL OR act.tags @> %s::text[])
+ORDER BY act.timestamp DESC
+LIMIT %s;
+"""
+# Days are taken in APP_TIMEZONE by local_day() (see schema.py), which backs
+# the activity_logs_user_type_local_day index. The local_day bounds follow
+# from the timestamp bounds; they are spelled out so the index scan is
+# bounded as well.
+GET_DAILY_TOTALS = """
+SELECT
+    local_day(act.timestamp) AS day,
+    sum(act.canonical_quantity) AS total
+FROM activity_logs act
+WHERE act.user_id = %s
+    AND act.activity_type_id = %s
+    AND (%s IS NULL OR act.timestamp >= %s)
+    AND (%s IS NULL OR act.timestamp < %s)
+    AND (%s IS NULL OR local_day(act.timestamp) >= local_day(%s::timestamptz))
+    AND (%s IS NULL OR local_day(act.timestamp) <= local_day(%s::timestamptz))
+    AND (%s::text[] IS NULL OR act.tags @> %s::text[])
+GROUP BY local_day(act.timestamp)
+ORDER BY local_day(act.timestamp);
+"""
+GET_DAILY_TOTALS_BY_TYPE = """
+SELECT
+    act.activity_type_id,
+    local_day(act.timestamp) AS day,
+    sum(act.canonical_quantity) AS total
+FROM activity_logs act
+WHERE act.user_id = %s
+    AND (%s IS NULL OR act.timestamp >= %s)
+    AND (%s IS NULL OR act.timestamp < %s)
+    AND (%s IS NULL OR local_day(act.timestamp) >= local_day(%s::timestamptz))
+    AND (%s IS NULL OR local_day(act.timestamp) <= local_day(%s::timestamptz))
+    AND (%s::text[] IS NULL OR act.tags @> %s::text[])
+GROUP BY act.activity_type_id, local_day(act.timestamp);
+"""
+GET_ACTIVITY_SERIES = """
+SELECT act.timestamp, act.canonical_quantity
+FROM activity_logs act
+WHERE act.user_id = %s
+    AND act.activity_type_id = %s
+    AND (%s IS NULL OR act.timestamp >= %s)
+    AND (%s IS NULL OR act.timestamp < %s)
+    AND (%s::text[] IS NULL OR act.tags @> %s::text[])
+ORDER BY act.timestamp;
+"""
+# Whole history of a type for columnar export. The window count is taken in
+# the same snapshot as the rows, so the exporter can size its files before
+# the first batch arrives.
+GET_ACTIVITY_HISTORY = """
+SELECT
+    act.timestamp,
+    act.canonical_quantity,
+    count(*) OVER () AS total
+FROM activity_logs act
+WHERE act.user_id = %s
+    AND act.activity_type_id = %s
+ORDER BY act.timestamp;
+"""
+GET_DISPLAY_UNIT = """
+SELECT id, name, factor FROM units WHERE id = %s;
 """
 
+## Bulk operations on activity_logs matching a filter. Rows are processed
+## in chunks of ascending id: every chunk is one statement in its own
+## transaction, and the next chunk starts after the largest id returned.
+LOG_FILTER = """
+    act.user_id = %s
+    AND (%s IS NULL OR act.activity_type_id = %s)
+    AND (%s IS NULL OR act.timestamp >= %s)
+    AND (%s IS NULL OR act.timestamp < %s)
+    AND (%s IS NULL OR act.id = ANY(%s))
+"""
+# Logs can only move between activity types measured in the same unit group,
+# otherwise their canonical quantities would change meaning.
+SAME_UNIT_GROUP = """
+    AND act.activity_type_id IN (
+        SELECT id FROM activity_types WHERE unit_group_id = %s
+    )
+"""
+COUNT_MATCHING_LOGS = """
+SELECT count(*) AS count
+FROM activity_logs act
+WHERE {filter};
+""".format(filter=LOG_FILTER)
+COUNT_REASSIGNABLE_LOGS = """
+SELECT count(*) AS count
+FROM activity_logs act
+WHERE {filter};
+""".format(filter=LOG_FILTER + SAME_UNIT_GROUP)
+BULK_DELETE_ACTIVITY_LOGS = """
+DELETE FROM activity_logs
+WHERE id IN (
+    SELECT act.id
+    FROM activity_logs act
+    WHERE {filter}
+        AND act.id > %s
+    ORDER BY act.id
+    LIMIT %s
+)
+RETURNING id;
+""".format(filter=LOG_FILTER)
+BULK_REASSIGN_ACTIVITY_LOGS = """
+UPDATE activity_logs
+SET activity_type_id = %s
+WHERE id IN (
+    SELECT act.id
+    FROM activity_logs act
+    WHERE {filter}
+        AND act.id > %s
+    ORDER BY act.id
+    LIMIT %s
+)
+RETURNING id;
+""".format(filter=LOG_FILTER + SAME_UNIT_GROUP)
+
+BULK_CHUNK_SIZE = 5000
+
 # Python function wrappers to sql strings
 
 ## activity_types
-def get_activity_type(conn: connection, activity_type_id: int) \
+@read_only
+def get_activity_type(conn: connection, user_id: int, activity_type_id: int) \
         -> Optional[Dict[str, Any]]:
     """
     Fetches an activity type record from the database by activity_type_id.
 
     Args:
         conn (connection): Handle for psql database connection.
+        user_id (int): ID of the user owning the activity type.
         activity_type_id (int): Unique identifier for activity_type of
             interest.
 
@@ -114,17 +314,38 @@ def get_activity_type(conn: connection, activity_type_id: int) \
             tuple if exists. Otherwise None.
     """
     with conn.cursor() as cur:
-        cur.execute(GET_ACTIVITY_TYPE, (activity_type_id,))
+        cur.execute(GET_ACTIVITY_TYPE, (user_id, activity_type_id,))
         row = cur.fetchone()
         return row
 
-def insert_activity_type(conn: connection, unit_group_id: int, name: str,
-        goal_quantity: float=None) -> None:
+@read_only
+def get_activity_types_by_ids(conn: connection, user_id: int,
+        activity_type_ids: List[int]) -> List[Dict[str, Any]]:
+    """
+    Fetches several activity types of a user in one query.
+
+    Args:
+        conn (connection): Handle for psql database connection.
+        user_id (int): ID of the user owning the activity types.
+        activity_type_ids (List[int]): IDs of the activity types to fetch.
+
+    Returns:
+        List[Dict[str, Any]]: The matching activity types ordered by id.
+            Unknown ids and other users' types are skipped.
+    """
+    with conn.cursor() as cur:
+        cur.execute(GET_ACTIVITY_TYPES_BY_IDS,
+                    (user_id, list(activity_type_ids),))
+        return cur.fetchall()
+
+def insert_activity_type(conn: connection, user_id: int, unit_group_id: int,
+        name: str, goal_quantity: float=None) -> None:
     """
     Insert a new activity type record to the database.
 
     Args:
         conn (connection): Handle for psql database connection.
+        user_id (int): ID of the user the activity type belongs to.
         name (str): Name of the new activity type.
         unit_group_id (int): The unit group of measure for the activity.
         goal_quantity (int): The goal for activity. Value is optional, if None
@@ -134,19 +355,22 @@ def insert_activity_type(conn: connection, unit_group_id: int, name: str,
     with conn.cursor() as cur:
         cur.execute(
             INSERT_ACTIVITY_TYPE,
-            (name, unit_group_id, goal_quantity,)
+            (user_id, name, unit_group_id, goal_quantity,)
         )
         activity_type_id = cur.fetchone()["id"]
     conn.commit()
+    record_write("activity_types")
     return activity_type_id
 
-def update_activity_type(conn: connection, activity_type_id: int, name: str,
-        unit_group_id: int, goal_quantity:float = None) -> None:
+def update_activity_type(conn: connection, user_id: int,
+        activity_type_id: int, name: str, unit_group_id: int,
+        goal_quantity:float = None) -> None:
     """
     Updates an existing activity_type record with new attribute values.
 
     Args:
         conn (connection): Handle for psql database connection.
+        user_id (int): ID of the user owning the activity type.
         activity_type_id (int): The id of the activity_type record that needs
             to be updated.
         name (str): New name given to the activity type.
@@ -157,31 +381,37 @@ def update_activity_type(conn: connection, activity_type_id: int, name: str,
     with conn.cursor() as cur:
         cur.execute(
             UPDATE_ACTIVITY_TYPE,
-            (name, unit_group_id, goal_quantity, activity_type_id,)
+            (name, unit_group_id, goal_quantity, user_id, activity_type_id,)
         )
     conn.commit()
+    record_write("activity_types")
 
-def delete_activity_type(conn: connection, activity_type_id: int) -> None:
+def delete_activity_type(conn: connection, user_id: int,
+        activity_type_id: int) -> None:
     """
     Deletes an existing activity_type record.
 
     Args:
         conn (connection): Handle for psql database connection.
+        user_id (int): ID of the user owning the activity type.
         activity_type_id (int): The id of the activity_type record to delete.
     """
     
     with conn.cursor() as cur:
-        cur.execute(DELETE_ACTIVITY_TYPE, (activity_type_id,))
+        cur.execute(DELETE_ACTIVITY_TYPE, (user_id, activity_type_id,))
     conn.commit()
+    record_write("activity_types")
 
 ## activity logs
-def get_activity_log(conn: connection, display_unit_id: int, log_id: str) \
-        -> Optional[Dict[str, Any]]:
+@read_only
+def get_activity_log(conn: connection, user_id: int, display_unit_id: int,
+        log_id: str) -> Optional[Dict[str, Any]]:
     """
     Fetches an activity log record from the database by log_id.
 
     Args:
         conn (connection): Handle for psql database connection.
+        user_id (int): ID of the user owning the log.
         display_unit_id (int): ID corresponding to the user specified display
             quantity for the record being requested.
         log_id (int): Unique identifier for a record of interest in
@@ -192,74 +422,135 @@ def get_activity_log(conn: connection, display_unit_id: int, log_id: str) \
             tuple if exists. Otherwise None.
     """
     with conn.cursor() as cur:
-        cur.execute(GET_ACTIVITY_LOG, (display_unit_id, log_id,))
+        cur.execute(GET_ACTIVITY_LOG, (display_unit_id, user_id, log_id,))
         row = cur.fetchone()
         return row
 
-def insert_activity_log(conn: connection, activity_type_id: int,
-        quantity: float, unit_id: int) -> int:
+@read_only
+def get_activity_logs_by_ids(conn: connection, user_id: int,
+        log_ids: List[int]) -> List[Dict[str, Any]]:
+    """
+    Fetches several activity logs of a user in one query, in canonical
+    units. Archived logs are not included.
+
+    Args:
+        conn (connection): Handle for psql database connection.
+        user_id (int): ID of the user owning the logs.
+        log_ids (List[int]): IDs of the logs to fetch.
+
+    Returns:
+        List[Dict[str, Any]]: The matching logs ordered by id. Unknown ids
+            and other users' logs are skipped.
+    """
+    with conn.cursor() as cur:
+        cur.execute(GET_ACTIVITY_LOGS_BY_IDS, (user_id, list(log_ids),))
+        return cur.fetchall()
+
+def _change_row(row: Dict[str, Any]) -> Dict[str, Any]:
+    # The fields of a changed log that aggregates depend on, see
+    # events.record_write.
+    return {key: row[key] for key in ("user_id", "activity_type_id",
+                                      "canonical_quantity", "timestamp")}
+
+def insert_activity_log(conn: connection, user_id: int, activity_type_id: int,
+        quantity: float, unit_id: int, notes: Optional[str] = None,
+        tags: Optional[Iterable[str]] = None) -> Optional[int]:
     """
     Insert a new activity type record to the database.
 
     Args:
         conn (connection): Handle for psql database connection.
+        user_id (int): ID of the user logging the activity.
         activity_type_id (int): The id of the activity being logged.
         quantity (int): The amount of activity performed, measured in user
                 specified unit.
         unit_id (int): The id of the unit for the quantity entered.
+        notes (Optional[str]): Free-text notes on the session.
+        tags (Optional[Iterable[str]]): Tags of the session, see
+            normalize_tags.
 
     Returns:
-        int: ID of the newly created record.
+        Optional[int]: ID of the newly created record. None if the activity
+            type does not belong to the user.
     """
 
-    with conn.cursor() as cur:
-        cur.execute(
-            INSERT_ACTIVITY_LOG,
-            (activity_type_id, quantity, unit_id)
-        )
-        log_id = cur.fetchone()["id"]
-    conn.commit()
-    return log_id
-
-def update_activity_log(conn: connection, log_id: int, activity_type_id: int,
-        quantity: float, unit_id: int) -> None:
+    with write_in_progress("activity_logs"):
+        with conn.cursor() as cur:
+            cur.execute(
+                INSERT_ACTIVITY_LOG,
+                (quantity, notes, normalize_tags(tags) or [], unit_id,
+                 user_id, activity_type_id,)
+            )
+            row = cur.fetchone()
+        conn.commit()
+        if row is None:
+            return None
+        record_write("activity_logs", [(None, _change_row(row))])
+    return row["id"]
+
+def update_activity_log(conn: connection, user_id: int, log_id: int,
+        activity_type_id: int, quantity: float, unit_id: int,
+        notes: Optional[str] = None,
+        tags: Optional[Iterable[str]] = None) -> None:
     """
     Updates an existing activity_log record with new attribute values.
 
     Args:
         conn (connection): Handle for psql database connection.
+        user_id (int): ID of the user owning the log.
         log_id (int): The id of the activity_log that needs to be updated.
         activity_type_id (int): The id of the activity_type for the activity
             being logged.
         quantity (int): The new quantity of activity being logged.
         unit_id (int): The id of the unit for the quantity entered.
+        notes (Optional[str]): New notes. None keeps the current ones.
+        tags (Optional[Iterable[str]]): New tags. None keeps the current
+            ones.
     """
-    with conn.cursor() as cur:
-        cur.execute(
-            UPDATE_ACTIVITY_LOG,
-            (activity_type_id, quantity, unit_id, log_id,)
-        )
-    conn.commit()
-
-def delete_activity_log(conn: connection, log_id: int) -> None:
+    with write_in_progress("activity_logs"):
+        with conn.cursor() as cur:
+            cur.execute(LOCK_ACTIVITY_LOG, (user_id, log_id,))
+            old = cur.fetchone()
+            cur.execute(
+                UPDATE_ACTIVITY_LOG,
+                (quantity, notes, normalize_tags(tags), unit_id, user_id,
+                 activity_type_id, log_id,)
+            )
+            updated = cur.rowcount
+            cur.execute(LOCK_ACTIVITY_LOG, (user_id, log_id,))
+            new = cur.fetchone()
+        conn.commit()
+        record_write("activity_logs",
+                     [(_change_row(old), _change_row(new))] if updated
+                     else [])
+
+def delete_activity_log(conn: connection, user_id: int, log_id: int) -> None:
     """
     Deletes an existing activity_log record.
 
     Args:
         conn (connection): Handle for psql database connection.
+        user_id (int): ID of the user owning the log.
         log_id (int): The id of the activity_log record to delete.
     """
     
-    with conn.cursor() as cur:
-        cur.execute(DELETE_ACTIVITY_LOG, (log_id,))
-    conn.commit()
-
-def get_all_activity_types(conn: connection) -> List[Dict[str, Any]]:
+    with write_in_progress("activity_logs"):
+        with conn.cursor() as cur:
+            cur.execute(DELETE_ACTIVITY_LOG, (user_id, log_id,))
+            old = cur.fetchone()
+        conn.commit()
+        record_write("activity_logs",
+                     [(_change_row(old), None)] if old else [])
+
+@read_only
+def get_all_activity_types(conn: connection, user_id: int) \
+        -> List[Dict[str, Any]]:
     """
-    Fetches all the activity types saved on activity_types table.
+    Fetches all the activity types of a user from activity_types table.
 
     Args:
         conn (connection): Handle for psql database connection.
+        user_id (int): ID of the user whose activity types are fetched.
 
     Returns:
         List[Dict[str, Any]]: List of RealDictCursor dict objects containing
@@ -267,27 +558,444 @@ def get_all_activity_types(conn: connection) -> List[Dict[str, Any]]:
     """
 
     with conn.cursor() as cur:
-        cur.execute(GET_ALL_ACTIVITY_TYPES)
+        cur.execute(GET_ALL_ACTIVITY_TYPES, (user_id,))
         return cur.fetchall()
 
-def get_activity_logs_for_type(conn: connection, display_unit_id: int,
-        activity_type_id: int) -> List[Dict[str, Any]]:
+def normalize_tags(tags: Optional[Iterable[str]]) -> Optional[List[str]]:
     """
-    Fetches all the activity log records matching the specified
-    activity_type_id.
+    Brings tags into their stored form: trimmed, lower case, without
+    duplicates or empty tags, sorted.
+
+    Args:
+        tags (Optional[Iterable[str]]): Tags as entered.
+
+    Returns:
+        Optional[List[str]]: The normalized tags, None if tags is None.
+    """
+    if tags is None:
+        return None
+    return sorted({tag.strip().lower() for tag in tags if tag.strip()})
+
+def _owned_archived_rows(rows: Iterable[Dict[str, Any]], user_id: int,
+        tags: Optional[List[str]] = None) -> Iterator[Dict[str, Any]]:
+    # Rows archived before multi-user support carry no user_id; they belong
+    # to the default user like the rest of the pre-existing data. Likewise
+    # rows archived before annotations existed have no notes or tags.
+    for row in rows:
+        row.setdefault("notes", None)
+        row.setdefault("tags", [])
+        if row.get("user_id", DEFAULT_USER_ID) == user_id \
+                and (tags is None or set(tags) <= set(row["tags"])):
+            yield row
+
+def _owned_archived_logs(user_id: int, activity_type_id: int,
+        start: Optional[datetime], end: Optional[datetime],
+        tags: Optional[List[str]] = None) -> List[Dict[str, Any]]:
+    return list(_owned_archived_rows(
+        get_archived_logs(activity_type_id, start, end), user_id, tags))
+
+def _archived_daily_totals(user_id: int, activity_type_id: int,
+        start: Optional[datetime], end: Optional[datetime],
+        tags: Optional[List[str]]) -> Dict[date, float]:
+    # The precomputed totals cover every archived log of a type. A tag
+    # filter needs the archived rows themselves.
+    if tags is None:
+        return get_archived_daily_totals(activity_type_id, start, end)
+    totals = defaultdict(float)
+    for row in _owned_archived_logs(user_id, activity_type_id, start, end,
+                                    tags):
+        totals[to_local(row["timestamp"]).date()] += \
+                row["canonical_quantity"]
+    return dict(totals)
+
+def _archived_logs_in_unit(conn: connection, user_id: int,
+        display_unit_id: int, activity_type_id: int,
+        start: Optional[datetime], end: Optional[datetime],
+        tags: Optional[List[str]]) -> List[Dict[str, Any]]:
+    with conn.cursor() as cur:
+        cur.execute(GET_DISPLAY_UNIT, (display_unit_id,))
+        unit = cur.fetchone()
+    archived = _owned_archived_logs(user_id, activity_type_id, start, end,
+                                    tags)
+    for log in archived:
+        log["display_unit_group_id"] = unit["id"]
+        log["display_unit_name"] = unit["name"]
+        log["display_quantity"] = log["canonical_quantity"] / unit["factor"]
+    return archived
+
+def _stream_rows(conn: connection, sql: str, params: tuple) \
+        -> Iterator[Dict[str, Any]]:
+    # A named cursor is a server-side cursor: rows stay on the server until
+    # fetched. WITH HOLD keeps it valid when another request commits on the
+    # shared connection, and is required on autocommit (replica)
+    # connections. SQLite cursors already step through the result lazily.
+    if is_sqlite(conn):
+        cursor = conn.cursor()
+    else:
+        cursor = conn.cursor(name=f"stream_{uuid.uuid4().hex}",
+                             withhold=True)
+    with cursor as cur:
+        cur.execute(sql, params)
+        while rows := cur.fetchmany(STREAM_BATCH_SIZE):
+            yield from rows
+
+@read_only
+def get_activity_logs_for_type(conn: connection, user_id: int,
+        display_unit_id: int, activity_type_id: int,
+        start: Optional[datetime] = None, end: Optional[datetime] = None,
+        tags: Optional[Iterable[str]] = None) -> List[Dict[str, Any]]:
+    """
+    Fetches the activity log records matching the specified activity_type_id,
+    ordered by timestamp. The records can optionally be restricted to the
+    half-open time range [start, end).
 
     Args:
         conn (connection): Handle for psql database connection.
+        user_id (int): ID of the user owning the logs.
         display_unit_id (int): unit_id value of the user's specified unit for
             presenting the values.
         activity_type_id (int): ID value for the activity of interest.
+        start (Optional[datetime]): Earliest timestamp to include. If None,
+            the range is unbounded from below.
+        end (Optional[datetime]): Timestamp to stop at (exclusive). If None,
+            the range is unbounded from above.
+        tags (Optional[Iterable[str]]): Only include logs carrying all of
+            these tags.
 
     Returns:
         List[Dict[str, Any]]: List object of dictionaries as formatted by
             RealDictCursor.
     """
+    tags = normalize_tags(tags)
     with conn.cursor() as cur:
         cur.execute(GET_ACTIVITY_LOGS_FOR_TYPE,
-                    (display_unit_id, activity_type_id,))
-        return cur.fetchall()
+                    (display_unit_id, user_id, activity_type_id, start, start,
+                     end, end, tags, tags,))
+        logs = cur.fetchall()
+        if not reaches_archive(start):
+            return logs
+    archived = _archived_logs_in_unit(conn, user_id, display_unit_id,
+                                      activity_type_id, start, end, tags)
+    return list(merge(archived, logs, key=lambda log: log["timestamp"]))
+
+@read_only
+def iter_activity_logs_for_type(conn: connection, user_id: int,
+        display_unit_id: int, activity_type_id: int,
+        start: Optional[datetime] = None, end: Optional[datetime] = None,
+        tags: Optional[Iterable[str]] = None) -> Iterator[Dict[str, Any]]:
+    """
+    Streaming variant of get_activity_logs_for_type. The rows are read
+    through a server-side cursor STREAM_BATCH_SIZE at a time while the
+    returned iterator is consumed, so memory use does not grow with the
+    history. The query only starts on the first next(); close the iterator
+    to release the cursor early.
+
+    Args:
+        conn (connection): Handle for psql database connection.
+        user_id (int): ID of the user owning the logs.
+        display_unit_id (int): unit_id value of the user's specified unit for
+            presenting the values.
+        activity_type_id (int): ID value for the activity of interest.
+        start (Optional[datetime]): Earliest timestamp to include.
+        end (Optional[datetime]): Timestamp to stop at (exclusive).
+        tags (Optional[Iterable[str]]): Only include logs carrying all of
+            these tags.
+
+    Returns:
+        Iterator[Dict[str, Any]]: The records, ordered by timestamp.
+    """
+    tags = normalize_tags(tags)
+    logs = _stream_rows(conn, GET_ACTIVITY_LOGS_FOR_TYPE,
+                        (display_unit_id, user_id, activity_type_id, start,
+                         start, end, end, tags, tags,))
+    if not reaches_archive(start):
+        return logs
+    archived = _archived_logs_in_unit(conn, user_id, display_unit_id,
+                                      activity_type_id, start, end, tags)
+    return merge(archived, logs, key=lambda log: log["timestamp"])
+
+@read_only
+def get_recent_activity_logs_for_type(conn: connection, user_id: int,
+        display_unit_id: int, activity_type_id: int, limit: int,
+        start: Optional[datetime] = None, end: Optional[datetime] = None,
+        tags: Optional[Iterable[str]] = None) -> List[Dict[str, Any]]:
+    """
+    Fetches at most limit of the latest activity log records of an activity
+    type within [start, end), ordered by timestamp. Archived logs are not
+    included. Walks the (user_id, activity_type_id, timestamp) index
+    backwards, so it stays cheap however long the history is.
+
+    Args:
+        conn (connection): Handle for psql database connection.
+        user_id (int): ID of the user owning the logs.
+        display_unit_id (int): unit_id value of the user's specified unit for
+            presenting the values.
+        activity_type_id (int): ID value for the activity of interest.
+        limit (int): Maximum number of records to return.
+        start (Optional[datetime]): Earliest timestamp to include.
+        end (Optional[datetime]): Timestamp to stop at (exclusive).
+        tags (Optional[Iterable[str]]): Only include logs carrying all of
+            these tags.
+
+    Returns:
+        List[Dict[str, Any]]: List object of dictionaries as formatted by
+            RealDictCursor.
+    """
+    tags = normalize_tags(tags)
+    with conn.cursor() as cur:
+        cur.execute(GET_RECENT_ACTIVITY_LOGS_FOR_TYPE,
+                    (display_unit_id, user_id, activity_type_id, start, start,
+                     end, end, tags, tags, limit,))
+        logs = cur.fetchall()
+    logs.reverse()
+    return logs
+
+@read_only
+def get_activity_series(conn: connection, user_id: int,
+        activity_type_id: int, start: Optional[datetime] = None,
+        end: Optional[datetime] = None,
+        tags: Optional[Iterable[str]] = None) \
+        -> Tuple[List[datetime], List[float]]:
+    """
+    Fetches only the timestamps and canonical quantities of an activity
+    type's logs within [start, end), including archived logs when the range
+    reaches past the archive cutoff. Meant for bulk numeric processing.
+
+    Args:
+        conn (connection): Handle for psql database connection.
+        user_id (int): ID of the user owning the logs.
+        activity_type_id (int): ID value for the activity of interest.
+        start (Optional[datetime]): Earliest timestamp to include.
+        end (Optional[datetime]): Timestamp to stop at (exclusive).
+        tags (Optional[Iterable[str]]): Only include logs carrying all of
+            these tags.
+
+    Returns:
+        Tuple[List[datetime], List[float]]: Timestamps and quantities, in
+            timestamp order.
+    """
+    tags = normalize_tags(tags)
+    with conn.cursor() as cur:
+        cur.execute(GET_ACTIVITY_SERIES,
+                    (user_id, activity_type_id, start, start, end, end, tags,
+                     tags,))
+        rows = cur.fetchall()
+    if reaches_archive(start):
+        rows = list(merge(
+            _owned_archived_logs(user_id, activity_type_id, start, end, tags),
+            rows, key=lambda row: row["timestamp"]))
+    return ([row["timestamp"] for row in rows],
+            [row["canonical_quantity"] for row in rows])
+
+@read_only
+def iter_activity_series(conn: connection, user_id: int,
+        activity_type_id: int) -> Tuple[int, Iterator[Dict[str, Any]]]:
+    """
+    Streams the whole history of an activity type, archived logs included,
+    through a server-side cursor like iter_activity_logs_for_type. The query
+    runs right away, since the number of rows comes with the first batch.
+    Archived logs are streamed from their files, which are read twice: once
+    to count the rows.
+
+    Args:
+        conn (connection): Handle for psql database connection.
+        user_id (int): ID of the user owning the logs.
+        activity_type_id (int): ID value for the activity of interest.
+
+    Returns:
+        Tuple[int, Iterator[Dict[str, Any]]]: Number of rows, and the rows
+            with timestamp and canonical_quantity in timestamp order.
+    """
+    rows = _stream_rows(conn, GET_ACTIVITY_HISTORY,
+                        (user_id, activity_type_id))
+    first = next(rows, None)
+    count = 0 if first is None else first["total"]
+    if first is not None:
+        rows = chain([first], rows)
+    if reaches_archive(None):
+        def archived() -> Iterator[Dict[str, Any]]:
+            return _owned_archived_rows(
+                    iter_archived_logs(activity_type_id), user_id)
+        # Counted in a pass of its own, so that the archived rows are
+        # streamed rather than held in memory.
+        count += sum(1 for _ in archived())
+        rows = merge(archived(), rows, key=lambda row: row["timestamp"])
+    return count, rows
+
+@read_only
+def get_daily_totals(conn: connection, user_id: int, activity_type_id: int,
+        start: Optional[datetime] = None, end: Optional[datetime] = None,
+        tags: Optional[Iterable[str]] = None) -> Dict[date, float]:
+    """
+    Sums the canonical quantity logged per day for an activity type within
+    the half-open time range [start, end). Archived days are served from
+    their precomputed totals when the range reaches past the archive cutoff.
+
+    Args:
+        conn (connection): Handle for psql database connection.
+        user_id (int): ID of the user owning the logs.
+        activity_type_id (int): ID value for the activity of interest.
+        start (Optional[datetime]): Earliest timestamp to include.
+        end (Optional[datetime]): Timestamp to stop at (exclusive).
+        tags (Optional[Iterable[str]]): Only include logs carrying all of
+            these tags.
+
+    Returns:
+        Dict[date, float]: Total canonical quantity per day, in day order.
+    """
+    tags = normalize_tags(tags)
+    with conn.cursor() as cur:
+        cur.execute(GET_DAILY_TOTALS,
+                    (user_id, activity_type_id, start, start, end, end,
+                     start, start, end, end, tags, tags,))
+        rows = cur.fetchall()
+
+    totals = {}
+    # Archived totals are kept per activity type, and a type has one owner.
+    if reaches_archive(start) \
+            and get_activity_type(conn, user_id, activity_type_id):
+        totals = _archived_daily_totals(user_id, activity_type_id, start, end,
+                                        tags)
+    for row in rows:
+        totals[row["day"]] = totals.get(row["day"], 0) + row["total"]
+    return dict(sorted(totals.items()))
+
+@read_only
+def get_daily_totals_by_type(conn: connection, user_id: int,
+        start: Optional[datetime] = None, end: Optional[datetime] = None,
+        tags: Optional[Iterable[str]] = None) \
+        -> Dict[int, Dict[date, float]]:
+    """
+    Sums the canonical quantity logged per day for every activity type of a
+    user at once within [start, end), including archived days when the range
+    reaches past the archive cutoff.
+
+    Args:
+        conn (connection): Handle for psql database connection.
+        user_id (int): ID of the user owning the logs.
+        start (Optional[datetime]): Earliest timestamp to include.
+        end (Optional[datetime]): Timestamp to stop at (exclusive).
+        tags (Optional[Iterable[str]]): Only include logs carrying all of
+            these tags.
+
+    Returns:
+        Dict[int, Dict[date, float]]: Daily totals keyed by activity type id.
+    """
+    tags = normalize_tags(tags)
+    with conn.cursor() as cur:
+        cur.execute(GET_DAILY_TOTALS_BY_TYPE,
+                    (user_id, start, start, end, end, start, start, end,
+                     end, tags, tags,))
+        rows = cur.fetchall()
+
+    totals = {}
+    if reaches_archive(start):
+        for activity_type in get_all_activity_types(conn, user_id):
+            archived = _archived_daily_totals(user_id, activity_type["id"],
+                                              start, end, tags)
+            if archived:
+                totals[activity_type["id"]] = archived
+    for row in rows:
+        days = totals.setdefault(row["activity_type_id"], {})
+        days[row["day"]] = days.get(row["day"], 0) + row["total"]
+    return totals
+
+## bulk operations
+def _log_filter_params(user_id: int, activity_type_id: Optional[int],
+        start: Optional[datetime], end: Optional[datetime],
+        log_ids: Optional[List[int]]) -> tuple:
+    if activity_type_id is None and start is None and end is None \
+            and log_ids is None:
+        raise ValueError("Bulk operations need at least one filter.")
+    log_ids = None if log_ids is None else [int(i) for i in log_ids]
+    return (user_id, activity_type_id, activity_type_id, start, start, end,
+            end, log_ids, log_ids,)
+
+def _run_in_chunks(conn: connection, sql: str, params: tuple,
+        chunk_size: int) -> int:
+    processed = 0
+    last_id = 0
+    while True:
+        with conn.cursor() as cur:
+            cur.execute(sql, params + (last_id, chunk_size,))
+            ids = [row["id"] for row in cur.fetchall()]
+        conn.commit()
+        if not ids:
+            return processed
+        record_write("activity_logs")
+        processed += len(ids)
+        last_id = max(ids)
+
+def bulk_delete_activity_logs(conn: connection, user_id: int,
+        activity_type_id: Optional[int] = None,
+        start: Optional[datetime] = None, end: Optional[datetime] = None,
+        log_ids: Optional[List[int]] = None, dry_run: bool = False,
+        chunk_size: int = BULK_CHUNK_SIZE) -> int:
+    """
+    Deletes every log of a user that matches all of the given filters. The
+    rows are deleted in chunks of chunk_size, each committed on its own, so
+    no lock is held for long. Archived logs are not affected.
+
+    Args:
+        conn (connection): Handle for psql database connection.
+        user_id (int): ID of the user owning the logs.
+        activity_type_id (Optional[int]): Only logs of this activity type.
+        start (Optional[datetime]): Only logs at or after this time.
+        end (Optional[datetime]): Only logs before this time.
+        log_ids (Optional[List[int]]): Only logs with these ids.
+        dry_run (bool): Count the matching logs without deleting them.
+        chunk_size (int): Number of rows deleted per statement.
+
+    Returns:
+        int: Number of logs deleted, or that would be deleted on a dry run.
+    """
+    params = _log_filter_params(user_id, activity_type_id, start, end,
+                                log_ids)
+    if dry_run:
+        with conn.cursor() as cur:
+            cur.execute(COUNT_MATCHING_LOGS, params)
+            count = cur.fetchone()["count"]
+        conn.commit()
+        return count
+    return _run_in_chunks(conn, BULK_DELETE_ACTIVITY_LOGS, params,
+                          chunk_size)
+
+def bulk_reassign_activity_logs(conn: connection, user_id: int,
+        new_activity_type_id: int, activity_type_id: Optional[int] = None,
+        start: Optional[datetime] = None, end: Optional[datetime] = None,
+        log_ids: Optional[List[int]] = None, dry_run: bool = False,
+        chunk_size: int = BULK_CHUNK_SIZE) -> int:
+    """
+    Moves every log of a user that matches all of the given filters to
+    another activity type, in chunks like bulk_delete_activity_logs. Only
+    logs whose current activity type shares the unit group of the new one
+    are moved.
+
+    Args:
+        conn (connection): Handle for psql database connection.
+        user_id (int): ID of the user owning the logs.
+        new_activity_type_id (int): Activity type to move the logs to.
+        activity_type_id (Optional[int]): Only logs of this activity type.
+        start (Optional[datetime]): Only logs at or after this time.
+        end (Optional[datetime]): Only logs before this time.
+        log_ids (Optional[List[int]]): Only logs with these ids.
+        dry_run (bool): Count the matching logs without moving them.
+        chunk_size (int): Number of rows updated per statement.
+
+    Returns:
+        int: Number of logs moved, or that would be moved on a dry run.
+    """
+    new_type = get_activity_type(conn, user_id, new_activity_type_id)
+    if new_type is None:
+        raise ValueError(f"Unknown activity type {new_activity_type_id}.")
+    params = _log_filter_params(user_id, activity_type_id, start, end,
+                                log_ids) + (new_type["unit_group_id"],)
+    if dry_run:
+        with conn.cursor() as cur:
+            cur.execute(COUNT_REASSIGNABLE_LOGS, params)
+            count = cur.fetchone()["count"]
+        conn.commit()
+        return count
+    return _run_in_chunks(conn, BULK_REASSIGN_ACTIVITY_LOGS,
+                          (new_activity_type_id,) + params, chunk_size)
 # EOF
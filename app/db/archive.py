@@ -0,0 +1,428 @@
+# -*- coding: utf-8 -*-
+"""
+app/db/archive.py
+
+Moves old activity logs out of the activity_logs table into compressed local
+archive files, and reads them back when a query reaches past the archive
+cutoff.
+
+Logs are archived in batches of ARCHIVE_BATCH_SIZE rows in id order, each
+in a transaction of its own, so memory use and the number of locked rows stay
+bounded however large the backlog is. Every batch writes one run directory
+under the archive root containing, per activity type, the archived rows as
+gzipped JSON lines and their daily totals as a gzipped JSON object.
+manifest.json lists the completed runs and the current cutoff; a run
+directory that is missing from the manifest is left over from an interrupted
+run and is reconciled at the start of the next one.
+"""
+
+# Built-in module imports
+import copy
+import gzip
+import json
+import os
+import shutil
+from collections import defaultdict
+from datetime import date, datetime, timedelta, timezone
+from functools import lru_cache
+from heapq import merge
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+
+# 3rd party module imports
+from psycopg2.extensions import connection
+
+# local module imports
+from app.db.events import record_write
+from app.db.timezone import app_timezone, localize, to_local
+
+# Parametrized Query Strings
+
+# The rows of a batch are locked until the archive files are written and
+# the rows deleted, so nothing can change them in between.
+SELECT_LOGS_TO_ARCHIVE = """
+SELECT *
+FROM activity_logs
+WHERE timestamp < %s AND id > %s
+ORDER BY id
+LIMIT %s
+FOR UPDATE;
+"""
+DELETE_ARCHIVED_LOGS = """
+DELETE FROM activity_logs WHERE id = ANY(%s);
+"""
+# Turned on around DELETE_ARCHIVED_LOGS, so that the change_log triggers
+# record the rows as archived rather than deleted.
+SET_ARCHIVING = """
+SELECT set_config('app.archiving', %s, true);
+"""
+COUNT_EXISTING_LOGS = """
+SELECT count(*) AS count FROM activity_logs WHERE id = ANY(%s);
+"""
+
+MANIFEST = "manifest.json"
+RUN_FILE = "run.json"
+# Rows archived per transaction and run directory.
+ARCHIVE_BATCH_SIZE = 10000
+
+def archive_dir() -> Optional[str]:
+    """
+    Returns the configured archive root (ACTIVITY_LOGS_ARCHIVE_DIR), or None
+    if archival is disabled.
+    """
+    return os.getenv("ACTIVITY_LOGS_ARCHIVE_DIR") or None
+
+# Parsed manifest per path, with the (mtime, inode, size) it was read at.
+# The manifest is replaced rather than rewritten in place, so any update
+# changes the inode.
+_manifests: Dict[str, Tuple[Tuple[int, int, int], Dict[str, Any]]] = {}
+
+def _read_manifest(directory: str) -> Dict[str, Any]:
+    # Read on every query that may reach the archive, so it is only parsed
+    # again once the file changed. The result is shared and must not be
+    # modified.
+    path = os.path.join(directory, MANIFEST)
+    try:
+        stat = os.stat(path)
+    except FileNotFoundError:
+        return {"cutoff": None, "runs": []}
+    version = (stat.st_mtime_ns, stat.st_ino, stat.st_size)
+    cached = _manifests.get(path)
+    if cached is not None and cached[0] == version:
+        return cached[1]
+    with open(path) as f:
+        manifest = json.load(f)
+    _manifests[path] = (version, manifest)
+    return manifest
+
+def _write_json(path: str, payload: Dict[str, Any]) -> None:
+    # Written to a temporary file first, so the file is either complete or
+    # missing.
+    with open(path + ".tmp", "w") as f:
+        json.dump(payload, f)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(path + ".tmp", path)
+
+def _write_manifest(directory: str, manifest: Dict[str, Any]) -> None:
+    _write_json(os.path.join(directory, MANIFEST), manifest)
+
+def archive_cutoff(directory: Optional[str] = None) -> Optional[datetime]:
+    """
+    Returns the timestamp before which logs have been archived. Archives
+    written before timestamps were stored with their zone hold naive times,
+    which are taken to be in APP_TIMEZONE.
+
+    Args:
+        directory (Optional[str]): Archive root. Defaults to archive_dir().
+
+    Returns:
+        Optional[datetime]: The cutoff, or None if nothing is archived.
+    """
+    directory = directory or archive_dir()
+    if directory is None:
+        return None
+    cutoff = _read_manifest(directory)["cutoff"]
+    return localize(datetime.fromisoformat(cutoff)) if cutoff else None
+
+def _later_cutoff(cutoff: Optional[str], end: str) -> str:
+    # Compared as instants: the text of a naive cutoff from an older
+    # archive and of an aware one do not sort by time. The result is stored
+    # in UTC.
+    later = localize(datetime.fromisoformat(end))
+    if cutoff is not None:
+        later = max(later, localize(datetime.fromisoformat(cutoff)))
+    return later.astimezone(timezone.utc).isoformat()
+
+def _serialize(value: Any) -> Any:
+    if isinstance(value, (datetime, date)):
+        return value.isoformat()
+    return value
+
+def _write_gzip(path: str, payload: str) -> None:
+    with gzip.open(path, "wt") as f:
+        f.write(payload)
+        f.flush()
+        os.fsync(f.fileno())
+
+def _run_ids(run_dir: str) -> List[int]:
+    ids = []
+    for name in os.listdir(run_dir):
+        if name.startswith("logs_"):
+            with gzip.open(os.path.join(run_dir, name), "rt") as f:
+                ids.extend(json.loads(line)["id"] for line in f)
+    return ids
+
+def _recover_interrupted_runs(conn: connection, directory: str,
+        manifest: Dict[str, Any]) -> None:
+    """
+    Reconciles run directories that never made it into the manifest. If the
+    archived rows are gone from the database, the delete was committed and
+    the run is recorded. Otherwise the run is discarded. A run without
+    run.json was interrupted before its delete and is discarded as well.
+    """
+    completed = {run["name"] for run in manifest["runs"]}
+    for name in sorted(os.listdir(directory)):
+        run_dir = os.path.join(directory, name)
+        if name in completed or not os.path.isdir(run_dir):
+            continue
+        run_file = os.path.join(run_dir, RUN_FILE)
+        if not os.path.exists(run_file):
+            shutil.rmtree(run_dir)
+            print(f"Discarded interrupted archive run {name}.")
+            continue
+        with open(run_file) as f:
+            run = json.load(f)
+        with conn.cursor() as cur:
+            cur.execute(COUNT_EXISTING_LOGS, (_run_ids(run_dir),))
+            remaining = cur.fetchone()["count"]
+        conn.commit()
+        if remaining:
+            shutil.rmtree(run_dir)
+            print(f"Discarded interrupted archive run {name}.")
+        else:
+            manifest["runs"].append(run)
+            manifest["cutoff"] = _later_cutoff(manifest["cutoff"],
+                                               run["end"])
+            _write_manifest(directory, manifest)
+            print(f"Recovered interrupted archive run {name}.")
+
+def _archive_batch(conn: connection, cutoff: datetime, after_id: int,
+        directory: str, manifest: Dict[str, Any]) -> List[int]:
+    """
+    Archives up to ARCHIVE_BATCH_SIZE logs older than cutoff with an id
+    above after_id into a run of their own.
+
+    Returns:
+        List[int]: Ids of the archived rows, in ascending order.
+    """
+    with conn.cursor() as cur:
+        cur.execute(SELECT_LOGS_TO_ARCHIVE,
+                    (cutoff, after_id, ARCHIVE_BATCH_SIZE))
+        rows = cur.fetchall()
+    if not rows:
+        conn.rollback()
+        return []
+
+    logs = defaultdict(list)
+    totals = defaultdict(lambda: defaultdict(float))
+    for row in sorted(rows, key=lambda row: row["timestamp"]):
+        type_id = row["activity_type_id"]
+        logs[type_id].append(
+            json.dumps({k: _serialize(v) for k, v in row.items()}))
+        totals[type_id][to_local(row["timestamp"]).date().isoformat()] += \
+            row["canonical_quantity"]
+
+    ids = [row["id"] for row in rows]
+    name = cutoff.strftime("run_%Y%m%dT%H%M%S") + f"_{ids[0]}"
+    run_dir = os.path.join(directory, name)
+    os.makedirs(run_dir)
+    for type_id, lines in logs.items():
+        _write_gzip(os.path.join(run_dir, f"logs_{type_id}.jsonl.gz"),
+                    "\n".join(lines) + "\n")
+        _write_gzip(os.path.join(run_dir, f"daily_{type_id}.json.gz"),
+                    json.dumps(totals[type_id]))
+    run = {
+        "name": name,
+        "start": min(row["timestamp"] for row in rows).isoformat(),
+        "end": cutoff.isoformat(),
+    }
+    _write_json(os.path.join(run_dir, RUN_FILE), run)
+
+    with conn.cursor() as cur:
+        cur.execute(SET_ARCHIVING, ("on",))
+        cur.execute(DELETE_ARCHIVED_LOGS, (ids,))
+        cur.execute(SET_ARCHIVING, ("",))
+    conn.commit()
+    record_write("activity_logs")
+
+    manifest["runs"].append(run)
+    manifest["cutoff"] = _later_cutoff(manifest["cutoff"], run["end"])
+    _write_manifest(directory, manifest)
+    return ids
+
+def archive_activity_logs(conn: connection, cutoff: datetime,
+        directory: Optional[str] = None) -> int:
+    """
+    Moves every activity log older than cutoff into archive runs of at most
+    ARCHIVE_BATCH_SIZE rows, together with the per-day totals of the
+    archived rows.
+
+    Args:
+        conn (connection): Handle for psql database connection.
+        cutoff (datetime): Logs with a timestamp before this are archived.
+        directory (Optional[str]): Archive root. Defaults to archive_dir().
+
+    Returns:
+        int: Number of archived rows.
+    """
+    directory = directory or archive_dir()
+    if directory is None:
+        raise ValueError("ACTIVITY_LOGS_ARCHIVE_DIR is not configured.")
+    os.makedirs(directory, exist_ok=True)
+    manifest = copy.deepcopy(_read_manifest(directory))
+    _recover_interrupted_runs(conn, directory, manifest)
+
+    archived, last_id = 0, 0
+    while ids := _archive_batch(conn, cutoff, last_id, directory, manifest):
+        archived += len(ids)
+        last_id = ids[-1]
+    if archived:
+        print(f"Archived {archived} activity logs older than {cutoff}.")
+    return archived
+
+def _runs_in_range(directory: str, start: Optional[datetime],
+        end: Optional[datetime]) -> List[str]:
+    start, end = localize(start), localize(end)
+    runs = []
+    for run in _read_manifest(directory)["runs"]:
+        if start is not None \
+                and localize(datetime.fromisoformat(run["end"])) <= start:
+            continue
+        if end is not None \
+                and localize(datetime.fromisoformat(run["start"])) >= end:
+            continue
+        runs.append(os.path.join(directory, run["name"]))
+    return runs
+
+@lru_cache(maxsize=64)
+def _load_logs(path: str) -> tuple:
+    # Archive files never change once written, so parsed contents are cached.
+    with gzip.open(path, "rt") as f:
+        rows = [json.loads(line) for line in f]
+    for row in rows:
+        row["timestamp"] = localize(datetime.fromisoformat(row["timestamp"]))
+    return tuple(rows)
+
+def _stream_logs(path: str) -> Iterator[Dict[str, Any]]:
+    # Uncached counterpart of _load_logs, for reads of the whole archive.
+    with gzip.open(path, "rt") as f:
+        for line in f:
+            row = json.loads(line)
+            row["timestamp"] = localize(
+                datetime.fromisoformat(row["timestamp"]))
+            yield row
+
+@lru_cache(maxsize=64)
+def _load_daily_totals(path: str) -> tuple:
+    with gzip.open(path, "rt") as f:
+        totals = json.load(f)
+    return tuple((date.fromisoformat(day), total)
+                 for day, total in totals.items())
+
+def reaches_archive(start: Optional[datetime],
+        directory: Optional[str] = None) -> bool:
+    """
+    Tells whether a range starting at start includes archived data.
+
+    Args:
+        start (Optional[datetime]): Lower bound of the range, None for the
+            whole history.
+        directory (Optional[str]): Archive root. Defaults to archive_dir().
+    """
+    cutoff = archive_cutoff(directory)
+    return cutoff is not None and (start is None or localize(start) < cutoff)
+
+def get_archived_logs(activity_type_id: int,
+        start: Optional[datetime] = None, end: Optional[datetime] = None,
+        directory: Optional[str] = None) -> List[Dict[str, Any]]:
+    """
+    Reads the archived rows of an activity type within [start, end).
+
+    Args:
+        activity_type_id (int): ID value for the activity of interest.
+        start (Optional[datetime]): Earliest timestamp to include.
+        end (Optional[datetime]): Timestamp to stop at (exclusive).
+        directory (Optional[str]): Archive root. Defaults to archive_dir().
+
+    Returns:
+        List[Dict[str, Any]]: Archived activity_logs rows ordered by
+            timestamp.
+    """
+    directory = directory or archive_dir()
+    if directory is None:
+        return []
+    start, end = localize(start), localize(end)
+    logs = []
+    for run_dir in _runs_in_range(directory, start, end):
+        path = os.path.join(run_dir, f"logs_{int(activity_type_id)}.jsonl.gz")
+        if not os.path.exists(path):
+            continue
+        logs.extend(
+            dict(row) for row in _load_logs(path)
+            if (start is None or row["timestamp"] >= start)
+            and (end is None or row["timestamp"] < end))
+    logs.sort(key=lambda row: row["timestamp"])
+    return logs
+
+def iter_archived_logs(activity_type_id: int,
+        directory: Optional[str] = None) -> Iterator[Dict[str, Any]]:
+    """
+    Streams every archived row of an activity type. Unlike
+    get_archived_logs, the files are read lazily and bypass the cache, so
+    memory use does not grow with the size of the archive.
+
+    Args:
+        activity_type_id (int): ID value for the activity of interest.
+        directory (Optional[str]): Archive root. Defaults to archive_dir().
+
+    Returns:
+        Iterator[Dict[str, Any]]: Archived activity_logs rows ordered by
+            timestamp.
+    """
+    directory = directory or archive_dir()
+    if directory is None:
+        return iter(())
+    paths = [os.path.join(run_dir, f"logs_{int(activity_type_id)}.jsonl.gz")
+             for run_dir in _runs_in_range(directory, None, None)]
+    # Each file is in timestamp order, but runs of different batches can
+    # overlap in time.
+    return merge(*(_stream_logs(path) for path in paths
+                   if os.path.exists(path)),
+                 key=lambda row: row["timestamp"])
+
+def get_archived_daily_totals(activity_type_id: int,
+        start: Optional[datetime] = None, end: Optional[datetime] = None,
+        directory: Optional[str] = None) -> Dict[date, float]:
+    """
+    Reads the precomputed daily totals of archived rows for an activity type,
+    limited to the days within [start, end).
+
+    Args:
+        activity_type_id (int): ID value for the activity of interest.
+        start (Optional[datetime]): Earliest day to include.
+        end (Optional[datetime]): Day to stop at (exclusive).
+        directory (Optional[str]): Archive root. Defaults to archive_dir().
+
+    Returns:
+        Dict[date, float]: Total canonical quantity per day.
+    """
+    directory = directory or archive_dir()
+    if directory is None:
+        return {}
+    first = to_local(start).date() if start is not None else None
+    last = to_local(end).date() if end is not None else None
+    totals = defaultdict(float)
+    for run_dir in _runs_in_range(directory, start, end):
+        path = os.path.join(run_dir, f"daily_{int(activity_type_id)}.json.gz")
+        if not os.path.exists(path):
+            continue
+        for day, total in _load_daily_totals(path):
+            if (first is None or day >= first) \
+                    and (last is None or day < last):
+                totals[day] += total
+    return dict(totals)
+
+if __name__ == "__main__":
+    # Archival job entry point, e.g. run daily from cron:
+    #   python -m app.db.archive
+    from app.db.connection import db_connect, db_close
+
+    days = int(os.getenv("ACTIVITY_LOGS_ARCHIVE_AFTER_DAYS", "365"))
+    conn = db_connect()
+    try:
+        archive_activity_logs(conn, datetime.now(app_timezone())
+                              - timedelta(days=days))
+    finally:
+        db_close(conn)
+
+# EOF
@@ -0,0 +1,269 @@
+# -*- coding: utf-8 -*-
+"""
+app/db/change_queries.py
+
+Incremental feed over change_log, the append-only record of every insert,
+update, delete and truncate of the unit_groups, units, activity_types and
+activity_logs tables. Triggers write the entries in the transaction making
+the change (see schema.CREATE_CHANGE_LOG_FUNCTION), so an entry is visible
+exactly when its change is.
+
+Consumers page through the feed with an opaque cursor, "<txid>-<id>" of the
+last entry read. Entries are ordered by transaction id and only returned
+once every transaction that could still commit behind them has finished:
+a plain id cursor would skip an entry whose transaction took its id first
+but committed after a later one had already been read.
+
+ExternalWrites follows the feed inside the server: it reports the writes of
+other processes (the CLI import, a snapshot restore, another server) with
+events.record_write, so caches kept current by this process's own writes
+do not serve their stale data.
+"""
+
+# Built-in module imports
+import threading
+import time
+from datetime import datetime
+from typing import Any, Dict, List, Optional, Tuple
+
+# 3rd party module imports
+from psycopg2.extensions import connection
+
+# local module imports
+from app.db.connection import read_only
+from app.db.events import Change, process_origin, record_write
+from app.db.sqlite_backend import is_sqlite, load_timestamp
+
+# Default and maximum number of entries per page.
+CHANGES_LIMIT = 500
+MAX_CHANGES_LIMIT = 5000
+
+# Cursor of a consumer that has read nothing yet.
+START_CURSOR = "0-0"
+
+# Transactions below the snapshot's xmin have all finished, so no entry can
+# appear below the returned ones later on. Entries of the shared unit tables
+# and of truncates carry no user_id and go to every user.
+GET_CHANGES = """
+SELECT id, txid, changed_at, table_name, op, row_id, data
+FROM change_log
+WHERE (txid, id) > (%s, %s)
+    AND txid < pg_snapshot_xmin(pg_current_snapshot())::text::bigint
+    AND (user_id = %s OR user_id IS NULL)
+ORDER BY txid, id
+LIMIT %s;
+"""
+# SQLite serializes writers, so every committed entry is final.
+GET_CHANGES_SQLITE = """
+SELECT id, txid, changed_at, table_name, op, row_id, data
+FROM change_log
+WHERE (txid, id) > (%s, %s)
+    AND (user_id = %s OR user_id IS NULL)
+ORDER BY txid, id
+LIMIT %s;
+"""
+# The whole feed with the origin of each entry, for ExternalWrites.
+GET_ALL_CHANGES = """
+SELECT id, txid, table_name, op, data, origin
+FROM change_log
+WHERE (txid, id) > (%s, %s)
+    AND txid < pg_snapshot_xmin(pg_current_snapshot())::text::bigint
+ORDER BY txid, id
+LIMIT %s;
+"""
+GET_ALL_CHANGES_SQLITE = """
+SELECT id, txid, table_name, op, data, origin
+FROM change_log
+WHERE (txid, id) > (%s, %s)
+ORDER BY txid, id
+LIMIT %s;
+"""
+# Cursor past every entry already final. Entries of transactions at or above
+# xmin sort after it whenever they commit.
+GET_END_CURSOR = """
+SELECT pg_snapshot_xmin(pg_current_snapshot())::text::bigint - 1 AS txid,
+    coalesce(max(id), 0) AS id
+FROM change_log;
+"""
+GET_END_CURSOR_SQLITE = """
+SELECT 0 AS txid, coalesce(max(id), 0) AS id FROM change_log;
+"""
+
+def parse_cursor(cursor: Optional[str]) -> Tuple[int, int]:
+    """
+    Splits a feed cursor into its transaction id and entry id.
+
+    Args:
+        cursor (Optional[str]): Cursor returned by get_changes, or None to
+            start from the beginning.
+
+    Returns:
+        Tuple[int, int]: (txid, id) of the last entry read.
+
+    Raises:
+        ValueError: If the cursor is malformed.
+    """
+    txid, _, entry_id = (cursor or START_CURSOR).partition("-")
+    return int(txid), int(entry_id)
+
+@read_only
+def get_changes(conn: connection, user_id: int, after: Optional[str] = None,
+        limit: int = CHANGES_LIMIT) -> Tuple[List[Dict[str, Any]], str]:
+    """
+    Reads the next page of the change feed visible to a user.
+
+    Args:
+        conn (connection): Handle for psql database connection.
+        user_id (int): ID of the user reading the feed.
+        after (Optional[str]): Cursor of the last entry read, None for the
+            first page.
+        limit (int): Maximum number of entries returned.
+
+    Returns:
+        Tuple[List[Dict[str, Any]], str]: The entries, oldest first, and the
+            cursor to pass as after for the next page. It is unchanged when
+            there is nothing new.
+
+    Raises:
+        ValueError: If the cursor is malformed.
+    """
+    txid, entry_id = parse_cursor(after)
+    with conn.cursor() as cur:
+        cur.execute(GET_CHANGES_SQLITE if is_sqlite(conn) else GET_CHANGES,
+                    (txid, entry_id, user_id, limit))
+        changes = cur.fetchall()
+    if changes:
+        txid, entry_id = changes[-1]["txid"], changes[-1]["id"]
+    return changes, f"{txid}-{entry_id}"
+
+def get_end_cursor(conn: connection) -> str:
+    """
+    Returns a cursor after the entries that are final now, to follow the
+    feed from here on without reading its history.
+
+    Args:
+        conn (connection): Handle for psql database connection.
+    """
+    with conn.cursor() as cur:
+        cur.execute(GET_END_CURSOR_SQLITE if is_sqlite(conn)
+                    else GET_END_CURSOR)
+        end = cur.fetchone()
+    return f"{end['txid']}-{end['id']}"
+
+def get_all_changes(conn: connection, after: str,
+        limit: int = CHANGES_LIMIT) -> Tuple[List[Dict[str, Any]], str]:
+    """
+    Like get_changes, but reads the entries of every user from the primary,
+    together with their origin.
+
+    Args:
+        conn (connection): Handle for psql database connection.
+        after (str): Cursor of the last entry read.
+        limit (int): Maximum number of entries returned.
+
+    Returns:
+        Tuple[List[Dict[str, Any]], str]: The entries, oldest first, and the
+            cursor for the next page.
+    """
+    txid, entry_id = parse_cursor(after)
+    with conn.cursor() as cur:
+        cur.execute(GET_ALL_CHANGES_SQLITE if is_sqlite(conn)
+                    else GET_ALL_CHANGES, (txid, entry_id, limit))
+        changes = cur.fetchall()
+    if changes:
+        txid, entry_id = changes[-1]["txid"], changes[-1]["id"]
+    return changes, f"{txid}-{entry_id}"
+
+def _log_change(conn: connection, entry: Dict[str, Any]) \
+        -> Optional[Change]:
+    # Entries hold the new row of an update only, so just inserted and
+    # deleted logs can be passed on as changed rows. Archived logs are still
+    # read back from the archive: like the archiving process, the table is
+    # reported changed as a whole.
+    if entry["table_name"] != "activity_logs" \
+            or entry["op"] not in ("INSERT", "DELETE"):
+        return None
+    log = dict(entry["data"])
+    log["timestamp"] = load_timestamp(log["timestamp"]) if is_sqlite(conn) \
+            else datetime.fromisoformat(log["timestamp"])
+    return (None, log) if entry["op"] == "INSERT" else (log, None)
+
+class ExternalWrites:
+    """
+    Reports the writes other processes committed to the change_log tables
+    with events.record_write, like the query functions do for this
+    process's writes, passing on the inserted and deleted logs. Entries
+    written by this process are skipped, they were recorded when made.
+
+    Args:
+        interval (float): Minimum number of seconds between two polls.
+
+    Attributes:
+        cursor (Optional[str]): Feed cursor of the last entry read, None
+            until start is called.
+    """
+
+    def __init__(self, interval: float):
+        self.interval = interval
+        self.cursor: Optional[str] = None
+        self._next_poll = 0.0
+        self._lock = threading.Lock()
+        self._polling = threading.Lock()
+
+    def start(self, conn: connection) -> None:
+        """
+        Starts following the feed at its current end.
+
+        Args:
+            conn (connection): Handle for psql database connection.
+        """
+        self.cursor = get_end_cursor(conn)
+        self._next_poll = time.monotonic() + self.interval
+
+    def due(self) -> bool:
+        """
+        Tells whether the interval since the last poll has passed. Returns
+        True to one caller per interval only.
+        """
+        now = time.monotonic()
+        with self._lock:
+            if self.cursor is None or now < self._next_poll:
+                return False
+            self._next_poll = now + self.interval
+            return True
+
+    def poll(self, conn: connection) -> int:
+        """
+        Reads the entries that became final since the last poll and records
+        a write of every table other processes changed.
+
+        Args:
+            conn (connection): Handle for psql database connection.
+
+        Returns:
+            int: Number of entries written by other processes.
+        """
+        origin = process_origin()
+        # Changed rows per table, None once one of them is unknown.
+        tables: Dict[str, Optional[List[Change]]] = {}
+        external = 0
+        with self._polling:
+            while True:
+                entries, self.cursor = get_all_changes(conn, self.cursor)
+                for entry in entries:
+                    if entry["origin"] == origin:
+                        continue
+                    external += 1
+                    rows = tables.setdefault(entry["table_name"], [])
+                    change = _log_change(conn, entry)
+                    if change is None:
+                        tables[entry["table_name"]] = None
+                    elif rows is not None:
+                        rows.append(change)
+                if len(entries) < CHANGES_LIMIT:
+                    break
+        for table, rows in tables.items():
+            record_write(table, rows, external=True)
+        return external
+
+# EOF
@@ -1,39 +1,277 @@
 # -*- coding: utf-8 -*-
 """
 app/db/connection.py
-Establishes connection to the postgreSQL database that stores all the data
-entries.
+Establishes connection to the database that stores all the data entries.
+PostgreSQL is used by default; setting DB_BACKEND=sqlite switches to the
+embedded SQLite backend stored at SQLITE_PATH.
+
+If DB_REPLICA_DSN points at a streaming replica of the database, the
+connection is a RoutedConnection: query functions marked with @read_only run
+on the replica while it is caught up, everything else runs on the primary.
+
+Work that needs a connection to itself, such as a request running under a
+time budget, checks one out of a ConnectionPool.
+
+Sessions run in APP_TIMEZONE, and naive datetimes passed as parameters are
+read as wall times in it.
 """
 
 # built-in module imports
+import functools
 import os
+import sqlite3
+import threading
+import time
+from contextlib import contextmanager
+from datetime import datetime
+from typing import Any, Callable, Iterator, List, Optional
 
 # 3rd party module imports
-from psycopg2 import connect
-from psycopg2.extensions import connection
+from psycopg2 import OperationalError, connect
+from psycopg2.errors import QueryCanceled
+from psycopg2.extensions import TRANSACTION_STATUS_INTRANS, \
+    TimestampFromPy, connection, register_adapter
 from psycopg2.extras import RealDictCursor
 
+# local module imports
+from app.db.events import process_origin
+from app.db.sqlite_backend import is_sqlite, sqlite_connect
+from app.db.timezone import app_timezone_name, localize
+
+register_adapter(datetime, lambda value: TimestampFromPy(localize(value)))
+
+# Run on the primary before a commit. A transaction is only assigned an id
+# once it writes, so reads leave it NULL.
+TRANSACTION_WROTE = """
+SELECT pg_current_xact_id_if_assigned() IS NOT NULL AS wrote;
+"""
+# Run on the primary right after a write committed.
+GET_WRITE_LSN = """
+SELECT pg_current_wal_lsn()::text AS lsn;
+"""
+# Transaction local, so the limit ends with the transaction it was set in.
+SET_LOCAL_STATEMENT_TIMEOUT = """
+SELECT set_config('statement_timeout', %s, true);
+"""
+# Session wide, for autocommit replica connections, where every statement is
+# a transaction of its own.
+SET_STATEMENT_TIMEOUT = """
+SELECT set_config('statement_timeout', %s, false);
+"""
+# Run on the replica. lag_seconds is 0 while everything received has been
+# replayed, so an idle primary does not look like lag. Both columns are NULL
+# if the server is not a standby.
+GET_REPLICA_STATE = """
+SELECT
+    CASE
+        WHEN pg_last_wal_receive_lsn() = pg_last_wal_replay_lsn() THEN 0
+        ELSE extract(epoch FROM now() - pg_last_xact_replay_timestamp())
+    END AS lag_seconds,
+    pg_last_wal_replay_lsn() >= %s::pg_lsn AS caught_up;
+"""
+
+def _lsn_value(lsn: str) -> int:
+    high, low = lsn.split("/")
+    return (int(high, 16) << 32) + int(low, 16)
+
+class WritePosition:
+    """
+    WAL position of the latest write committed through any RoutedConnection
+    sharing it, so that a read on one connection sees a write made on
+    another. Cleared once the replica has replayed it.
+    """
+
+    def __init__(self):
+        self.lsn = None
+        self._lock = threading.Lock()
+
+    def advance(self, lsn: str) -> None:
+        with self._lock:
+            if self.lsn is None or _lsn_value(lsn) > _lsn_value(self.lsn):
+                self.lsn = lsn
+
+    def clear(self, lsn: str) -> None:
+        with self._lock:
+            if self.lsn == lsn:
+                self.lsn = None
+
+# Shared by the connections db_connect opens in this process.
+WRITE_POSITION = WritePosition()
+
 def db_connect() -> connection:
     """
-    Establish a pg2 connection and return the connection.
+    Establish a pg2 connection and return the connection. If DB_BACKEND is
+    set to sqlite, a SQLite database file is opened instead.
 
     Returns:
-        connection handle to postgres database.
+        connection handle to postgres database, or a SqliteConnection which
+        supports the same interface.
     """
+    if os.getenv("DB_BACKEND", "postgres") == "sqlite":
+        return sqlite_connect(os.getenv("SQLITE_PATH",
+                                        "resolution_tracker.db"))
+
+    conn = primary_connect()
+    conn.autocommit = False
 
-    conn = connect(
+    replica_dsn = os.getenv("DB_REPLICA_DSN")
+    if replica_dsn:
+        return RoutedConnection(
+                conn, replica_connect(replica_dsn),
+                float(os.getenv("DB_REPLICA_MAX_LAG_SECONDS", "5")),
+                writes=WRITE_POSITION)
+    
+    return conn
+
+def primary_connect() -> connection:
+    """
+    Opens a plain connection to the Postgres server given by the DB_*
+    environment variables. Its application_name marks the change_log entries
+    of its writes as made by this process.
+    """
+    return connect(
             dbname=os.getenv("DB_NAME"),
             user=os.getenv("DB_USER"),
             password=os.getenv("DB_PASSWORD"),
             host=os.getenv("DB_HOST"),
             port=os.getenv("DB_PORT"),
+            options=_timezone_option(),
+            application_name=process_origin(),
             cursor_factory=RealDictCursor
     )
-    
-    conn.autocommit = False
-    
+
+def _timezone_option() -> str:
+    return f"-c TimeZone={app_timezone_name()}"
+
+def listen_connect() -> connection:
+    """
+    Opens a dedicated connection to the primary for LISTEN. It runs in
+    autocommit mode, since notifications are only delivered between
+    transactions.
+    """
+    conn = primary_connect()
+    conn.autocommit = True
     return conn
 
+def replica_connect(dsn: str) -> connection:
+    """
+    Opens a connection to a read replica. It runs in autocommit mode, so no
+    transaction stays open on the standby between reads.
+
+    Args:
+        dsn (str): libpq connection string of the replica.
+    """
+    replica = connect(dsn, options=_timezone_option(),
+                      cursor_factory=RealDictCursor)
+    replica.autocommit = True
+    return replica
+
+class RoutedConnection:
+    """
+    Primary connection paired with a read replica. It behaves like the
+    primary connection, so every query function works with it unchanged;
+    functions decorated with read_only are sent to the replica instead when
+    it is safe to do so:
+        - its replay lag is below max_lag seconds, and
+        - it has replayed the last write committed through this connection,
+          so a page rendered right after a write always sees that write.
+    Otherwise, and whenever the replica is unreachable, reads fall back to
+    the primary.
+
+    Args:
+        primary (connection): Connection used for writes.
+        replica (connection): Autocommit connection to the replica.
+        max_lag (float): Largest tolerated replay lag in seconds.
+        check_interval (float): Seconds a measured lag is trusted for.
+        writes (Optional[WritePosition]): Last write position shared with
+            other connections whose writes reads must see, e.g. those of a
+            ConnectionPool. Private to this connection by default.
+    """
+
+    def __init__(self, primary: connection, replica: connection,
+            max_lag: float = 5.0, check_interval: float = 1.0,
+            writes: Optional[WritePosition] = None):
+        self.primary = primary
+        self.replica = replica
+        self.max_lag = max_lag
+        self.check_interval = check_interval
+        self.reads = {"primary": 0, "replica": 0}
+        self.writes = writes or WritePosition()
+        self._lag_ok = False
+        self._checked_at = float("-inf")
+        self._lock = threading.Lock()
+
+    def __getattr__(self, name: str) -> Any:
+        return getattr(self.primary, name)
+
+    def commit(self) -> None:
+        """
+        Commits on the primary and, if the transaction wrote, remembers the
+        WAL position of the commit for read-your-writes. Committing a read
+        does not hold reads back from the replica.
+        """
+        wrote = False
+        if self.primary.get_transaction_status() \
+                == TRANSACTION_STATUS_INTRANS:
+            with self.primary.cursor() as cur:
+                cur.execute(TRANSACTION_WROTE)
+                wrote = cur.fetchone()["wrote"]
+        self.primary.commit()
+        if not wrote:
+            return
+        with self.primary.cursor() as cur:
+            cur.execute(GET_WRITE_LSN)
+            lsn = cur.fetchone()["lsn"]
+        self.primary.commit()
+        self.writes.advance(lsn)
+
+    def close(self) -> None:
+        self.primary.close()
+        self.replica.close()
+
+    def _replica_ready(self) -> bool:
+        write_lsn = self.writes.lsn
+        with self._lock:
+            fresh = time.monotonic() - self._checked_at < self.check_interval
+            if fresh and write_lsn is None:
+                return self._lag_ok
+        try:
+            with self.replica.cursor() as cur:
+                cur.execute(GET_REPLICA_STATE, (write_lsn or "0/0",))
+                state = cur.fetchone()
+        except OperationalError:
+            state = None
+        with self._lock:
+            self._checked_at = time.monotonic()
+            self._lag_ok = state is not None \
+                    and state["lag_seconds"] is not None \
+                    and state["lag_seconds"] <= self.max_lag
+            if state is not None and state["caught_up"] \
+                    and write_lsn is not None:
+                self.writes.clear(write_lsn)
+            return self._lag_ok and bool(state["caught_up"])
+
+    def for_read(self) -> connection:
+        """
+        Returns the connection a read-only query should use right now.
+        """
+        target = "replica" if not self.replica.closed \
+                and self._replica_ready() else "primary"
+        self.reads[target] += 1
+        return self.replica if target == "replica" else self.primary
+
+def read_only(func: Callable) -> Callable:
+    """
+    Marks a query function that only reads. When called with a
+    RoutedConnection it runs on the connection chosen by for_read.
+    """
+    @functools.wraps(func)
+    def wrapper(conn, *args, **kwargs):
+        if isinstance(conn, RoutedConnection):
+            conn = conn.for_read()
+        return func(conn, *args, **kwargs)
+    return wrapper
+
 def db_close(conn: connection) -> None:
     """
     Close the connection to database.
@@ -41,5 +279,111 @@ def db_close(conn: connection) -> None:
     if conn and not conn.closed:
         conn.close()
 
+class ConnectionPool:
+    """
+    Connections opened on demand and handed to one caller at a time, for
+    work that must not share its connection with other threads, such as a
+    transaction with local settings (see statement_timeout). At most size
+    connections are checked out at once; further callers wait for one to be
+    returned.
+
+    Args:
+        connect (Callable[[], Any]): Opens a new connection, e.g. db_connect.
+        size (int): Maximum number of connections.
+    """
+
+    def __init__(self, connect: Callable[[], Any], size: int = 8):
+        self._connect = connect
+        self._idle: List[Any] = []
+        self._lock = threading.Lock()
+        self._slots = threading.BoundedSemaphore(size)
+
+    @contextmanager
+    def connection(self) -> Iterator[Any]:
+        """
+        Checks a connection out for the duration of the block. Whatever the
+        block leaves uncommitted is rolled back before the connection is
+        returned; a connection that broke is closed instead.
+        """
+        with self._slots:
+            with self._lock:
+                conn = self._idle.pop() if self._idle else None
+            if conn is None or conn.closed:
+                conn = self._connect()
+            try:
+                yield conn
+            finally:
+                try:
+                    conn.rollback()
+                except Exception:
+                    db_close(conn)
+                if not conn.closed:
+                    with self._lock:
+                        self._idle.append(conn)
+
+    def close(self) -> None:
+        """
+        Closes the idle connections.
+        """
+        with self._lock:
+            idle, self._idle = self._idle, []
+        for conn in idle:
+            db_close(conn)
+
+class QueryTimeout(Exception):
+    """
+    Raised when a statement was cancelled for exceeding its time budget.
+    The transaction it ran in has been rolled back.
+    """
+
+def _set_statement_timeout(conn: connection, milliseconds: int,
+        local: bool = True) -> None:
+    if is_sqlite(conn):
+        conn.statement_timeout = milliseconds / 1000 if milliseconds else None
+        return
+    with conn.cursor() as cur:
+        cur.execute(SET_LOCAL_STATEMENT_TIMEOUT if local
+                    else SET_STATEMENT_TIMEOUT, (str(milliseconds),))
+
+@contextmanager
+def statement_timeout(conn: connection, milliseconds: int) -> Iterator[None]:
+    """
+    Runs the block in a transaction of its own on conn and limits every
+    statement in it to the given time. A statement running longer is
+    cancelled and QueryTimeout is raised.
+
+    The limit is set with SET LOCAL, so it ends with the transaction, which
+    is committed when the block completes and rolled back when it raises.
+    conn must not be used by other threads meanwhile; check one out of a
+    ConnectionPool. Meant for blocks that only read.
+
+    Args:
+        conn (connection): Handle for database connection, including
+            SQLite and routed connections.
+        milliseconds (int): Time allowed per statement.
+    """
+    replica = conn.replica if isinstance(conn, RoutedConnection) else None
+    _set_statement_timeout(conn, milliseconds)
+    if replica is not None:
+        # Autocommit, so the limit has to be set for the session and lifted
+        # again below.
+        _set_statement_timeout(replica, milliseconds, local=False)
+    try:
+        yield
+        conn.commit()
+    except (QueryCanceled, sqlite3.OperationalError) as e:
+        conn.rollback()
+        if isinstance(e, sqlite3.OperationalError) \
+                and str(e) != "interrupted":
+            raise
+        raise QueryTimeout(f"Statement exceeded {milliseconds} ms") from e
+    except BaseException:
+        conn.rollback()
+        raise
+    finally:
+        if is_sqlite(conn):
+            _set_statement_timeout(conn, 0)
+        if replica is not None and not replica.closed:
+            _set_statement_timeout(replica, 0, local=False)
 
 # EOF
@@ -0,0 +1,121 @@
+# -*- coding: utf-8 -*-
+"""
+app/db/events.py
+
+Keeps a per-table data version that the query functions bump after every
+committed write. Caches key their entries on the versions of the tables they
+read from, so a write makes the affected entries unreachable without having
+to track them individually.
+
+Versions live in process memory; each server process sees its own writes.
+Callbacks registered with on_write are told about every recorded write, and
+about the rows it changed where the writer knows them, so caches can be
+updated in place instead of dropped. Writes committed by other processes are
+recorded once read back from change_log (see change_queries.ExternalWrites),
+which tells them apart by the process_origin of their writer.
+"""
+
+# Built-in module imports
+import os
+import threading
+import uuid
+from collections import defaultdict
+from contextlib import contextmanager
+from typing import Any, Callable, Dict, Iterator, List, Optional, Tuple
+
+# A changed row as (old, new); old is None for inserts, new for deletes.
+Change = Tuple[Optional[Dict[str, Any]], Optional[Dict[str, Any]]]
+WriteCallback = Callable[[str, Optional[List[Change]], bool], None]
+
+_versions: Dict[str, int] = defaultdict(int)
+_in_progress: Dict[str, int] = defaultdict(int)
+_lock = threading.Lock()
+_callbacks: List[WriteCallback] = []
+_origin: Tuple[int, str] = (0, "")
+
+def process_origin() -> str:
+    """
+    Returns the name this process tags its writes with in change_log. It is
+    unique per process, also across hosts and containers where process ids
+    repeat, and changes in a forked child.
+    """
+    global _origin
+    with _lock:
+        if _origin[0] != os.getpid():
+            _origin = (os.getpid(),
+                       f"resolution_tracker:{uuid.uuid4().hex[:16]}")
+        return _origin[1]
+
+def record_write(table: str, changes: Optional[List[Change]] = None,
+        external: bool = False) -> None:
+    """
+    Marks the data of a table as changed. Call after the write committed.
+
+    Args:
+        table (str): Name of the table that was written to.
+        changes (Optional[List[Change]]): The rows changed by the write, if
+            known. None means any row may have changed.
+        external (bool): True for a write of another process read back from
+            change_log. Data read since it committed may already contain
+            it, so caches must drop rather than patch what it touched.
+    """
+    with _lock:
+        _versions[table] += 1
+    for callback in _callbacks:
+        callback(table, changes, external)
+
+def on_write(callback: WriteCallback) -> None:
+    """
+    Registers a function called with the table name, the changed rows and
+    the external flag (see record_write) after every write.
+
+    Args:
+        callback (WriteCallback): Function to call.
+    """
+    _callbacks.append(callback)
+
+@contextmanager
+def write_in_progress(table: str) -> Iterator[None]:
+    """
+    Wraps a write and its record_write call. A cache patched from the
+    reported rows cannot tell whether data it read while the write was
+    running already contains them; stable_version tells it not to keep
+    such data.
+
+    Args:
+        table (str): Name of the table being written to.
+    """
+    with _lock:
+        _in_progress[table] += 1
+        _versions[table] += 1
+    try:
+        yield
+    finally:
+        with _lock:
+            _in_progress[table] -= 1
+
+def stable_version(*tables: str) -> Optional[Tuple[int, ...]]:
+    """
+    Like data_version, but returns None while a write wrapped in
+    write_in_progress runs on one of the tables. Data read after this
+    returned a version can be cached if data_version still returns the
+    same afterwards.
+    """
+    with _lock:
+        if any(_in_progress[table] for table in tables):
+            return None
+        return tuple(_versions[table] for table in tables)
+
+def data_version(*tables: str) -> Tuple[int, ...]:
+    """
+    Returns the current versions of the given tables.
+
+    Args:
+        tables (str): Names of the tables the caller depends on.
+
+    Returns:
+        Tuple[int, ...]: One version number per table, in argument order.
+    """
+    return tuple(_versions[table] for table in tables)
+
+# EOF
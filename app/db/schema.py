@@ -4,30 +4,95 @@ app/db/schema.py
 Handles database table creation and management
 """
 
+# built-in module imports
+import os
+from datetime import date
+from typing import Iterable, List, Optional, Tuple
+
 # 3rd party imports
 from psycopg2.extensions import connection
 
+# local module imports
+from app.db import sqlite_backend
+from app.db.sqlite_backend import is_sqlite
+from app.db.timezone import app_timezone, app_timezone_name, local_today
+
+# Owner assigned to data created before multi-user support existed.
+DEFAULT_USER_ID = 1
+
 # Table creation strings
 
+CREATE_USERS_TABLE = """
+CREATE TABLE IF NOT EXISTS users (
+    id SERIAL PRIMARY KEY,
+    name TEXT UNIQUE NOT NULL,
+    password_hash TEXT
+);
+"""
+# Users created before passwords existed have none (see user_queries).
+ADD_USERS_PASSWORD = """
+ALTER TABLE users ADD COLUMN password_hash TEXT;
+"""
+
+INSERT_DEFAULT_USER = """
+INSERT INTO users (id, name) VALUES (%s, 'default')
+ON CONFLICT DO NOTHING;
+"""
+
 CREATE_ACTIVITY_TYPES_TABLE = """
 CREATE TABLE IF NOT EXISTS activity_types (
     id SERIAL PRIMARY KEY,
-    name TEXT UNIQUE NOT NULL,
+    user_id INTEGER NOT NULL REFERENCES users(id) ON DELETE CASCADE,
+    name TEXT NOT NULL,
     unit_group_id INTEGER NOT NULL REFERENCES unit_groups(id)
         ON DELETE CASCADE,
-    goal_quantity DOUBLE PRECISION
+    goal_quantity DOUBLE PRECISION,
+    UNIQUE (user_id, name)
 );
 """
 
 CREATE_ACTIVITY_LOGS_TABLE = """
 CREATE TABLE IF NOT EXISTS activity_logs (
     id SERIAL PRIMARY KEY,
+    user_id INTEGER NOT NULL REFERENCES users(id) ON DELETE CASCADE,
     activity_type_id INTEGER NOT NULL REFERENCES activity_types(id),
     canonical_quantity DOUBLE PRECISION NOT NULL,
-    timestamp TIMESTAMP NOT NULL DEFAULT NOW()
+    timestamp TIMESTAMPTZ NOT NULL DEFAULT NOW(),
+    notes TEXT,
+    tags TEXT[] NOT NULL DEFAULT '{}'
 );
 """
 
+# Partitioned variant of activity_logs. Postgres requires the partition key to
+# be part of the primary key, hence (id, timestamp).
+CREATE_PARTITIONED_ACTIVITY_LOGS_TABLE = """
+CREATE TABLE IF NOT EXISTS activity_logs (
+    id SERIAL,
+    user_id INTEGER NOT NULL REFERENCES users(id) ON DELETE CASCADE,
+    activity_type_id INTEGER NOT NULL REFERENCES activity_types(id),
+    canonical_quantity DOUBLE PRECISION NOT NULL,
+    timestamp TIMESTAMPTZ NOT NULL DEFAULT NOW(),
+    notes TEXT,
+    tags TEXT[] NOT NULL DEFAULT '{}',
+    PRIMARY KEY (id, timestamp)
+) PARTITION BY RANGE (timestamp);
+"""
+
+# Instance wide settings the schema depends on.
+CREATE_SETTINGS_TABLE = """
+CREATE TABLE IF NOT EXISTS settings (
+    name TEXT PRIMARY KEY,
+    value TEXT NOT NULL
+);
+"""
+GET_SETTING = """
+SELECT value FROM settings WHERE name = %s;
+"""
+PUT_SETTING = """
+INSERT INTO settings (name, value) VALUES (%s, %s)
+ON CONFLICT (name) DO UPDATE SET value = excluded.value;
+"""
+
 CREATE_UNIT_GROUPS_TABLE = """
 CREATE TABLE IF NOT EXISTS unit_groups (
     id SERIAL PRIMARY KEY,
@@ -52,6 +117,319 @@ ON units(group_id)
 WHERE is_canonical = TRUE;
 """
 
+# Block range index over the log timestamps. Logs are appended in roughly
+# chronological order, so a BRIN index stays tiny and lets time-bounded reads
+# skip every block outside the requested range.
+ACTIVITY_LOGS_TIMESTAMP_INDEX = """
+CREATE INDEX activity_logs_timestamp_brin
+ON {table} USING BRIN (timestamp);
+"""
+
+# Every log read is scoped to one user and usually one activity type, so this
+# index keeps per-user reads proportional to that user's data no matter how
+# large the table grows.
+ACTIVITY_LOGS_USER_INDEX = """
+CREATE INDEX activity_logs_user_type_timestamp
+ON {table} (user_id, activity_type_id, timestamp);
+"""
+
+# The day a log counts towards, in APP_TIMEZONE. The zone is written into the
+# function body, which keeps it immutable and so usable in an index; see
+# apply_app_timezone. Timestamps of a table created before they carried a
+# zone are already wall times in APP_TIMEZONE.
+CREATE_LOCAL_DAY_FUNCTION = """
+CREATE OR REPLACE FUNCTION local_day(timestamptz) RETURNS date AS $$
+    SELECT ($1 AT TIME ZONE %s)::date;
+$$ LANGUAGE sql IMMUTABLE PARALLEL SAFE;
+
+CREATE OR REPLACE FUNCTION local_day(timestamp) RETURNS date AS $$
+    SELECT $1::date;
+$$ LANGUAGE sql IMMUTABLE PARALLEL SAFE;
+"""
+
+# Daily totals group by local_day(timestamp); with this index they are read
+# per user and type in day order without sorting.
+ACTIVITY_LOGS_LOCAL_DAY_INDEX = """
+CREATE INDEX activity_logs_user_type_local_day
+ON {table} (user_id, activity_type_id, local_day(timestamp));
+"""
+# REINDEX of a partitioned index cannot run inside a transaction block, so
+# the index is rebuilt by dropping and creating it again.
+DROP_ACTIVITY_LOGS_LOCAL_DAY_INDEX = """
+DROP INDEX activity_logs_user_type_local_day;
+"""
+
+# Inverted index over the tags of every log, so that tag-filtered reads
+# (tags @> ARRAY[...]) are answered from the index, combined with the user
+# index by a bitmap AND.
+ACTIVITY_LOGS_TAGS_INDEX = """
+CREATE INDEX activity_logs_tags_gin
+ON {table} USING GIN (tags);
+"""
+
+# Publishes every committed change of activity_logs on the activity_logs
+# channel (see app/live.py). pg_notify fails the writing statement on a
+# payload over 8000 bytes, so only fixed size columns are sent; clients
+# fetch the notes and tags of the row themselves.
+CREATE_NOTIFY_TRIGGER = """
+CREATE OR REPLACE FUNCTION activity_logs_notify() RETURNS trigger AS $$
+DECLARE
+    row activity_logs%ROWTYPE;
+BEGIN
+    IF TG_OP = 'DELETE' THEN
+        row := OLD;
+    ELSE
+        row := NEW;
+    END IF;
+    PERFORM pg_notify('activity_logs', json_build_object(
+        'op', TG_OP,
+        'id', row.id,
+        'user_id', row.user_id,
+        'activity_type_id', row.activity_type_id,
+        'canonical_quantity', row.canonical_quantity,
+        'timestamp', row.timestamp
+    )::text);
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+DROP TRIGGER IF EXISTS activity_logs_notify ON activity_logs;
+CREATE TRIGGER activity_logs_notify
+AFTER INSERT OR UPDATE OR DELETE ON activity_logs
+FOR EACH ROW EXECUTE FUNCTION activity_logs_notify();
+"""
+
+# Append-only log of every change to the tables below, written by triggers in
+# the transaction making the change (see app/db/change_queries.py). txid
+# orders the entries by transaction, since ids are handed out before commit
+# and concurrent transactions can commit out of id order. origin is the
+# application_name of the writing session, events.process_origin() for the
+# app's own connections.
+CHANGE_LOG_TABLES = ("unit_groups", "units", "activity_types",
+                     "activity_logs")
+
+CREATE_CHANGE_LOG_TABLE = """
+CREATE TABLE IF NOT EXISTS change_log (
+    id BIGSERIAL PRIMARY KEY,
+    txid BIGINT NOT NULL DEFAULT pg_current_xact_id()::text::bigint,
+    changed_at TIMESTAMPTZ NOT NULL DEFAULT NOW(),
+    table_name TEXT NOT NULL,
+    op TEXT NOT NULL,
+    row_id INTEGER,
+    user_id INTEGER,
+    data JSONB,
+    origin TEXT DEFAULT current_setting('application_name')
+);
+CREATE INDEX IF NOT EXISTS change_log_txid_id ON change_log (txid, id);
+"""
+ADD_CHANGE_LOG_ORIGIN = """
+ALTER TABLE change_log
+    ADD COLUMN origin TEXT DEFAULT current_setting('application_name');
+"""
+
+# The logged table name is passed as an argument because row triggers on a
+# partitioned table fire with TG_TABLE_NAME set to the partition. TRUNCATE,
+# used when restoring a snapshot, is logged once per statement without a
+# row. user_id is NULL for the shared unit tables. Deletes made while the
+# app.archiving setting is on (see app/db/archive.py) are logged as ARCHIVE,
+# since the rows are still read back from the archive.
+CREATE_CHANGE_LOG_FUNCTION = """
+CREATE OR REPLACE FUNCTION change_log_record() RETURNS trigger AS $$
+DECLARE
+    payload jsonb;
+    op text := TG_OP;
+BEGIN
+    IF TG_LEVEL = 'STATEMENT' THEN
+        INSERT INTO change_log (table_name, op) VALUES (TG_ARGV[0], TG_OP);
+        RETURN NULL;
+    END IF;
+    IF TG_OP = 'DELETE' THEN
+        payload := to_jsonb(OLD);
+        IF current_setting('app.archiving', true) = 'on' THEN
+            op := 'ARCHIVE';
+        END IF;
+    ELSE
+        payload := to_jsonb(NEW);
+    END IF;
+    INSERT INTO change_log (table_name, op, row_id, user_id, data)
+    VALUES (TG_ARGV[0], op, (payload->>'id')::integer,
+            (payload->>'user_id')::integer, payload);
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+"""
+CREATE_CHANGE_LOG_TRIGGERS = """
+DROP TRIGGER IF EXISTS change_log_record ON {table};
+CREATE TRIGGER change_log_record
+AFTER INSERT OR UPDATE OR DELETE ON {table}
+FOR EACH ROW EXECUTE FUNCTION change_log_record('{table}');
+DROP TRIGGER IF EXISTS change_log_truncate ON {table};
+CREATE TRIGGER change_log_truncate
+AFTER TRUNCATE ON {table}
+FOR EACH STATEMENT EXECUTE FUNCTION change_log_record('{table}');
+"""
+
+# Trigram indexes behind the typeahead search (see app/db/search_queries.py).
+# pg_trgm ships with the contrib package, which not every server has.
+TRIGRAM_AVAILABLE = """
+SELECT EXISTS (
+    SELECT 1 FROM pg_available_extensions WHERE name = 'pg_trgm'
+) AS available;
+"""
+CREATE_TRIGRAM_EXTENSION = """
+CREATE EXTENSION IF NOT EXISTS pg_trgm;
+"""
+ACTIVITY_TYPES_NAME_TRGM_INDEX = """
+CREATE INDEX activity_types_name_trgm
+ON activity_types USING GIN (name gin_trgm_ops);
+"""
+UNITS_NAME_TRGM_INDEX = """
+CREATE INDEX units_name_trgm
+ON units USING GIN (name gin_trgm_ops);
+"""
+
+# Migration of single-user tables. Existing rows go to the default user. A
+# constant default makes ADD COLUMN a catalog-only change.
+ADD_ACTIVITY_TYPES_USER = """
+ALTER TABLE activity_types ADD COLUMN user_id INTEGER NOT NULL
+    DEFAULT 1 REFERENCES users(id) ON DELETE CASCADE;
+ALTER TABLE activity_types ALTER COLUMN user_id DROP DEFAULT;
+ALTER TABLE activity_types DROP CONSTRAINT IF EXISTS activity_types_name_key;
+ALTER TABLE activity_types ADD UNIQUE (user_id, name);
+"""
+ADD_ACTIVITY_LOGS_USER = """
+ALTER TABLE activity_logs ADD COLUMN user_id INTEGER NOT NULL
+    DEFAULT 1 REFERENCES users(id) ON DELETE CASCADE;
+ALTER TABLE activity_logs ALTER COLUMN user_id DROP DEFAULT;
+"""
+# Free-text notes and tags on logs, added to tables created before them.
+ADD_ACTIVITY_LOGS_ANNOTATIONS = """
+ALTER TABLE activity_logs
+    ADD COLUMN notes TEXT,
+    ADD COLUMN tags TEXT[] NOT NULL DEFAULT '{}';
+"""
+
+# Partition management strings for activity_logs
+
+PARTITION_INTERVALS = ("month", "year")
+
+DEFAULT_PARTITION = "activity_logs_default"
+
+CREATE_DEFAULT_PARTITION = """
+CREATE TABLE IF NOT EXISTS activity_logs_default
+PARTITION OF {parent} DEFAULT;
+"""
+
+# New partitions are built detached, filled with any stray rows that landed in
+# the default partition for their range and only then attached, because
+# Postgres refuses to attach a range the default partition still holds.
+CREATE_DETACHED_PARTITION = """
+CREATE TABLE {name} (LIKE {parent} INCLUDING DEFAULTS INCLUDING CONSTRAINTS);
+"""
+MOVE_ROWS_FROM_DEFAULT = """
+WITH moved AS (
+    DELETE FROM activity_logs_default
+    WHERE timestamp >= %s AND timestamp < %s
+    RETURNING *
+)
+INSERT INTO {name} SELECT * FROM moved;
+"""
+ATTACH_PARTITION = """
+ALTER TABLE {parent} ATTACH PARTITION {name}
+FOR VALUES FROM (%s) TO (%s);
+"""
+
+GET_PARTITIONS = """
+SELECT
+    child.relname AS name,
+    pg_get_expr(child.relpartbound, child.oid) AS bounds
+FROM pg_inherits inh
+JOIN pg_class parent ON inh.inhparent = parent.oid
+JOIN pg_class child ON inh.inhrelid = child.oid
+WHERE parent.relname = %s
+ORDER BY child.relname;
+"""
+
+IS_PARTITIONED = """
+SELECT EXISTS (
+    SELECT 1
+    FROM pg_partitioned_table part
+    JOIN pg_class cls ON part.partrelid = cls.oid
+    WHERE cls.relname = %s
+) AS exists;
+"""
+
+# activity_logs.timestamp used to be a TIMESTAMP without zone holding wall
+# times; they are converted as times in APP_TIMEZONE. This rewrites the table.
+GET_TIMESTAMP_TYPE = """
+SELECT data_type FROM information_schema.columns
+WHERE table_schema = 'public'
+AND table_name = 'activity_logs'
+AND column_name = 'timestamp';
+"""
+MIGRATE_TIMESTAMP_TO_TIMESTAMPTZ = """
+ALTER TABLE activity_logs
+ALTER COLUMN timestamp TYPE TIMESTAMPTZ USING timestamp AT TIME ZONE %s;
+"""
+
+# Online migration strings. The partitioned copy is filled in batches while a
+# mirror trigger replays concurrent writes, then the two tables swap names.
+GET_TABLE_INDEXES = """
+SELECT indexname FROM pg_indexes
+WHERE schemaname = 'public' AND tablename = %s;
+"""
+CREATE_MIGRATION_TABLE = """
+CREATE TABLE activity_logs_partitioned (
+    LIKE activity_logs INCLUDING DEFAULTS INCLUDING CONSTRAINTS,
+    CONSTRAINT activity_logs_pkey PRIMARY KEY (id, timestamp),
+    FOREIGN KEY (user_id) REFERENCES users(id) ON DELETE CASCADE,
+    FOREIGN KEY (activity_type_id) REFERENCES activity_types(id)
+) PARTITION BY RANGE (timestamp);
+"""
+CREATE_MIRROR_TRIGGER = """
+CREATE OR REPLACE FUNCTION activity_logs_mirror() RETURNS trigger AS $$
+BEGIN
+    IF TG_OP IN ('UPDATE', 'DELETE') THEN
+        DELETE FROM activity_logs_partitioned WHERE id = OLD.id;
+    END IF;
+    IF TG_OP IN ('INSERT', 'UPDATE') THEN
+        INSERT INTO activity_logs_partitioned SELECT NEW.*
+        ON CONFLICT DO NOTHING;
+    END IF;
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+CREATE TRIGGER activity_logs_mirror
+AFTER INSERT OR UPDATE OR DELETE ON activity_logs
+FOR EACH ROW EXECUTE FUNCTION activity_logs_mirror();
+"""
+# FOR SHARE makes a concurrent update wait for the batch to commit, so its
+# mirror trigger always sees the copied row.
+COPY_MIGRATION_BATCH = """
+WITH batch AS (
+    SELECT * FROM activity_logs
+    WHERE id > %s AND id <= %s
+    ORDER BY id
+    LIMIT %s
+    FOR SHARE
+), copied AS (
+    INSERT INTO activity_logs_partitioned
+    SELECT * FROM batch
+    ON CONFLICT DO NOTHING
+)
+SELECT max(id) AS last_id, count(*) AS copied FROM batch;
+"""
+SWAP_MIGRATION_TABLES = """
+LOCK TABLE activity_logs IN ACCESS EXCLUSIVE MODE;
+DROP TRIGGER activity_logs_mirror ON activity_logs;
+DROP FUNCTION activity_logs_mirror();
+ALTER TABLE activity_logs RENAME TO activity_logs_unpartitioned;
+ALTER TABLE activity_logs_unpartitioned ALTER COLUMN id DROP DEFAULT;
+ALTER TABLE activity_logs_partitioned RENAME TO activity_logs;
+ALTER SEQUENCE activity_logs_id_seq OWNED BY activity_logs.id;
+"""
+
 def table_exists(conn: connection, table_name: str) -> bool:
     """
     Checks whether or not specified table exists in the database connected to
@@ -62,9 +440,12 @@ def table_exists(conn: connection, table_name: str) -> bool:
         table_name (str): Name of the table being checked.
 
     Returns:
-        
+        bool: True if the table exists.
     """
     with conn.cursor() as cur:
+        if is_sqlite(conn):
+            cur.execute(sqlite_backend.TABLE_EXISTS, (table_name,))
+            return bool(cur.fetchone()["exists"])
         cur.execute(
             """
             SELECT EXISTS (
@@ -101,8 +482,58 @@ def create_table(conn: connection, table_name: str, create_sql: str) -> None:
     conn.commit()
     print(f"Table \"{table_name}\" created.")
 
+def column_exists(conn: connection, table_name: str, column_name: str) \
+        -> bool:
+    """
+    Checks whether a table has the specified column.
+
+    Args:
+        conn (connection): psql database connection handle.
+        table_name (str): Name of the table being checked.
+        column_name (str): Name of the column being checked.
+
+    Returns:
+        bool: True if the column exists.
+    """
+    with conn.cursor() as cur:
+        if is_sqlite(conn):
+            cur.execute(sqlite_backend.COLUMN_EXISTS,
+                        (table_name, column_name))
+            return bool(cur.fetchone()["exists"])
+        cur.execute("""
+            SELECT EXISTS (
+                SELECT 1
+                FROM information_schema.columns
+                WHERE table_schema = 'public'
+                AND table_name = %s
+                AND column_name = %s
+            ) AS exists;
+        """, (table_name, column_name))
+        return cur.fetchone()["exists"]
+
+def add_column(conn: connection, table_name: str, column_name: str,
+        alter_sql: str) -> None:
+    """
+    Runs alter_sql to add a column, unless the table already has it.
+
+    Args:
+        conn (connection): psql database connection handle.
+        table_name (str): Name of the table to alter.
+        column_name (str): Name of the column alter_sql adds.
+        alter_sql (str): sql string adding the column.
+    """
+    if column_exists(conn, table_name, column_name):
+        return
+    with conn.cursor() as cur:
+        cur.execute(alter_sql)
+    conn.commit()
+    print(f"Column \"{column_name}\" added to table \"{table_name}\".")
+
 def index_exists(conn: connection, index_name: str) -> bool:
     with conn.cursor() as cur:
+        if is_sqlite(conn):
+            cur.execute(sqlite_backend.INDEX_EXISTS, (index_name,))
+            return bool(cur.fetchone()["exists"])
         cur.execute("""
             SELECT EXISTS (
                 SELECT 1
@@ -129,19 +560,475 @@ def create_index(conn: connection, index_name: str, index_sql: str) -> None:
     conn.commit()
     print(f"Index {index_name }created")
 
-def initialize_schema(conn) -> None:
+def is_partitioned(conn: connection, table_name: str) -> bool:
+    """
+    Checks whether the specified table is a declaratively partitioned table.
+
+    Args:
+        conn (connection): psql database connection handle.
+        table_name (str): Name of the table being checked.
+
+    Returns:
+        bool: True if the table is partitioned.
+    """
+    with conn.cursor() as cur:
+        cur.execute(IS_PARTITIONED, (table_name,))
+        return cur.fetchone()["exists"]
+
+def partition_bounds(day: date, interval: str) -> Tuple[date, date]:
+    """
+    Computes the range of the partition that contains the given day.
+
+    Args:
+        day (date): Any day within the partition.
+        interval (str): Partition width, either "month" or "year".
+
+    Returns:
+        Tuple[date, date]: Inclusive start and exclusive end of the range.
+    """
+    if interval == "month":
+        start = date(day.year, day.month, 1)
+        if day.month == 12:
+            return start, date(day.year + 1, 1, 1)
+        return start, date(day.year, day.month + 1, 1)
+    if interval == "year":
+        return date(day.year, 1, 1), date(day.year + 1, 1, 1)
+    raise ValueError(f"Unsupported partition interval: {interval}")
+
+def partition_name(start: date, interval: str) -> str:
+    """
+    Returns the name of the activity_logs partition starting at start, e.g.
+    activity_logs_y2026m01 or activity_logs_y2026.
+    """
+    if interval == "month":
+        return f"activity_logs_y{start.year}m{start.month:02d}"
+    return f"activity_logs_y{start.year}"
+
+def create_partition(conn: connection, day: date, interval: str,
+        parent: str = "activity_logs") -> None:
+    """
+    Creates the activity_logs partition covering the given day if it does not
+    exist yet. Rows that were caught by the default partition for that range
+    are moved into the new partition.
+
+    Args:
+        conn (connection): psql database connection handle.
+        day (date): Any day within the partition to create.
+        interval (str): Partition width, either "month" or "year".
+        parent (str): Name of the partitioned parent table.
+    """
+    start, end = partition_bounds(day, interval)
+    name = partition_name(start, interval)
+    if table_exists(conn, name):
+        return
+    with conn.cursor() as cur:
+        cur.execute(CREATE_DETACHED_PARTITION.format(name=name, parent=parent))
+        cur.execute(MOVE_ROWS_FROM_DEFAULT.format(name=name), (start, end))
+        cur.execute(ATTACH_PARTITION.format(name=name, parent=parent),
+                    (start, end))
+    conn.commit()
+    print(f"Partition {name} created.")
+
+def ensure_partitions(conn: connection, interval: str, ahead: int = 3,
+        first: Optional[date] = None, parent: str = "activity_logs") -> None:
+    """
+    Makes sure partitions exist from the one containing first (defaults to
+    today) up to ahead partitions past the current one, so inserts never have
+    to fall back to the default partition.
+
+    Args:
+        conn (connection): psql database connection handle.
+        interval (str): Partition width, either "month" or "year".
+        ahead (int): Number of upcoming partitions to create in advance.
+        first (Optional[date]): Earliest day that needs a partition.
+        parent (str): Name of the partitioned parent table.
+    """
+    today = local_today()
+    day, _ = partition_bounds(first or today, interval)
+    last, _ = partition_bounds(today, interval)
+    for _ in range(ahead):
+        _, last = partition_bounds(last, interval)
+    while day <= last:
+        create_partition(conn, day, interval, parent)
+        _, day = partition_bounds(day, interval)
+
+def list_partitions(conn: connection, parent: str = "activity_logs") \
+        -> List[dict]:
+    """
+    Lists the partitions attached to the parent table with their bounds.
+
+    Args:
+        conn (connection): psql database connection handle.
+        parent (str): Name of the partitioned parent table.
+
+    Returns:
+        List[dict]: Records with the partition name and bound expression.
+    """
+    with conn.cursor() as cur:
+        cur.execute(GET_PARTITIONS, (parent,))
+        return cur.fetchall()
+
+def detach_partition(conn: connection, name: str,
+        concurrently: bool = False) -> None:
+    """
+    Detaches a partition from activity_logs. The detached table keeps its
+    rows and can be archived or dropped independently. Detaching is a catalog
+    operation, so it is cheap regardless of the partition size.
+
+    Args:
+        conn (connection): psql database connection handle.
+        name (str): Name of the partition to detach.
+        concurrently (bool): Use DETACH ... CONCURRENTLY so that concurrent
+            queries on activity_logs are not blocked. This cannot run inside
+            a transaction block, so the connection briefly switches to
+            autocommit.
+    """
+    sql = f"ALTER TABLE activity_logs DETACH PARTITION {name}"
+    if not concurrently:
+        with conn.cursor() as cur:
+            cur.execute(sql + ";")
+        conn.commit()
+        return
+    conn.commit()
+    conn.autocommit = True
+    try:
+        with conn.cursor() as cur:
+            cur.execute(sql + " CONCURRENTLY;")
+    finally:
+        conn.autocommit = False
+
+def create_activity_logs_indexes(conn: connection,
+        table: str = "activity_logs") -> None:
+    """
+    Creates the secondary indexes of activity_logs. On a partitioned table
+    they cascade to every partition.
+
+    Args:
+        conn (connection): psql database connection handle.
+        table (str): Table to index. The partitioning migration indexes its
+            copy of activity_logs before filling it.
+    """
+    create_index(conn, "activity_logs_timestamp_brin",
+                 ACTIVITY_LOGS_TIMESTAMP_INDEX.format(table=table))
+    create_index(conn, "activity_logs_user_type_timestamp",
+                 ACTIVITY_LOGS_USER_INDEX.format(table=table))
+    create_index(conn, "activity_logs_tags_gin",
+                 ACTIVITY_LOGS_TAGS_INDEX.format(table=table))
+    create_index(conn, "activity_logs_user_type_local_day",
+                 ACTIVITY_LOGS_LOCAL_DAY_INDEX.format(table=table))
+
+def migrate_timestamps_to_timestamptz(conn: connection) -> None:
+    """
+    Converts activity_logs.timestamp of a table created before timestamps
+    carried their zone, reading the stored wall times as APP_TIMEZONE. The
+    partition key of a partitioned table cannot change type; such a table
+    keeps its naive timestamps, which local_day() reads as they are.
+
+    Args:
+        conn (connection): psql database connection handle.
+    """
+    with conn.cursor() as cur:
+        cur.execute(GET_TIMESTAMP_TYPE)
+        row = cur.fetchone()
+    if row is None or row["data_type"] != "timestamp without time zone":
+        return
+    if is_partitioned(conn, "activity_logs"):
+        print("Table \"activity_logs\" is partitioned by a timestamp "
+              "without time zone and keeps it; its times are read as "
+              f"{app_timezone_name()}.")
+        return
+    with conn.cursor() as cur:
+        cur.execute(MIGRATE_TIMESTAMP_TO_TIMESTAMPTZ, (app_timezone_name(),))
+    conn.commit()
+    print("Column \"timestamp\" of table \"activity_logs\" converted to "
+          f"timestamptz as {app_timezone_name()} times.")
+
+def apply_app_timezone(conn: connection) -> None:
+    """
+    Makes local_day() use APP_TIMEZONE. When the zone differs from the one
+    the database was last set up with, the local day index is rebuilt in the
+    same transaction, since its entries were computed with the old zone. On
+    Postgres it is dropped and created again, which also works for the
+    index of a partitioned table.
+
+    Args:
+        conn (connection): Database connection handle, Postgres or SQLite.
+    """
+    zone = app_timezone_name()
+    app_timezone()  # Fails early on an unknown zone name.
+    create_table(conn, "settings", CREATE_SETTINGS_TABLE)
+    with conn.cursor() as cur:
+        cur.execute(GET_SETTING, ("app_timezone",))
+        row = cur.fetchone()
+    changed = row is None or row["value"] != zone
+    reindex = changed \
+            and index_exists(conn, "activity_logs_user_type_local_day")
+    with conn.cursor() as cur:
+        if not is_sqlite(conn):
+            cur.execute(CREATE_LOCAL_DAY_FUNCTION, (zone,))
+        if reindex and is_sqlite(conn):
+            cur.execute("REINDEX activity_logs_user_type_local_day;")
+        elif reindex:
+            cur.execute(DROP_ACTIVITY_LOGS_LOCAL_DAY_INDEX)
+            cur.execute(ACTIVITY_LOGS_LOCAL_DAY_INDEX.format(
+                table="activity_logs"))
+        if changed:
+            cur.execute(PUT_SETTING, ("app_timezone", zone))
+    conn.commit()
+    if reindex:
+        print(f"Index activity_logs_user_type_local_day rebuilt for {zone}.")
+
+def create_notify_trigger(conn: connection) -> None:
+    """
+    (Re)creates the trigger announcing activity_logs changes with NOTIFY.
+
+    Args:
+        conn (connection): psql database connection handle.
+    """
+    with conn.cursor() as cur:
+        cur.execute(CREATE_NOTIFY_TRIGGER)
+    conn.commit()
+
+def create_change_log_triggers(conn: connection,
+        tables: Iterable[str] = CHANGE_LOG_TABLES) -> None:
+    """
+    (Re)creates the triggers recording changes of the given tables in
+    change_log.
+
+    Args:
+        conn (connection): psql database connection handle.
+        tables (Iterable[str]): Tables to record, all by default.
+    """
+    with conn.cursor() as cur:
+        if is_sqlite(conn):
+            for table in tables:
+                cur.execute(sqlite_backend.change_log_triggers(table))
+        else:
+            cur.execute(CREATE_CHANGE_LOG_FUNCTION)
+            for table in tables:
+                cur.execute(CREATE_CHANGE_LOG_TRIGGERS.format(table=table))
+    conn.commit()
+
+def create_trigram_indexes(conn: connection) -> bool:
+    """
+    Installs pg_trgm and indexes the activity type and unit names for fuzzy
+    search, if the server provides the extension.
+
+    Args:
+        conn (connection): psql database connection handle.
+
+    Returns:
+        bool: Whether the indexes exist. Without them the typeahead search
+            falls back to substring matching.
+    """
+    with conn.cursor() as cur:
+        cur.execute(TRIGRAM_AVAILABLE)
+        available = cur.fetchone()["available"]
+        if available:
+            cur.execute(CREATE_TRIGRAM_EXTENSION)
+    conn.commit()
+    if not available:
+        print("Extension pg_trgm is not available, search falls back to "
+              "substring matching.")
+        return False
+    create_index(conn, "activity_types_name_trgm",
+                 ACTIVITY_TYPES_NAME_TRGM_INDEX)
+    create_index(conn, "units_name_trgm", UNITS_NAME_TRGM_INDEX)
+    return True
+
+def migrate_activity_logs_to_partitioned(conn: connection, interval: str,
+        batch_size: int = 10000, ahead: int = 3) -> None:
+    """
+    Converts an existing unpartitioned activity_logs table to a partitioned
+    one without taking the service down. A partitioned copy is created and
+    filled in short batches while a trigger mirrors concurrent writes into
+    it. The final swap only holds an exclusive lock for the duration of a few
+    renames. The old table is kept as activity_logs_unpartitioned and can be
+    dropped once the migration has been verified.
+
+    Args:
+        conn (connection): psql database connection handle.
+        interval (str): Partition width, either "month" or "year".
+        batch_size (int): Number of rows copied per transaction.
+        ahead (int): Number of upcoming partitions to create in advance.
+    """
+    if interval not in PARTITION_INTERVALS:
+        raise ValueError(f"Unsupported partition interval: {interval}")
+    if is_partitioned(conn, "activity_logs"):
+        print("Table \"activity_logs\" is already partitioned.")
+        return
+
+    with conn.cursor() as cur:
+        # Free up the index names so the partitioned table can take them.
+        cur.execute(GET_TABLE_INDEXES, ("activity_logs",))
+        for row in cur.fetchall():
+            cur.execute(f"ALTER INDEX {row['indexname']} "
+                        f"RENAME TO {row['indexname']}_unpartitioned;")
+        cur.execute(CREATE_MIGRATION_TABLE)
+        cur.execute(CREATE_DEFAULT_PARTITION.format(
+            parent="activity_logs_partitioned"))
+        cur.execute("SELECT min(timestamp) AS first FROM activity_logs;")
+        first = cur.fetchone()["first"]
+    conn.commit()
+    ensure_partitions(conn, interval, ahead,
+                      first.date() if first else None,
+                      parent="activity_logs_partitioned")
+    create_activity_logs_indexes(conn, "activity_logs_partitioned")
+    with conn.cursor() as cur:
+        cur.execute(CREATE_MIRROR_TRIGGER)
+        # Rows above this id are written after the trigger exists and are
+        # mirrored by it.
+        cur.execute("SELECT coalesce(max(id), 0) AS last FROM activity_logs;")
+        max_id = cur.fetchone()["last"]
+    conn.commit()
+
+    last_id = 0
+    while True:
+        with conn.cursor() as cur:
+            cur.execute(COPY_MIGRATION_BATCH, (last_id, max_id, batch_size))
+            batch = cur.fetchone()
+        conn.commit()
+        if not batch["copied"]:
+            break
+        last_id = batch["last_id"]
+        print(f"Copied activity_logs rows up to id {last_id} of {max_id}.")
+
+    with conn.cursor() as cur:
+        cur.execute(SWAP_MIGRATION_TABLES)
+        # In the swap transaction, so that no write to the new table goes
+        # unannounced or missing from change_log.
+        cur.execute(CREATE_NOTIFY_TRIGGER)
+        cur.execute(CREATE_CHANGE_LOG_FUNCTION)
+        cur.execute(CREATE_CHANGE_LOG_TRIGGERS.format(table="activity_logs"))
+    conn.commit()
+    print("Table \"activity_logs\" is now partitioned by "
+          f"{interval}. The old table is kept as activity_logs_unpartitioned.")
+
+def maintain_partitions(conn: connection,
+        interval: Optional[str] = None) -> None:
+    """
+    Creates upcoming activity_logs partitions if partitioning is configured
+    and the table is partitioned. Safe to call repeatedly.
+
+    Args:
+        conn (connection): psql database connection handle.
+        interval (Optional[str]): Partition width. Defaults to the
+            ACTIVITY_LOGS_PARTITION_INTERVAL environment variable.
+    """
+    interval = interval or os.getenv("ACTIVITY_LOGS_PARTITION_INTERVAL")
+    if is_sqlite(conn):
+        return
+    if interval and is_partitioned(conn, "activity_logs"):
+        ensure_partitions(conn, interval)
+
+def create_default_user(conn: connection) -> None:
+    """
+    Makes sure the default user exists. It owns all data created before
+    multi-user support and is used when no user is selected.
+
+    Args:
+        conn (connection): psql database connection handle.
+    """
+    with conn.cursor() as cur:
+        cur.execute(INSERT_DEFAULT_USER, (DEFAULT_USER_ID,))
+        if not is_sqlite(conn):
+            # The explicit id bypassed the sequence; move it past the row.
+            cur.execute("""
+                SELECT setval('users_id_seq',
+                              GREATEST((SELECT max(id) FROM users), 1));
+            """)
+    conn.commit()
+
+def initialize_sqlite_schema(conn) -> None:
+    """
+    SQLite counterpart of initialize_schema. Partitioning and BRIN indexes
+    are Postgres features; a plain (activity_type_id, timestamp) index serves
+    the same range reads.
+
+    Args:
+        conn (connection): SqliteConnection handle.
+    """
+    create_table(conn, "users", sqlite_backend.CREATE_USERS_TABLE)
+    add_column(conn, "users", "password_hash", ADD_USERS_PASSWORD)
+    create_default_user(conn)
+    create_table(conn, "unit_groups", sqlite_backend.CREATE_UNIT_GROUPS_TABLE)
+    create_table(conn, "units", sqlite_backend.CREATE_UNITS_TABLE)
+    create_table(conn, "activity_types",
+                 sqlite_backend.CREATE_ACTIVITY_TYPES_TABLE)
+    if not column_exists(conn, "activity_types", "user_id"):
+        sqlite_backend.rebuild_activity_types_with_user(conn)
+    create_table(conn, "activity_logs",
+                 sqlite_backend.CREATE_ACTIVITY_LOGS_TABLE)
+    add_column(conn, "activity_logs", "user_id",
+               sqlite_backend.ADD_ACTIVITY_LOGS_USER)
+    add_column(conn, "activity_logs", "tags",
+               sqlite_backend.ADD_ACTIVITY_LOGS_ANNOTATIONS)
+    create_index(conn, "one_canonical_per_group",
+                 sqlite_backend.UNIQUE_INDEX_RULE)
+    create_index(conn, "activity_logs_user_type_timestamp",
+                 sqlite_backend.ACTIVITY_LOGS_USER_INDEX)
+    apply_app_timezone(conn)
+    create_index(conn, "activity_logs_user_type_local_day",
+                 sqlite_backend.ACTIVITY_LOGS_LOCAL_DAY_INDEX)
+    create_table(conn, "change_log", sqlite_backend.CREATE_CHANGE_LOG_TABLE)
+    add_column(conn, "change_log", "origin",
+               sqlite_backend.ADD_CHANGE_LOG_ORIGIN)
+    create_change_log_triggers(conn)
+
+def initialize_schema(conn, partition_interval: Optional[str] = None) \
+        -> None:
     """
     Ensures that all required tables exist. It should be called once at
     service initialization step.
 
     Args:
         conn (connection): psql connection handle.
+        partition_interval (Optional[str]): "month" or "year" to create
+            activity_logs as a table range partitioned by timestamp. Defaults
+            to the ACTIVITY_LOGS_PARTITION_INTERVAL environment variable. An
+            existing unpartitioned table is left alone; convert it with
+            migrate_activity_logs_to_partitioned.
     """
+    if is_sqlite(conn):
+        initialize_sqlite_schema(conn)
+        return
+
+    partition_interval = partition_interval \
+            or os.getenv("ACTIVITY_LOGS_PARTITION_INTERVAL")
+    if partition_interval and partition_interval not in PARTITION_INTERVALS:
+        raise ValueError(
+                f"Unsupported partition interval: {partition_interval}")
 
+    create_table(conn, "users", CREATE_USERS_TABLE)
+    add_column(conn, "users", "password_hash", ADD_USERS_PASSWORD)
+    create_default_user(conn)
     create_table(conn, "unit_groups", CREATE_UNIT_GROUPS_TABLE)
     create_table(conn, "units", CREATE_UNITS_TABLE)
     create_table(conn, "activity_types", CREATE_ACTIVITY_TYPES_TABLE)
-    create_table(conn, "activity_logs", CREATE_ACTIVITY_LOGS_TABLE)
+    add_column(conn, "activity_types", "user_id", ADD_ACTIVITY_TYPES_USER)
+    if partition_interval:
+        create_table(conn, "activity_logs",
+                     CREATE_PARTITIONED_ACTIVITY_LOGS_TABLE)
+        if is_partitioned(conn, "activity_logs"):
+            create_table(conn, DEFAULT_PARTITION,
+                         CREATE_DEFAULT_PARTITION.format(
+                             parent="activity_logs"))
+            ensure_partitions(conn, partition_interval)
+        else:
+            print("Table \"activity_logs\" is not partitioned. Use "
+                  "migrate_activity_logs_to_partitioned to convert it.")
+    else:
+        create_table(conn, "activity_logs", CREATE_ACTIVITY_LOGS_TABLE)
+    add_column(conn, "activity_logs", "user_id", ADD_ACTIVITY_LOGS_USER)
+    add_column(conn, "activity_logs", "tags", ADD_ACTIVITY_LOGS_ANNOTATIONS)
+    migrate_timestamps_to_timestamptz(conn)
+    apply_app_timezone(conn)
     create_index(conn, "one_canonical_per_group", UNIQUE_INDEX_RULE)
+    create_activity_logs_indexes(conn)
+    create_notify_trigger(conn)
+    create_table(conn, "change_log", CREATE_CHANGE_LOG_TABLE)
+    add_column(conn, "change_log", "origin", ADD_CHANGE_LOG_ORIGIN)
+    create_change_log_triggers(conn)
+    create_trigram_indexes(conn)
 
 # EOF
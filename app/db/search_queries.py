@@ -0,0 +1,146 @@
+# -*- coding: utf-8 -*-
+"""
+app/db/search_queries.py
+
+Typeahead search over activity type and unit names. With the pg_trgm
+extension installed, names are matched fuzzily through trigram indexes and
+ranked by similarity, so typos and partial words still find them.
+Without it (and on SQLite) names are matched by case-insensitive substring,
+prefix matches first.
+"""
+
+# Built-in module imports
+from typing import Any, Dict, List, Optional, Tuple
+from weakref import WeakKeyDictionary
+
+# 3rd party module imports
+from psycopg2.extensions import connection
+
+# local module imports
+from app.db.connection import read_only
+from app.db.sqlite_backend import is_sqlite
+
+# Number of matches returned by default.
+SEARCH_LIMIT = 20
+
+TRIGRAM_INSTALLED = """
+SELECT EXISTS (
+    SELECT 1 FROM pg_extension WHERE extname = 'pg_trgm'
+) AS installed;
+"""
+
+# % is true when name and query share enough trigrams, which tolerates
+# typos. ILIKE catches substrings of longer names. Both are answered by the
+# gin_trgm_ops indexes.
+FUZZY_SEARCH_ACTIVITY_TYPES = """
+SELECT id, name, unit_group_id, goal_quantity
+FROM activity_types
+WHERE user_id = %s
+    AND (name %% %s OR name ILIKE %s ESCAPE '\\')
+ORDER BY similarity(name, %s) DESC, name
+LIMIT %s;
+"""
+FUZZY_SEARCH_UNITS = """
+SELECT id, name, group_id, factor, shift, is_canonical
+FROM units
+WHERE (%s::integer IS NULL OR group_id = %s)
+    AND (name %% %s OR name ILIKE %s ESCAPE '\\')
+ORDER BY similarity(name, %s) DESC, name
+LIMIT %s;
+"""
+SUBSTRING_SEARCH_ACTIVITY_TYPES = """
+SELECT id, name, unit_group_id, goal_quantity
+FROM activity_types
+WHERE user_id = %s
+    AND lower(name) LIKE %s ESCAPE '\\'
+ORDER BY lower(name) LIKE %s ESCAPE '\\' DESC, name
+LIMIT %s;
+"""
+SUBSTRING_SEARCH_UNITS = """
+SELECT id, name, group_id, factor, shift, is_canonical
+FROM units
+WHERE (%s IS NULL OR group_id = %s)
+    AND lower(name) LIKE %s ESCAPE '\\'
+ORDER BY lower(name) LIKE %s ESCAPE '\\' DESC, name
+LIMIT %s;
+"""
+
+# Whether pg_trgm is installed, remembered per connection.
+_trigram_installed = WeakKeyDictionary()
+
+def trigram_search_available(conn: connection) -> bool:
+    """
+    Tells whether fuzzy trigram matching can be used on conn.
+
+    Args:
+        conn (connection): Handle for psql database connection.
+    """
+    if is_sqlite(conn):
+        return False
+    if conn not in _trigram_installed:
+        with conn.cursor() as cur:
+            cur.execute(TRIGRAM_INSTALLED)
+            _trigram_installed[conn] = cur.fetchone()["installed"]
+    return _trigram_installed[conn]
+
+def _like_patterns(text: str) -> Tuple[str, str]:
+    escaped = text.lower().replace("\\", "\\\\").replace("%", "\\%") \
+                          .replace("_", "\\_")
+    return f"%{escaped}%", f"{escaped}%"
+
+@read_only
+def search_activity_types(conn: connection, user_id: int, text: str,
+        limit: int = SEARCH_LIMIT) -> List[Dict[str, Any]]:
+    """
+    Finds the activity types of a user whose names best match text. An
+    empty text returns the first types by name.
+
+    Args:
+        conn (connection): Handle for psql database connection.
+        user_id (int): ID of the user owning the activity types.
+        text (str): Text typed so far.
+        limit (int): Maximum number of matches.
+
+    Returns:
+        List[Dict[str, Any]]: Matching activity_types rows, best first.
+    """
+    text = text.strip()
+    contains, prefix = _like_patterns(text)
+    with conn.cursor() as cur:
+        if text and trigram_search_available(conn):
+            cur.execute(FUZZY_SEARCH_ACTIVITY_TYPES,
+                        (user_id, text, contains, text, limit,))
+        else:
+            cur.execute(SUBSTRING_SEARCH_ACTIVITY_TYPES,
+                        (user_id, contains, prefix, limit,))
+        return cur.fetchall()
+
+@read_only
+def search_units(conn: connection, text: str,
+        group_id: Optional[int] = None, limit: int = SEARCH_LIMIT) \
+        -> List[Dict[str, Any]]:
+    """
+    Finds the units whose names best match text. An empty text returns the
+    first units by name.
+
+    Args:
+        conn (connection): Handle for psql database connection.
+        text (str): Text typed so far.
+        group_id (Optional[int]): Only search the units of this group.
+        limit (int): Maximum number of matches.
+
+    Returns:
+        List[Dict[str, Any]]: Matching units rows, best first.
+    """
+    text = text.strip()
+    contains, prefix = _like_patterns(text)
+    with conn.cursor() as cur:
+        if text and trigram_search_available(conn):
+            cur.execute(FUZZY_SEARCH_UNITS,
+                        (group_id, group_id, text, contains, text, limit,))
+        else:
+            cur.execute(SUBSTRING_SEARCH_UNITS,
+                        (group_id, group_id, contains, prefix, limit,))
+        return cur.fetchall()
+
+# EOF
@@ -0,0 +1,246 @@
+# -*- coding: utf-8 -*-
+"""
+app/db/snapshot.py
+
+Bulk data transfer with COPY. Rows are streamed into Postgres with
+COPY ... FROM STDIN instead of one INSERT per row, and whole tables are
+dumped to and restored from CSV snapshots the same way. The SQLite backend
+has no COPY; it falls back to executemany inside a single transaction.
+
+A snapshot is a directory holding one CSV file with a header per table.
+Snapshots are meant to be restored into the same kind of backend they were
+taken from. Archived activity logs are not part of them.
+"""
+
+# Built-in module imports
+import csv
+import io
+import json
+import os
+from datetime import datetime
+from typing import Any, Iterable, Iterator, List, Sequence
+
+# 3rd party module imports
+from psycopg2.extensions import TRANSACTION_STATUS_IDLE, connection
+
+# local module imports
+from app.db.events import record_write
+from app.db.sqlite_backend import is_sqlite, store_timestamp
+
+# Tables in the order their foreign keys allow them to be restored.
+SNAPSHOT_TABLES = ("users", "unit_groups", "units", "activity_types",
+                   "activity_logs")
+
+COPY_FROM_STDIN = """
+COPY {table} ({columns}) FROM STDIN WITH (FORMAT csv);
+"""
+COPY_TO_STDOUT = """
+COPY (SELECT * FROM {table} ORDER BY id)
+TO STDOUT WITH (FORMAT csv, HEADER);
+"""
+# Dumps read every table from one snapshot, so that a write committed while
+# dumping cannot leave logs whose activity type is missing from it. Must be
+# the first statement of the transaction.
+SET_SNAPSHOT_TRANSACTION = """
+SET TRANSACTION ISOLATION LEVEL REPEATABLE READ, READ ONLY;
+"""
+# Under WAL a read transaction keeps the snapshot of its first read.
+BEGIN_SNAPSHOT_TRANSACTION_SQLITE = """
+BEGIN;
+"""
+TRUNCATE_SNAPSHOT_TABLES = """
+TRUNCATE {tables} CASCADE;
+"""
+RESET_ID_SEQUENCE = """
+SELECT setval(pg_get_serial_sequence('{table}', 'id'),
+              GREATEST((SELECT max(id) FROM {table}), 1));
+"""
+
+class CsvStream(io.TextIOBase):
+    """
+    Read-only file object producing CSV text from an iterable of rows on
+    demand, so COPY can stream arbitrarily many rows in constant memory.
+
+    Args:
+        rows (Iterable[Sequence[Any]]): Rows to encode. None becomes an
+            empty field, which COPY reads as NULL.
+
+    Attributes:
+        error (Optional[Exception]): Exception raised while producing rows.
+            The driver only reports that the read failed, so callers can
+            re-raise this instead.
+    """
+
+    def __init__(self, rows: Iterable[Sequence[Any]]):
+        self.error = None
+        self._rows = iter(rows)
+        self._buffer = io.StringIO()
+        self._writer = csv.writer(self._buffer, lineterminator="\n")
+        self._pending = ""
+
+    def readable(self) -> bool:
+        return True
+
+    def read(self, size: int = -1) -> str:
+        while size < 0 or len(self._pending) < size:
+            try:
+                row = next(self._rows, None)
+            except Exception as e:
+                self.error = e
+                raise
+            if row is None:
+                break
+            self._writer.writerow(row)
+            self._pending += self._buffer.getvalue()
+            self._buffer.seek(0)
+            self._buffer.truncate()
+        if size < 0:
+            size = len(self._pending)
+        chunk, self._pending = self._pending[:size], self._pending[size:]
+        return chunk
+
+class _Counter:
+    def __init__(self, rows: Iterable[Sequence[Any]]):
+        self._rows = rows
+        self.count = 0
+
+    def __iter__(self) -> Iterator[Sequence[Any]]:
+        for row in self._rows:
+            self.count += 1
+            yield row
+
+def copy_rows(conn: connection, table: str, columns: Sequence[str],
+        rows: Iterable[Sequence[Any]]) -> int:
+    """
+    Appends rows to a table in one bulk transfer and commits.
+
+    Args:
+        conn (connection): Handle for psql database connection.
+        table (str): Table to load into.
+        columns (Sequence[str]): Columns the row values are for.
+        rows (Iterable[Sequence[Any]]): Row values, consumed lazily.
+
+    Returns:
+        int: Number of rows loaded.
+    """
+    counted = _Counter(rows)
+    stream = CsvStream(counted)
+    try:
+        with conn.cursor() as cur:
+            if is_sqlite(conn):
+                cur.executemany(
+                    f"INSERT INTO {table} ({', '.join(columns)}) "
+                    f"VALUES ({', '.join(['%s'] * len(columns))});",
+                    counted)
+            else:
+                cur.copy_expert(
+                    COPY_FROM_STDIN.format(table=table,
+                                           columns=", ".join(columns)),
+                    stream)
+    except Exception as e:
+        conn.rollback()
+        if stream.error is not None:
+            raise stream.error from e
+        raise
+    conn.commit()
+    record_write(table)
+    return counted.count
+
+def dump_snapshot(conn: connection, directory: str) -> List[str]:
+    """
+    Writes every table of the schema to <directory>/<table>.csv. All tables
+    are read from the same snapshot of the database.
+
+    Args:
+        conn (connection): Handle for psql database connection.
+        directory (str): Snapshot directory, created if needed.
+
+    Returns:
+        List[str]: Paths of the written files.
+    """
+    os.makedirs(directory, exist_ok=True)
+    paths = []
+    # Ends the open transaction, so that the dump runs in a new one.
+    conn.commit()
+    try:
+        with conn.cursor() as cur:
+            if is_sqlite(conn):
+                cur.execute(BEGIN_SNAPSHOT_TRANSACTION_SQLITE)
+            # Unless a caller holds an outer transaction open, whose
+            # isolation level can no longer be changed.
+            elif conn.get_transaction_status() == TRANSACTION_STATUS_IDLE:
+                cur.execute(SET_SNAPSHOT_TRANSACTION)
+        for table in SNAPSHOT_TABLES:
+            path = os.path.join(directory, f"{table}.csv")
+            with open(path, "w", newline="") as f, conn.cursor() as cur:
+                if is_sqlite(conn):
+                    cur.execute(f"SELECT * FROM {table} ORDER BY id;")
+                    writer = csv.writer(f, lineterminator="\n")
+                    writer.writerow([col[0] for col in cur.description])
+                    # Text arrays and timestamps go out in the form they
+                    # are stored in.
+                    writer.writerows(
+                        [_stored_form(value) for value in row.values()]
+                        for row in cur)
+                else:
+                    cur.copy_expert(COPY_TO_STDOUT.format(table=table), f)
+            paths.append(path)
+    except Exception:
+        conn.rollback()
+        raise
+    conn.commit()
+    return paths
+
+def restore_snapshot(conn: connection, directory: str) -> None:
+    """
+    Replaces the contents of every table with a snapshot written by
+    dump_snapshot. Everything happens in one transaction, so a failed
+    restore leaves the database unchanged.
+
+    Args:
+        conn (connection): Handle for psql database connection.
+        directory (str): Snapshot directory.
+    """
+    try:
+        with conn.cursor() as cur:
+            if is_sqlite(conn):
+                _restore_sqlite(cur, directory)
+            else:
+                cur.execute(TRUNCATE_SNAPSHOT_TABLES.format(
+                    tables=", ".join(SNAPSHOT_TABLES)))
+                for table in SNAPSHOT_TABLES:
+                    with open(os.path.join(directory, f"{table}.csv")) as f:
+                        # Columns are matched by the header, since migrated
+                        # tables may order their columns differently.
+                        columns = next(csv.reader([f.readline()]))
+                        cur.copy_expert(COPY_FROM_STDIN.format(
+                            table=table, columns=", ".join(columns)), f)
+                    cur.execute(RESET_ID_SEQUENCE.format(table=table))
+    except Exception:
+        conn.rollback()
+        raise
+    conn.commit()
+    for table in SNAPSHOT_TABLES:
+        record_write(table)
+
+def _stored_form(value: Any) -> Any:
+    if isinstance(value, list):
+        return json.dumps(value)
+    if isinstance(value, datetime):
+        return store_timestamp(value)
+    return value
+
+def _restore_sqlite(cur, directory: str) -> None:
+    for table in reversed(SNAPSHOT_TABLES):
+        cur.execute(f"DELETE FROM {table};")
+    for table in SNAPSHOT_TABLES:
+        with open(os.path.join(directory, f"{table}.csv"), newline="") as f:
+            reader = csv.reader(f)
+            columns = next(reader)
+            cur.executemany(
+                f"INSERT INTO {table} ({', '.join(columns)}) "
+                f"VALUES ({', '.join(['%s'] * len(columns))});",
+                ([value if value != "" else None for value in row]
+                 for row in reader))
+
+# EOF
@@ -0,0 +1,483 @@
+# -*- coding: utf-8 -*-
+"""
+app/db/sqlite_backend.py
+
+Embedded SQLite storage backend. It wraps a sqlite3 connection in the small
+subset of the psycopg2 connection/cursor interface that the query modules
+use, so every function in app/db/ works unchanged against either database.
+
+The query strings are written for Postgres. The handful of Postgres
+constructs they rely on are translated here before execution:
+    - %s placeholders become ? placeholders.
+    - "= ANY(%s)" becomes an IN over json_each, with the list parameter
+      passed as JSON.
+    - Row locking clauses (FOR UPDATE / FOR SHARE) are dropped, since SQLite
+      serializes writers anyway.
+    - Date-valued expressions are tagged so that they are returned as
+      datetime.date like psycopg2 does.
+    - Text arrays are stored as JSON arrays. "col @> %s::text[]" becomes a
+      containment test over json_each and the casts are dropped.
+    - ::timestamptz casts are dropped. Timestamps are stored as UTC text and
+      read back as aware datetimes in APP_TIMEZONE; local_day() is a Python
+      function.
+    - set_config() and current_setting() are Python functions over settings
+      of the connection, which last until the end of the transaction like
+      Postgres' transaction-local ones.
+"""
+
+# Built-in module imports
+import json
+import re
+import sqlite3
+import time
+from datetime import date, datetime, timezone
+from functools import lru_cache
+from typing import Any, Dict, Iterable, List, Optional
+
+# local module imports
+from app.db.events import process_origin
+from app.db.timezone import app_timezone, localize
+
+# Pragmas applied to every connection. WAL lets readers proceed while a write
+# is in progress, and with WAL synchronous=NORMAL is still crash safe.
+PRAGMAS = (
+    "PRAGMA journal_mode = WAL;",
+    "PRAGMA synchronous = NORMAL;",
+    "PRAGMA foreign_keys = ON;",
+    "PRAGMA busy_timeout = 5000;",
+    "PRAGMA temp_store = MEMORY;",
+    "PRAGMA cache_size = -65536;",
+    "PRAGMA mmap_size = 268435456;",
+)
+
+# Table creation strings
+
+CREATE_USERS_TABLE = """
+CREATE TABLE IF NOT EXISTS users (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    name TEXT UNIQUE NOT NULL,
+    password_hash TEXT
+);
+"""
+
+CREATE_UNIT_GROUPS_TABLE = """
+CREATE TABLE IF NOT EXISTS unit_groups (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    name TEXT UNIQUE NOT NULL
+);
+"""
+
+CREATE_UNITS_TABLE = """
+CREATE TABLE IF NOT EXISTS units (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    name TEXT UNIQUE NOT NULL,
+    group_id INTEGER NOT NULL REFERENCES unit_groups(id) ON DELETE CASCADE,
+    factor DOUBLE PRECISION NOT NULL CHECK (factor > 0),
+    shift DOUBLE PRECISION DEFAULT 0,
+    is_canonical BOOLEAN NOT NULL DEFAULT FALSE
+);
+"""
+
+CREATE_ACTIVITY_TYPES_TABLE = """
+CREATE TABLE IF NOT EXISTS activity_types (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    user_id INTEGER NOT NULL REFERENCES users(id) ON DELETE CASCADE,
+    name TEXT NOT NULL,
+    unit_group_id INTEGER NOT NULL REFERENCES unit_groups(id)
+        ON DELETE CASCADE,
+    goal_quantity DOUBLE PRECISION,
+    UNIQUE (user_id, name)
+);
+"""
+
+# Timestamps are stored as UTC ISO 8601 text, which sorts chronologically,
+# and tags as a JSON array, which the text_array converter turns into a list.
+CREATE_ACTIVITY_LOGS_TABLE = """
+CREATE TABLE IF NOT EXISTS activity_logs (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    user_id INTEGER NOT NULL REFERENCES users(id) ON DELETE CASCADE,
+    activity_type_id INTEGER NOT NULL REFERENCES activity_types(id),
+    canonical_quantity DOUBLE PRECISION NOT NULL,
+    timestamp TIMESTAMP NOT NULL
+        DEFAULT (strftime('%Y-%m-%d %H:%M:%f', 'now')),
+    notes TEXT,
+    tags TEXT_ARRAY NOT NULL DEFAULT '[]'
+);
+"""
+
+UNIQUE_INDEX_RULE = """
+CREATE UNIQUE INDEX one_canonical_per_group
+ON units(group_id)
+WHERE is_canonical = TRUE;
+"""
+
+# Also stands in for the Postgres BRIN index on timestamp.
+ACTIVITY_LOGS_USER_INDEX = """
+CREATE INDEX activity_logs_user_type_timestamp
+ON activity_logs (user_id, activity_type_id, timestamp);
+"""
+
+# Counterpart of the Postgres expression index for per-day aggregation. The
+# index has to be rebuilt when APP_TIMEZONE changes, see
+# schema.apply_app_timezone.
+ACTIVITY_LOGS_LOCAL_DAY_INDEX = """
+CREATE INDEX activity_logs_user_type_local_day
+ON activity_logs (user_id, activity_type_id, local_day(timestamp));
+"""
+
+# Counterpart of the Postgres change log. Writers are serialized, so entries
+# are committed in id order and txid stays 0. origin is filled in by the
+# triggers through the app_origin() function of the writing connection.
+CREATE_CHANGE_LOG_TABLE = """
+CREATE TABLE IF NOT EXISTS change_log (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    txid INTEGER NOT NULL DEFAULT 0,
+    changed_at TIMESTAMP NOT NULL
+        DEFAULT (strftime('%Y-%m-%d %H:%M:%f', 'now')),
+    table_name TEXT NOT NULL,
+    op TEXT NOT NULL,
+    row_id INTEGER,
+    user_id INTEGER,
+    data JSON,
+    origin TEXT
+);
+"""
+ADD_CHANGE_LOG_ORIGIN = """
+ALTER TABLE change_log ADD COLUMN origin TEXT;
+"""
+
+# Columns copied into change_log.data. SQLite triggers cannot serialize a
+# whole row. Tags are embedded as the JSON array they are stored as and
+# booleans as true/false, so that entries look like their Postgres ones.
+CHANGE_LOG_COLUMNS = {
+    "unit_groups": ("id", "name"),
+    "units": ("id", "name", "group_id", "factor", "shift", "is_canonical"),
+    "activity_types": ("id", "user_id", "name", "unit_group_id",
+                       "goal_quantity"),
+    "activity_logs": ("id", "user_id", "activity_type_id",
+                      "canonical_quantity", "timestamp", "notes", "tags"),
+}
+_CHANGE_LOG_JSON = {
+    "tags": "json({row}.tags)",
+    "is_canonical":
+        "json(CASE WHEN {row}.is_canonical THEN 'true' ELSE 'false' END)",
+}
+
+CHANGE_LOG_TRIGGER = """
+DROP TRIGGER IF EXISTS change_log_{table}_{op};
+CREATE TRIGGER change_log_{table}_{op}
+AFTER {op} ON {table}
+BEGIN
+    INSERT INTO change_log (table_name, op, row_id, user_id, data, origin)
+    VALUES ('{table}', {logged_op}, {row}.id, {user_id}, json_object({data}),
+            app_origin());
+END;
+"""
+
+# Deletes made while archiving are logged as ARCHIVE, as on Postgres.
+ARCHIVE_OP = """CASE WHEN current_setting('app.archiving', 1) = 'on'
+        THEN 'ARCHIVE' ELSE 'DELETE' END"""
+
+def change_log_triggers(table: str) -> str:
+    """
+    Returns the script (re)creating the change_log triggers of a table.
+    """
+    columns = CHANGE_LOG_COLUMNS[table]
+    triggers = []
+    for op, row in (("INSERT", "NEW"), ("UPDATE", "NEW"), ("DELETE", "OLD")):
+        data = ", ".join(
+            f"'{column}', " + _CHANGE_LOG_JSON.get(
+                column, "{row}." + column).format(row=row)
+            for column in columns)
+        triggers.append(CHANGE_LOG_TRIGGER.format(
+            table=table, op=op, row=row, data=data,
+            logged_op=ARCHIVE_OP if op == "DELETE" else f"'{op}'",
+            user_id=f"{row}.user_id" if "user_id" in columns else "NULL"))
+    return "".join(triggers)
+
+# Migration of single-user databases. SQLite cannot add a foreign key column
+# with a non-null default, nor drop a table constraint, so activity_types is
+# rebuilt while activity_logs only gains a plain column.
+ADD_ACTIVITY_LOGS_USER = """
+ALTER TABLE activity_logs ADD COLUMN user_id INTEGER NOT NULL DEFAULT 1;
+"""
+ADD_ACTIVITY_LOGS_ANNOTATIONS = """
+ALTER TABLE activity_logs ADD COLUMN notes TEXT;
+ALTER TABLE activity_logs ADD COLUMN tags TEXT_ARRAY NOT NULL DEFAULT '[]';
+"""
+REBUILD_ACTIVITY_TYPES = """
+CREATE TABLE activity_types_multiuser (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    user_id INTEGER NOT NULL REFERENCES users(id) ON DELETE CASCADE,
+    name TEXT NOT NULL,
+    unit_group_id INTEGER NOT NULL REFERENCES unit_groups(id)
+        ON DELETE CASCADE,
+    goal_quantity DOUBLE PRECISION,
+    UNIQUE (user_id, name)
+);
+INSERT INTO activity_types_multiuser
+    (id, user_id, name, unit_group_id, goal_quantity)
+SELECT id, 1, name, unit_group_id, goal_quantity FROM activity_types;
+DROP TABLE activity_types;
+ALTER TABLE activity_types_multiuser RENAME TO activity_types;
+"""
+
+TABLE_EXISTS = """
+SELECT EXISTS (
+    SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = ?
+) AS "exists";
+"""
+
+INDEX_EXISTS = """
+SELECT EXISTS (
+    SELECT 1 FROM sqlite_master WHERE type = 'index' AND name = ?
+) AS "exists";
+"""
+
+COLUMN_EXISTS = """
+SELECT EXISTS (
+    SELECT 1 FROM pragma_table_info(?) WHERE name = ?
+) AS "exists";
+"""
+
+_ANY = re.compile(r"=\s*ANY\(%s\)", re.IGNORECASE)
+_ROW_LOCK = re.compile(r"\s+FOR\s+(UPDATE|SHARE)\b", re.IGNORECASE)
+_DATE_ALIAS = re.compile(r"(\b(?:date|local_day)\([^()]*\))\s+AS\s+(\w+)",
+                         re.IGNORECASE)
+_ARRAY_CONTAINS = re.compile(r"([\w.]+)\s*@>\s*%s::text\[\]")
+_CASTS = re.compile(r"::(text\[\]|timestamptz)")
+
+def store_timestamp(value: datetime) -> str:
+    """
+    Returns the stored form of a datetime: UTC ISO 8601 text. Naive values
+    are wall time in APP_TIMEZONE.
+    """
+    return localize(value).astimezone(timezone.utc) \
+            .replace(tzinfo=None).isoformat(" ")
+
+def load_timestamp(text: str) -> datetime:
+    """
+    Reads a stored timestamp as an aware datetime in APP_TIMEZONE.
+    """
+    value = datetime.fromisoformat(text)
+    if value.tzinfo is None:
+        value = value.replace(tzinfo=timezone.utc)
+    return value.astimezone(app_timezone())
+
+def _local_day(text: Optional[str]) -> Optional[str]:
+    return None if text is None else load_timestamp(text).date().isoformat()
+
+sqlite3.register_adapter(datetime, store_timestamp)
+sqlite3.register_adapter(date, lambda value: value.isoformat())
+sqlite3.register_converter(
+    "timestamp", lambda value: load_timestamp(value.decode()))
+sqlite3.register_converter(
+    "date", lambda value: date.fromisoformat(value.decode()))
+sqlite3.register_converter("text_array", json.loads)
+sqlite3.register_converter("json", json.loads)
+
+@lru_cache(maxsize=256)
+def translate(sql: str) -> str:
+    """
+    Rewrites a Postgres flavoured query string for SQLite.
+
+    Args:
+        sql (str): Query string using %s placeholders.
+
+    Returns:
+        str: Equivalent SQLite query string.
+    """
+    sql = _ANY.sub("IN (SELECT value FROM json_each(%s))", sql)
+    sql = _ROW_LOCK.sub("", sql)
+    sql = _DATE_ALIAS.sub(r'\1 AS "\2 [date]"', sql)
+    sql = _ARRAY_CONTAINS.sub(
+        r"NOT EXISTS (SELECT 1 FROM json_each(%s) WHERE value NOT IN "
+        r"(SELECT value FROM json_each(\1)))", sql)
+    sql = _CASTS.sub("", sql)
+    return sql.replace("%s", "?").replace("%%", "%")
+
+def split_statements(sql: str) -> List[str]:
+    """
+    Splits a script into its statements. Semicolons inside string literals
+    and trigger bodies do not end a statement.
+    """
+    statements, current = [], ""
+    *pieces, rest = sql.split(";")
+    for piece in pieces:
+        current += piece + ";"
+        if sqlite3.complete_statement(current):
+            statements.append(current.strip())
+            current = ""
+    if (current + rest).strip():
+        statements.append((current + rest).strip())
+    return statements
+
+def _adapt(params: Iterable[Any]) -> tuple:
+    return tuple(json.dumps(p) if isinstance(p, (list, tuple)) else p
+                 for p in params)
+
+def _dict_row(cursor: sqlite3.Cursor, row: tuple) -> Dict[str, Any]:
+    return {col[0]: value for col, value in zip(cursor.description, row)}
+
+class SqliteCursor:
+    """
+    Cursor wrapper mimicking psycopg2's RealDictCursor.
+    """
+
+    def __init__(self, cursor: sqlite3.Cursor, conn: "SqliteConnection"):
+        self._cursor = cursor
+        self._conn = conn
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def __iter__(self):
+        return iter(self._cursor)
+
+    @property
+    def rowcount(self) -> int:
+        return self._cursor.rowcount
+
+    @property
+    def description(self):
+        return self._cursor.description
+
+    def _start_statement(self) -> None:
+        timeout = self._conn.statement_timeout
+        self._conn.deadline = None if timeout is None \
+                else time.monotonic() + timeout
+
+    def execute(self, sql: str, params: Optional[Iterable[Any]] = None):
+        self._start_statement()
+        if params is None:
+            # Like psycopg2, strings without parameters are sent verbatim.
+            # Several statements may be batched together. They run one by
+            # one in the current transaction, unlike with executescript,
+            # which commits it first.
+            for statement in split_statements(sql):
+                self._cursor.execute(statement)
+        else:
+            self._cursor.execute(translate(sql), _adapt(params))
+
+    def executemany(self, sql: str, params: Iterable[Iterable[Any]]):
+        self._start_statement()
+        self._cursor.executemany(translate(sql), (_adapt(p) for p in params))
+
+    def fetchone(self) -> Optional[Dict[str, Any]]:
+        return self._cursor.fetchone()
+
+    def fetchmany(self, size: int):
+        return self._cursor.fetchmany(size)
+
+    def fetchall(self):
+        return self._cursor.fetchall()
+
+    def close(self):
+        self._cursor.close()
+
+class SqliteConnection:
+    """
+    Connection wrapper exposing the parts of the psycopg2 connection
+    interface used by the query modules.
+    """
+
+    def __init__(self, path: str):
+        self._conn = sqlite3.connect(
+            path,
+            detect_types=sqlite3.PARSE_DECLTYPES | sqlite3.PARSE_COLNAMES,
+            check_same_thread=False,
+        )
+        self._conn.row_factory = _dict_row
+        # Part of an index expression, so it has to be deterministic and
+        # registered before any statement touches activity_logs.
+        self._conn.create_function("local_day", 1, _local_day,
+                                   deterministic=True)
+        # Called by the change_log triggers.
+        self._conn.create_function("app_origin", 0, process_origin)
+        self.settings: Dict[str, str] = {}
+        self._conn.create_function("set_config", 3, self._set_config)
+        self._conn.create_function("current_setting", 2,
+                                   self._current_setting)
+        for pragma in PRAGMAS:
+            self._conn.execute(pragma)
+        self.closed = 0
+        # Counterpart of Postgres' statement_timeout, in seconds. A statement
+        # running past it is interrupted with "OperationalError: interrupted".
+        self.statement_timeout = None
+        self.deadline = None
+        self._conn.set_progress_handler(self._past_deadline, 10000)
+
+    def _set_config(self, name: str, value: str, is_local: int) -> str:
+        self.settings[name] = value
+        return value
+
+    def _current_setting(self, name: str, missing_ok: int) -> Optional[str]:
+        return self.settings.get(name)
+
+    def _past_deadline(self) -> int:
+        return int(self.deadline is not None
+                   and time.monotonic() > self.deadline)
+
+    @property
+    def autocommit(self) -> bool:
+        return self._conn.isolation_level is None
+
+    @autocommit.setter
+    def autocommit(self, value: bool) -> None:
+        self._conn.isolation_level = None if value else ""
+
+    def cursor(self) -> SqliteCursor:
+        return SqliteCursor(self._conn.cursor(), self)
+
+    def commit(self) -> None:
+        self._conn.commit()
+        self.settings.clear()
+
+    def rollback(self) -> None:
+        self._conn.rollback()
+        self.settings.clear()
+
+    def close(self) -> None:
+        self._conn.close()
+        self.closed = 1
+
+def sqlite_connect(path: str) -> SqliteConnection:
+    """
+    Opens (and creates if needed) a SQLite database file.
+
+    Args:
+        path (str): Path of the database file.
+
+    Returns:
+        SqliteConnection: Handle usable with every app/db query function.
+    """
+    return SqliteConnection(path)
+
+def rebuild_activity_types_with_user(conn: SqliteConnection) -> None:
+    """
+    Rebuilds a single-user activity_types table with a user_id column,
+    assigning every existing type to the default user.
+
+    Args:
+        conn (SqliteConnection): SQLite database handle.
+    """
+    # Foreign keys have to be off while the referenced table is replaced;
+    # the pragma is ignored inside a transaction.
+    conn.commit()
+    conn._conn.execute("PRAGMA foreign_keys = OFF;")
+    try:
+        conn._conn.executescript(REBUILD_ACTIVITY_TYPES)
+    finally:
+        conn._conn.execute("PRAGMA foreign_keys = ON;")
+    print("Table \"activity_types\" rebuilt with a user_id column.")
+
+def is_sqlite(conn: Any) -> bool:
+    """
+    Tells whether a connection handle belongs to the SQLite backend.
+    """
+    return isinstance(conn, SqliteConnection)
+
+# EOF
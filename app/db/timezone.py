@@ -0,0 +1,55 @@
+# -*- coding: utf-8 -*-
+"""
+app/db/timezone.py
+
+The instance timezone (APP_TIMEZONE, an IANA name such as Europe/Berlin,
+default UTC). Log timestamps are stored as absolute points in time; days,
+and every naive datetime handed to the database, are taken in this zone.
+"""
+
+# Built-in module imports
+import os
+from datetime import date, datetime
+from functools import lru_cache
+from typing import Optional
+from zoneinfo import ZoneInfo
+
+@lru_cache(maxsize=8)
+def _zone(name: str) -> ZoneInfo:
+    return ZoneInfo(name)
+
+def app_timezone_name() -> str:
+    """
+    Returns the configured timezone name (APP_TIMEZONE).
+    """
+    return os.getenv("APP_TIMEZONE") or "UTC"
+
+def app_timezone() -> ZoneInfo:
+    """
+    Returns the configured timezone.
+    """
+    return _zone(app_timezone_name())
+
+def localize(value: Optional[datetime]) -> Optional[datetime]:
+    """
+    Makes a naive datetime aware by reading it as wall time in the app
+    timezone. Aware datetimes and None are returned unchanged.
+    """
+    if value is None or value.tzinfo is not None:
+        return value
+    return value.replace(tzinfo=app_timezone())
+
+def to_local(value: datetime) -> datetime:
+    """
+    Converts a datetime to the app timezone. Naive values are taken to be in
+    it already.
+    """
+    return localize(value).astimezone(app_timezone())
+
+def local_today() -> date:
+    """
+    Returns the current day in the app timezone.
+    """
+    return datetime.now(app_timezone()).date()
+
+# EOF
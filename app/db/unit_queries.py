@@ -11,6 +11,10 @@ from typing import Any, Dict, List, Optional
 # 3rd party module imports
 from psycopg2.extensions import connection
 
+# local module imports
+from app.db.connection import read_only
+from app.db.events import record_write
+
 # SQL strings for unit_groups table
 GET_UNIT_GROUP = """
 SELECT 
@@ -28,6 +32,12 @@ GET_ALL_UNIT_GROUPS = """
 SELECT id, name
 FROM unit_groups
 """
+GET_UNIT_GROUPS_BY_IDS = """
+SELECT id, name
+FROM unit_groups
+WHERE id = ANY(%s)
+ORDER BY id;
+"""
 INSERT_UNIT_GROUP = """
 INSERT INTO unit_groups (name)
 VALUES (%s)
@@ -53,6 +63,12 @@ GET_ALL_UNITS = """
 SELECT id, name, group_id, factor, shift, is_canonical
 FROM units;
 """
+GET_UNITS_BY_IDS = """
+SELECT id, name, group_id, factor, shift, is_canonical
+FROM units
+WHERE id = ANY(%s)
+ORDER BY id;
+"""
 GET_ALL_UNITS_BY_GROUP = """
 SELECT id, name, factor, shift, is_canonical
 FROM units
@@ -85,6 +101,7 @@ WHERE id = %s;
 """
 
 # Python wrappers for unit_groups table manipulation
+@read_only
 def get_unit_group(conn: connection, group_id: int) \
         -> Optional[Dict[str, Any]]:
     """
@@ -102,6 +119,7 @@ def get_unit_group(conn: connection, group_id: int) \
         cur.execute(GET_UNIT_GROUP, (group_id,))
         return cur.fetchone()
 
+@read_only
 def get_all_unit_groups(conn: connection) -> List[str]:
     """
     Fetches all unit groups from unit_groups table.
@@ -117,6 +135,24 @@ def get_all_unit_groups(conn: connection) -> List[str]:
         cur.execute(GET_ALL_UNIT_GROUPS)
         return cur.fetchall()
 
+@read_only
+def get_unit_groups_by_ids(conn: connection, group_ids: List[int]) \
+        -> List[Dict[str, Any]]:
+    """
+    Fetches several unit groups in one query.
+
+    Args:
+        conn (connection): Handle for psql database connection.
+        group_ids (List[int]): ids of the unit groups to fetch.
+
+    Returns:
+        List[Dict[str, Any]]: The matching unit groups ordered by id. Unknown
+            ids are skipped.
+    """
+    with conn.cursor() as cur:
+        cur.execute(GET_UNIT_GROUPS_BY_IDS, (list(group_ids),))
+        return cur.fetchall()
+
 def insert_unit_group(conn: connection, group_name: str,
         canonical_unit_name: str) -> int:
     """
@@ -146,6 +182,8 @@ def insert_unit_group(conn: connection, group_name: str,
         unit_id = cur.fetchone()["id"]
         cur.execute(SET_CANONICAL_UNIT, (unit_id,))
     conn.commit()
+    record_write("unit_groups")
+    record_write("units")
     return group_id
 
 def update_unit_group(conn: connection, group_id: int, name: str) -> None:
@@ -163,6 +201,7 @@ def update_unit_group(conn: connection, group_id: int, name: str) -> None:
             (name, group_id,)
         )
     conn.commit()
+    record_write("unit_groups")
 
 def delete_unit_group(conn: connection, group_id: int) -> None:
     """
@@ -175,8 +214,12 @@ def delete_unit_group(conn: connection, group_id: int) -> None:
     with conn.cursor() as cur:
         cur.execute(DELETE_UNIT_GROUP, (group_id,))
     conn.commit()
+    record_write("unit_groups")
+    record_write("units")
+    record_write("activity_types")
 
 # Python_wrappers for units table manipulation
+@read_only
 def get_unit(conn: connection, unit_id: int) -> Optional[Dict[str, Any]]:
     """
     Fetches a unit by ID from units table.
@@ -193,6 +236,7 @@ def get_unit(conn: connection, unit_id: int) -> Optional[Dict[str, Any]]:
         cur.execute(GET_UNIT, (unit_id,))
         return cur.fetchone()
 
+@read_only
 def get_all_units(conn: connection) -> List[Dict[str, Any]]:
     """
     Fetches all units from the units table.
@@ -209,6 +253,25 @@ def get_all_units(conn: connection) -> List[Dict[str, Any]]:
         cur.execute(GET_ALL_UNITS)
         return cur.fetchall()
 
+@read_only
+def get_units_by_ids(conn: connection, unit_ids: List[int]) \
+        -> List[Dict[str, Any]]:
+    """
+    Fetches several units in one query.
+
+    Args:
+        conn (connection): Handle for psql database connection.
+        unit_ids (List[int]): ids of the units to fetch.
+
+    Returns:
+        List[Dict[str, Any]]: The matching units ordered by id. Unknown ids
+            are skipped.
+    """
+    with conn.cursor() as cur:
+        cur.execute(GET_UNITS_BY_IDS, (list(unit_ids),))
+        return cur.fetchall()
+
+@read_only
 def get_all_units_by_group(conn: connection, group_id: int) \
         -> List[Dict[str, Any]]:
     """
@@ -250,6 +313,7 @@ def insert_unit(conn: connection, name: str, group_id: int,
         )
         unit_id = cur.fetchone()["id"]
     conn.commit()
+    record_write("units")
     return unit_id
 
 def update_unit(conn: connection, unit_id: int, name: str, group_id: int,
@@ -273,6 +337,7 @@ def update_unit(conn: connection, unit_id: int, name: str, group_id: int,
             (name, group_id, factor, shift, unit_id,)
         )
     conn.commit()
+    record_write("units")
 
 def delete_unit(conn: connection, unit_id: int) -> None:
     """
@@ -285,5 +350,6 @@ def delete_unit(conn: connection, unit_id: int) -> None:
     with conn.cursor() as cur:
         cur.execute(DELETE_UNIT, (unit_id,))
     conn.commit()
+    record_write("units")
 
 # EOF
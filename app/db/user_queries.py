@@ -0,0 +1,177 @@
+# -*- coding: utf-8 -*-
+"""
+app/db/user_queries.py
+
+All the psql queries for database transactions related to users.
+"""
+
+# Built-in module imports
+from typing import Any, Dict, List, Optional
+
+# 3rd party module imports
+from psycopg2.extensions import connection
+from werkzeug.security import check_password_hash, generate_password_hash
+
+# local module imports
+from app.db.connection import read_only
+from app.db.events import record_write
+
+# SQL strings for users table
+GET_USER = """
+SELECT id, name
+FROM users
+WHERE id = %s;
+"""
+GET_ALL_USERS = """
+SELECT id, name
+FROM users
+ORDER BY name;
+"""
+GET_PASSWORD_HASH = """
+SELECT password_hash
+FROM users
+WHERE id = %s;
+"""
+INSERT_USER = """
+INSERT INTO users (name, password_hash)
+VALUES (%s, %s)
+RETURNING id;
+"""
+SET_PASSWORD_HASH = """
+UPDATE users
+SET password_hash = %s
+WHERE id = %s;
+"""
+DELETE_USER = """
+DELETE FROM users
+WHERE id = %s;
+"""
+
+@read_only
+def get_user(conn: connection, user_id: int) -> Optional[Dict[str, Any]]:
+    """
+    Fetches a user by ID from users table.
+
+    Args:
+        conn (connection): Handle for psql database connection.
+        user_id (int): id of the user to fetch.
+
+    Returns:
+        Optional[Dict[str, Any]]: Dict object from RealDictCursor containing
+            the user record. None if no match is found.
+    """
+    with conn.cursor() as cur:
+        cur.execute(GET_USER, (user_id,))
+        return cur.fetchone()
+
+@read_only
+def get_all_users(conn: connection) -> List[Dict[str, Any]]:
+    """
+    Fetches all users from users table, ordered by name.
+
+    Args:
+        conn (connection): Handle for psql database connection.
+
+    Returns:
+        List[Dict[str, Any]]: List of RealDictCursor dict objects containing
+            the records from users table.
+    """
+    with conn.cursor() as cur:
+        cur.execute(GET_ALL_USERS)
+        return cur.fetchall()
+
+def insert_user(conn: connection, name: str,
+        password: Optional[str] = None) -> int:
+    """
+    Inserts a user into the users table.
+
+    Args:
+        conn (connection): Handle for psql database connection.
+        name (str): Unique name of the new user.
+        password (Optional[str]): Password required to select the user.
+            Without one, anyone can select the user.
+
+    Returns:
+        int: id assigned to the newly created user record.
+    """
+    password_hash = generate_password_hash(password) if password else None
+    with conn.cursor() as cur:
+        cur.execute(INSERT_USER, (name, password_hash))
+        user_id = cur.fetchone()["id"]
+    conn.commit()
+    record_write("users")
+    return user_id
+
+def delete_user(conn: connection, user_id: int) -> None:
+    """
+    Deletes a user together with all of their activity types and logs.
+
+    Args:
+        conn (connection): Handle for psql database connection.
+        user_id (int): id of the user to delete.
+    """
+    with conn.cursor() as cur:
+        cur.execute(DELETE_USER, (user_id,))
+    conn.commit()
+    record_write("users")
+    record_write("activity_types")
+    record_write("activity_logs")
+
+def set_user_password(conn: connection, user_id: int, password: str) \
+        -> bool:
+    """
+    Sets the password required to select a user.
+
+    Args:
+        conn (connection): Handle for psql database connection.
+        user_id (int): id of the user.
+        password (str): New password, not empty.
+
+    Returns:
+        bool: False if there is no such user.
+    """
+    with conn.cursor() as cur:
+        cur.execute(SET_PASSWORD_HASH,
+                    (generate_password_hash(password), user_id))
+        found = cur.rowcount == 1
+    conn.commit()
+    return found
+
+def is_password_protected(conn: connection, user_id: int) -> bool:
+    """
+    Tells whether selecting a user requires a password.
+
+    Args:
+        conn (connection): Handle for psql database connection.
+        user_id (int): id of the user.
+    """
+    with conn.cursor() as cur:
+        cur.execute(GET_PASSWORD_HASH, (user_id,))
+        row = cur.fetchone()
+    return row is not None and row["password_hash"] is not None
+
+def check_user_password(conn: connection, user_id: int,
+        password: Optional[str]) -> bool:
+    """
+    Checks the password given to select a user.
+
+    Args:
+        conn (connection): Handle for psql database connection.
+        user_id (int): id of the user.
+        password (Optional[str]): Password given.
+
+    Returns:
+        bool: True if the user exists and either has no password or the
+            given one matches it.
+    """
+    with conn.cursor() as cur:
+        cur.execute(GET_PASSWORD_HASH, (user_id,))
+        row = cur.fetchone()
+    if row is None:
+        return False
+    if row["password_hash"] is None:
+        return True
+    return bool(password) \
+        and check_password_hash(row["password_hash"], password)
+
+# EOF
@@ -0,0 +1,135 @@
+# -*- coding: utf-8 -*-
+"""
+app/export.py
+
+Columnar export of activity histories for offline analysis. Every activity
+type of a user is written as NumPy .npy files, one per column, which load
+instantly with np.load(path, mmap_mode="r") however long the history is:
+
+    <directory>/manifest.json
+    <directory>/activity_type_<id>/timestamp.npy           datetime64[us], UTC
+    <directory>/activity_type_<id>/canonical_quantity.npy  float64
+    <directory>/activity_type_<id>/quantity_<unit id>.npy  float64, one per
+                                                           unit of the group
+
+manifest.json lists the types with their name, row count and the units the
+quantity columns are in, and APP_TIMEZONE for telling local days apart. The
+files are filled batch by batch from a server-side cursor, so memory use
+does not grow with the history.
+"""
+
+# built-in module imports
+import json
+import os
+from datetime import datetime, timedelta, timezone
+from itertools import islice
+from typing import Any, Dict, List
+
+# 3rd party module imports
+import numpy as np
+from numpy.lib.format import open_memmap
+from psycopg2.extensions import connection
+
+# local module imports
+from app.db.activity_queries import STREAM_BATCH_SIZE, \
+        get_all_activity_types, iter_activity_series
+from app.db.timezone import app_timezone_name, localize
+from app.db.unit_queries import get_all_units_by_group
+
+MANIFEST = "manifest.json"
+EPOCH = datetime(1970, 1, 1, tzinfo=timezone.utc)
+MICROSECOND = timedelta(microseconds=1)
+
+def _column(path: str, dtype: str, rows: int) -> np.ndarray:
+    if rows == 0:
+        # An empty file cannot be mapped.
+        np.save(path, np.empty(0, dtype=dtype))
+        return np.empty(0, dtype=dtype)
+    return open_memmap(path, mode="w+", dtype=dtype, shape=(rows,))
+
+def export_activity_type(conn: connection, user_id: int,
+        activity_type: Dict[str, Any], directory: str) -> Dict[str, Any]:
+    """
+    Writes the columns of one activity type to <directory>/activity_type_<id>.
+
+    Args:
+        conn (connection): Handle for psql database connection.
+        user_id (int): ID of the user owning the activity type.
+        activity_type (Dict[str, Any]): The activity_types record.
+        directory (str): Export directory.
+
+    Returns:
+        Dict[str, Any]: The type's manifest entry.
+    """
+    type_dir = f"activity_type_{activity_type['id']}"
+    os.makedirs(os.path.join(directory, type_dir), exist_ok=True)
+    units = get_all_units_by_group(conn, activity_type["unit_group_id"])
+    rows, history = iter_activity_series(conn, user_id, activity_type["id"])
+
+    def column(name: str, dtype: str) -> np.ndarray:
+        return _column(os.path.join(directory, type_dir, f"{name}.npy"),
+                       dtype, rows)
+
+    timestamps = column("timestamp", "datetime64[us]")
+    quantities = column("canonical_quantity", "float64")
+    in_units = [(unit["factor"], column(f"quantity_{unit['id']}",
+                                        "float64"))
+                for unit in units]
+    written = 0
+    while batch := list(islice(history, STREAM_BATCH_SIZE)):
+        end = written + len(batch)
+        # Exact integer microseconds; float timestamps can be off by one.
+        timestamps[written:end] = np.array(
+            [(localize(row["timestamp"]) - EPOCH) // MICROSECOND
+             for row in batch], dtype="int64").view("datetime64[us]")
+        quantities[written:end] = [row["canonical_quantity"]
+                                   for row in batch]
+        for factor, values in in_units:
+            values[written:end] = quantities[written:end] / factor
+        written = end
+    for values in [timestamps, quantities] + [v for _, v in in_units]:
+        if isinstance(values, np.memmap):
+            values.flush()
+    if written != rows:
+        raise RuntimeError(f"Expected {rows} logs of activity type "
+                           f"{activity_type['id']}, read {written}.")
+
+    return {
+        "id": activity_type["id"],
+        "name": activity_type["name"],
+        "directory": type_dir,
+        "rows": rows,
+        "units": {str(unit["id"]): unit["name"] for unit in units},
+        "canonical_unit_id": next((unit["id"] for unit in units
+                                   if unit["is_canonical"]), None),
+    }
+
+def export_history(conn: connection, user_id: int, directory: str) \
+        -> List[Dict[str, Any]]:
+    """
+    Exports every activity type of a user and writes the manifest last, so
+    a directory with a manifest holds a complete export.
+
+    Args:
+        conn (connection): Handle for psql database connection.
+        user_id (int): ID of the user whose history is exported.
+        directory (str): Export directory, created if needed.
+
+    Returns:
+        List[Dict[str, Any]]: The manifest entries of the exported types.
+    """
+    os.makedirs(directory, exist_ok=True)
+    manifest = os.path.join(directory, MANIFEST)
+    if os.path.exists(manifest):
+        os.remove(manifest)
+    activity_types = sorted(get_all_activity_types(conn, user_id),
+                            key=lambda row: row["id"])
+    entries = [export_activity_type(conn, user_id, activity_type, directory)
+               for activity_type in activity_types]
+    conn.commit()
+    with open(manifest, "w") as f:
+        json.dump({"user_id": user_id, "timezone": app_timezone_name(),
+                   "activity_types": entries}, f, indent=2)
+    return entries
+
+# EOF
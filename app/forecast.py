@@ -0,0 +1,139 @@
+# -*- coding: utf-8 -*-
+"""
+app/forecast.py
+
+Year-end pace forecasts for activity goals. The daily totals of the recent
+window are fitted with a least squares trend line, and the line is summed
+over the rest of the year. The design matrix is the same for every activity
+type, so all types are fitted in one batch of matrix operations.
+"""
+
+# Built-in module imports
+from datetime import date, datetime, timedelta
+from typing import Any, Dict, List, Optional
+
+# 3rd party module imports
+import numpy as np
+from psycopg2.extensions import connection
+
+# local module imports
+from app.db.activity_queries import get_all_activity_types, \
+        get_daily_totals_by_type
+from app.cache import ResultCache
+from app.db.timezone import local_today
+from app.db.unit_queries import get_all_units
+
+# Number of full days before today that the trend is fitted on.
+WINDOW_DAYS = 56
+# Two-sided 90% band under a normal approximation.
+CONFIDENCE_Z = 1.645
+
+def fit_trends(daily: np.ndarray, remaining_days: int) -> tuple:
+    """
+    Fits y = a + b * t to each row of daily totals (t = 0 .. window - 1) and
+    projects the sum over the remaining_days that follow today (t = window).
+
+    Args:
+        daily (np.ndarray): Daily totals, shape (types, window).
+        remaining_days (int): Number of days after today left in the year.
+
+    Returns:
+        tuple: (projected, spread) arrays of shape (types,), the projected
+            remaining total and the half width of its confidence band.
+    """
+    types, window = daily.shape
+    if remaining_days == 0:
+        return np.zeros(types), np.zeros(types)
+    t = np.arange(window, dtype=np.float64)
+    design = np.column_stack((np.ones(window), t))
+    inverse = np.linalg.inv(design.T @ design)
+    coefficients = inverse @ design.T @ daily.T
+    residuals = daily - (design @ coefficients).T
+    variance = (residuals ** 2).sum(axis=1) / (window - 2)
+
+    future = np.arange(window + 1, window + 1 + remaining_days,
+                       dtype=np.float64)
+    # Summing the line over the future days is the dot product of the
+    # coefficients with x = (number of days, sum of their t).
+    x = np.array([remaining_days, future.sum()])
+    projected = x @ coefficients
+    # Uncertainty of the fitted line plus the noise of each future day.
+    spread = CONFIDENCE_Z * np.sqrt(variance * (remaining_days
+                                                + x @ inverse @ x))
+    return projected, spread
+
+def forecast_all(conn: connection, user_id: int,
+        today: Optional[date] = None) -> List[Dict[str, Any]]:
+    """
+    Projects the year-end total of every activity type of a user that has a
+    goal.
+
+    Args:
+        conn (connection): Handle for psql database connection.
+        user_id (int): ID of the user whose goals are forecast.
+        today (Optional[date]): Day to forecast from. Defaults to today.
+
+    Returns:
+        List[Dict[str, Any]]: One record per activity type with the year to
+            date total, the projected year-end total, the low/high band and
+            whether the goal is on track, all in canonical units.
+    """
+    today = today or local_today()
+    year_start = date(today.year, 1, 1)
+    window_start = today - timedelta(days=WINDOW_DAYS)
+    activity_types = [act for act in get_all_activity_types(conn, user_id)
+                      if act["goal_quantity"] is not None]
+    if not activity_types:
+        return []
+    canonical_units = {unit["group_id"]: unit["name"]
+                       for unit in get_all_units(conn) if unit["is_canonical"]}
+    totals = get_daily_totals_by_type(
+        conn,
+        user_id,
+        datetime.combine(min(year_start, window_start), datetime.min.time()),
+        datetime.combine(today + timedelta(days=1), datetime.min.time()),
+    )
+
+    daily = np.zeros((len(activity_types), WINDOW_DAYS))
+    year_to_date = np.zeros(len(activity_types))
+    for row, act in enumerate(activity_types):
+        for day, total in totals.get(act["id"], {}).items():
+            if window_start <= day < today:
+                daily[row, (day - window_start).days] = total
+            if day >= year_start:
+                year_to_date[row] += total
+
+    remaining_days = (date(today.year, 12, 31) - today).days
+    projected, spread = fit_trends(daily, remaining_days)
+    projected = year_to_date + np.maximum(projected, 0)
+    low = np.maximum(projected - spread, year_to_date)
+    high = projected + spread
+    return [
+        {
+            "activity_type_id": act["id"],
+            "name": act["name"],
+            "unit_name": canonical_units.get(act["unit_group_id"]),
+            "goal_quantity": act["goal_quantity"],
+            "year_to_date": float(year_to_date[row]),
+            "projected": float(projected[row]),
+            "low": float(low[row]),
+            "high": float(high[row]),
+            "on_track": bool(projected[row] >= act["goal_quantity"]),
+        }
+        for row, act in enumerate(activity_types)
+    ]
+
+def cached_forecasts(conn: connection, user_id: int,
+        cache: ResultCache) -> List[Dict[str, Any]]:
+    """
+    Returns the forecasts of a user from cache, recomputing them only after
+    the user's logs or the activity types changed, or the day rolled over.
+
+    Args:
+        conn (connection): Handle for psql database connection.
+        user_id (int): ID of the user whose goals are forecast.
+        cache (ResultCache): The app's result cache.
+    """
+    return cache.call(forecast_all, conn, user_id, local_today())
+
+# EOF
@@ -0,0 +1,127 @@
+# -*- coding: utf-8 -*-
+"""
+app/heatmap.py
+
+Calendar heatmaps: the total logged per day of one year, for one activity
+type, with days taken in APP_TIMEZONE. Each year is kept as a fixed array of
+366 floats (index = day of the year - 1) that is built with one daily totals
+query on first use and then patched in place from the rows every log insert,
+update and delete reports (see events.record_write), so serving a heatmap
+never touches the database again. Writes that do not say which rows they
+changed drop the cached years.
+"""
+
+# built-in module imports
+import threading
+from datetime import date, datetime
+from typing import Any, Dict, List, Optional
+
+# 3rd party module imports
+import numpy as np
+from psycopg2.extensions import connection
+
+# local module imports
+from app.cache import LRUCache
+from app.db.activity_queries import get_daily_totals
+from app.db.events import Change, data_version, stable_version
+from app.db.timezone import to_local
+
+DAYS_PER_YEAR = 366
+# Tables whose writes can change daily totals. Deleting an activity type or
+# a user deletes their logs without reporting them.
+SOURCE_TABLES = ("activity_logs", "activity_types", "users")
+
+def day_index(day: date) -> int:
+    """
+    Returns the position of a day in its year's array.
+    """
+    return day.timetuple().tm_yday - 1
+
+class HeatmapCache:
+    """
+    Per-day totals of (user, activity type, year), in canonical units.
+
+    Args:
+        max_entries (int): Number of years kept, least recently used ones
+            are evicted first. Each takes 366 * 8 bytes.
+    """
+
+    def __init__(self, max_entries: int):
+        self.entries = LRUCache(max_entries)
+        # Serializes patches of the arrays with each other and with
+        # inserting freshly built arrays.
+        self._lock = threading.Lock()
+
+    def year(self, conn: connection, user_id: int, activity_type_id: int,
+            year: int) -> np.ndarray:
+        """
+        Returns the daily totals of a year. The array is shared with the
+        cache; do not modify it.
+
+        Args:
+            conn (connection): Handle for psql database connection.
+            user_id (int): ID of the user owning the activity type.
+            activity_type_id (int): ID of the activity type.
+            year (int): Calendar year.
+
+        Returns:
+            np.ndarray: 366 daily totals. The last one is always 0 outside
+                leap years.
+        """
+        key = (user_id, activity_type_id, year)
+        days = self.entries.get(key)
+        if days is not None:
+            return days
+
+        version = stable_version(*SOURCE_TABLES)
+        days = np.zeros(DAYS_PER_YEAR)
+        totals = get_daily_totals(conn, user_id, activity_type_id,
+                                  datetime(year, 1, 1),
+                                  datetime(year + 1, 1, 1))
+        for day, total in totals.items():
+            days[day_index(day)] = total
+        with self._lock:
+            # Totals read while a write ran may or may not contain it, so
+            # patching them could count it twice or not at all.
+            if version is not None \
+                    and data_version(*SOURCE_TABLES) == version:
+                self.entries.put(key, days)
+        return days
+
+    def apply(self, table: str, changes: Optional[List[Change]],
+            external: bool = False) -> None:
+        """
+        Write callback (see events.on_write): patches the cached years with
+        the changed logs, or drops every cached year when the changed rows
+        are unknown. The years touched by a write of another process are
+        dropped instead, since they may have been read after it committed.
+        """
+        if table not in SOURCE_TABLES:
+            return
+        if table != "activity_logs" or changes is None:
+            self.entries.clear()
+            return
+        if external:
+            for change in changes:
+                for log in change:
+                    if log is not None:
+                        self.entries.pop((log["user_id"],
+                                          log["activity_type_id"],
+                                          to_local(log["timestamp"]).year))
+            return
+        with self._lock:
+            for old, new in changes:
+                if old is not None:
+                    self._add(old, -1.0)
+                if new is not None:
+                    self._add(new, 1.0)
+
+    def _add(self, log: Dict[str, Any], sign: float) -> None:
+        timestamp = to_local(log["timestamp"])
+        days = self.entries.get((log["user_id"], log["activity_type_id"],
+                                 timestamp.year))
+        if days is not None:
+            days[day_index(timestamp.date())] += \
+                    sign * log["canonical_quantity"]
+
+# EOF
@@ -0,0 +1,122 @@
+# -*- coding: utf-8 -*-
+"""
+app/importer.py
+
+Imports activity logs from CSV exports of other apps. A JSON mapping config
+says where each field comes from, either a CSV column or a fixed value:
+
+    {
+        "delimiter": ",",
+        "activity_type": {"column": "Type", "values": {"Ride": "cycling"}},
+        "quantity": {"column": "Distance"},
+        "unit": {"value": "km"},
+        "timestamp": {"column": "Date", "format": "%Y-%m-%d %H:%M:%S"}
+    }
+
+Activity types are matched by name among the user's types ("values"
+optionally renames CSV values first) and units by name among all units.
+Quantities are converted to the canonical unit of the activity type. The
+rows are streamed into activity_logs with COPY.
+"""
+
+# Built-in module imports
+import csv
+import json
+from datetime import datetime
+from typing import Any, Dict, Iterator, Optional
+
+# 3rd party module imports
+from psycopg2.extensions import connection
+
+# local module imports
+from app.db.activity_queries import get_all_activity_types
+from app.db.snapshot import copy_rows
+from app.db.unit_queries import get_all_units
+
+LOG_COLUMNS = ("user_id", "activity_type_id", "canonical_quantity",
+               "timestamp")
+REQUIRED_FIELDS = ("activity_type", "quantity", "unit", "timestamp")
+
+def load_config(path: str) -> Dict[str, Any]:
+    """
+    Reads and checks a mapping config file.
+
+    Args:
+        path (str): Path of the JSON config.
+
+    Returns:
+        Dict[str, Any]: The parsed config.
+    """
+    with open(path) as f:
+        config = json.load(f)
+    for field in REQUIRED_FIELDS:
+        spec = config.get(field)
+        if not isinstance(spec, dict) \
+                or ("column" in spec) == ("value" in spec):
+            raise ValueError(f"Config field '{field}' needs either a "
+                             "'column' or a 'value'.")
+    return config
+
+def _field(config: Dict[str, Any], field: str,
+        record: Dict[str, str]) -> Optional[str]:
+    spec = config[field]
+    if "value" in spec:
+        return spec["value"]
+    value = record.get(spec["column"])
+    return spec.get("values", {}).get(value, value)
+
+def _log_rows(user_id: int, path: str, config: Dict[str, Any],
+        activity_types: Dict[str, Dict[str, Any]],
+        units: Dict[str, Dict[str, Any]]) -> Iterator[tuple]:
+    timestamp_format = config["timestamp"].get("format")
+
+    with open(path, newline="") as f:
+        reader = csv.DictReader(f, delimiter=config.get("delimiter", ","))
+        for record in reader:
+            line = reader.line_num
+            type_name = _field(config, "activity_type", record)
+            unit_name = _field(config, "unit", record)
+            activity_type = activity_types.get(type_name)
+            unit = units.get(unit_name)
+            if activity_type is None:
+                raise ValueError(f"Line {line}: unknown activity type "
+                                 f"'{type_name}'.")
+            if unit is None \
+                    or unit["group_id"] != activity_type["unit_group_id"]:
+                raise ValueError(f"Line {line}: unit '{unit_name}' does not "
+                                 f"measure '{type_name}'.")
+            raw_timestamp = _field(config, "timestamp", record)
+            try:
+                quantity = float(_field(config, "quantity", record))
+                timestamp = (
+                    datetime.strptime(raw_timestamp, timestamp_format)
+                    if timestamp_format
+                    else datetime.fromisoformat(raw_timestamp))
+            except (TypeError, ValueError) as e:
+                raise ValueError(f"Line {line}: {e}") from e
+            yield (user_id, activity_type["id"], quantity * unit["factor"],
+                   timestamp)
+
+def import_csv(conn: connection, user_id: int, path: str,
+        config: Dict[str, Any]) -> int:
+    """
+    Imports every row of a CSV file as an activity log of a user. Nothing is
+    imported if any row is invalid.
+
+    Args:
+        conn (connection): Handle for psql database connection.
+        user_id (int): ID of the user the logs belong to.
+        path (str): Path of the CSV file.
+        config (Dict[str, Any]): Mapping config, see load_config.
+
+    Returns:
+        int: Number of imported logs.
+    """
+    # Looked up before the COPY starts; no other query can run during it.
+    activity_types = {act["name"]: act
+                      for act in get_all_activity_types(conn, user_id)}
+    units = {unit["name"]: unit for unit in get_all_units(conn)}
+    return copy_rows(conn, "activity_logs", LOG_COLUMNS,
+                     _log_rows(user_id, path, config, activity_types, units))
+
+# EOF
@@ -4,16 +4,33 @@ app/interface.py
 This module controls and provides the rendering of the web app that is served
 to the user.
 """
+# built-in module imports
+import os
+from datetime import date
+
 # 3rd party module imports
 from flask import Flask, render_template, request
 
 # local module imports
-from app.db.connection import db_connect, db_close
-from app.db.schema import initialize_schema
+from app.budget import request_db, time_budget
+from app.cache import FragmentCache, ResultCache, template_bytecode_cache
+from app.db.change_queries import ExternalWrites
+from app.db.connection import ConnectionPool, db_connect, db_close, \
+        listen_connect
+from app.db.events import on_write
+from app.db.schema import initialize_schema, maintain_partitions
+from app.db.sqlite_backend import is_sqlite
+from app.forecast import cached_forecasts
+from app.heatmap import HeatmapCache
+from app.live import ChangeFeed
+from app.profiler import install_profiler
 from app.routes.units import units_bp
 from app.routes.unit_groups import unit_groups_bp
 from app.routes.activity_types import activity_types_bp
 from app.routes.activity_logs import activity_logs_bp
+from app.routes.api import api_bp
+from app.routes.reference_data import reference_data_bp
+from app.routes.users import current_user_id, require_user, users_bp
 
 def create_app() -> Flask:
     """
@@ -24,28 +41,104 @@ def create_app() -> Flask:
         Flask app object
     """
     app = Flask(__name__)
+    install_profiler(app)
+    # Signs the session cookie that remembers the selected user.
+    app.secret_key = os.getenv("SECRET_KEY")
+    if not app.secret_key:
+        raise RuntimeError("SECRET_KEY is not set; sessions cannot be "
+                           "signed without it.")
+    app.jinja_options = {**app.jinja_options,
+                         "bytecode_cache": template_bytecode_cache()}
+    app.fragment_cache = FragmentCache(
+            int(os.getenv("FRAGMENT_CACHE_BYTES", str(4 * 1024 * 1024))))
     app.register_blueprint(units_bp, url_prefix="/units")
     app.register_blueprint(unit_groups_bp, url_prefix="/unit_groups")
     app.register_blueprint(activity_types_bp, url_prefix="/activity_types")
     app.register_blueprint(activity_logs_bp, url_prefix="/activity_logs")
+    app.register_blueprint(reference_data_bp, url_prefix="/reference_data")
+    app.register_blueprint(users_bp, url_prefix="/users")
+    app.register_blueprint(api_bp, url_prefix="/api/v1")
     try:
         app.db = db_connect()
         initialize_schema(app.db)
     except Exception as e:
         raise RuntimeError("Database connection failed") from e
-    print("Connection opened for postgreSQL database")
+    print("Connection opened for database")
+    # Connections of their own for requests running under a time budget.
+    app.db_pool = ConnectionPool(db_connect,
+                                 int(os.getenv("DB_POOL_SIZE", "8")))
+
+    # Live updates for open dashboards, see app/live.py.
+    if is_sqlite(app.db):
+        feed = ChangeFeed()
+
+        def publish_log_write(table, changes, external):
+            if table == "activity_logs":
+                feed.publish({"op": "WRITE"})
+
+        on_write(publish_log_write)
+    else:
+        feed = ChangeFeed(listen_connect)
+    app.extensions["live_feed"] = feed
+
+    app.result_cache = ResultCache(
+            int(os.getenv("RESULT_CACHE_BYTES", str(16 * 1024 * 1024))))
+    on_write(app.result_cache.apply)
+
+    heatmaps = HeatmapCache(int(os.getenv("HEATMAP_CACHE_YEARS", "1024")))
+    on_write(heatmaps.apply)
+    app.extensions["heatmaps"] = heatmaps
+
+    # The caches above only hear of this process's writes by themselves.
+    external_writes = ExternalWrites(
+            float(os.getenv("CHANGE_POLL_SECONDS", "1")))
+    external_writes.start(app.db)
+    app.extensions["external_writes"] = external_writes
+
+    @app.before_request
+    def record_external_writes():
+        """
+        Records the writes other processes committed since the last poll,
+        before any cache answers the request.
+        """
+        if external_writes.due():
+            with app.db_pool.connection() as conn:
+                external_writes.poll(conn)
+
+    app.before_request(require_user)
+
+    partitions_checked = {"day": date.today()}
+
+    @app.before_request
+    def create_upcoming_partitions():
+        """
+        Creates upcoming activity_logs partitions once a day, so a long
+        running service never has to route inserts to the default partition.
+        """
+        if partitions_checked["day"] != date.today():
+            partitions_checked["day"] = date.today()
+            maintain_partitions(app.db)
 
     goals = {"yoga":" minutes",
              "push ups":" reps",
              "pull ups":" reps",
              "cycling":" km"}
 
+    def home_without_forecasts():
+        return render_template("index.html", goals=list(goals.keys()),
+                               forecasts=None)
+
     @app.route("/")
+    @time_budget(fallback=home_without_forecasts)
     def home():
         """
-        Render the default home page.
+        Render the default home page, including the year-end forecast of
+        every activity goal.
         """
-        return render_template("index.html", goals=list(goals.keys()))
+        forecasts = cached_forecasts(request_db(), current_user_id(),
+                                     app.result_cache)
+        return render_template("index.html", goals=list(goals.keys()),
+                               forecasts=forecasts)
 
     @app.route("/menu")
     def table_menu():
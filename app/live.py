@@ -0,0 +1,141 @@
+# -*- coding: utf-8 -*-
+"""
+app/live.py
+
+Fans database changes out to open dashboards. On Postgres a trigger NOTIFYs
+every committed activity_logs change (see schema.CREATE_NOTIFY_TRIGGER); one
+background thread per process LISTENs on a dedicated connection and hands
+each event to every subscribed client queue, so any number of dashboards
+costs one database connection and no polling. The SQLite backend has no
+NOTIFY; there the query layer's write events are published instead, which
+only cover writes made by this process and carry no row.
+
+Events are dictionaries:
+    {"op": "INSERT" | "UPDATE" | "DELETE", "id": ..., "user_id": ...,
+     "activity_type_id": ..., "canonical_quantity": ..., "timestamp": ...}
+or {"op": "WRITE"} when only the fact that logs changed is known. Notes and
+tags are left out to keep the notification payload bounded; clients fetch
+them from /api/v1/activity_logs/<id>.
+"""
+
+# Built-in module imports
+import json
+import queue
+import select
+import threading
+from contextlib import contextmanager
+from typing import Any, Callable, Dict, Iterator, Optional, Set
+
+# 3rd party module imports
+from psycopg2.extensions import connection
+
+LISTEN_ACTIVITY_LOGS = """
+LISTEN activity_logs;
+"""
+
+# Events buffered per client. A client that falls this far behind is sent
+# an overflow event and has to reload instead.
+MAX_PENDING_EVENTS = 1000
+# Seconds to wait before reconnecting after the listener lost its connection.
+RECONNECT_DELAY = 5.0
+
+class ChangeFeed:
+    """
+    Distributes activity_logs change events to subscribers.
+
+    Args:
+        connect (Optional[Callable[[], connection]]): Opens the autocommit
+            connection to LISTEN on. None if events are only published from
+            within the process.
+
+    Attributes:
+        listening (threading.Event): Set while the listener is subscribed to
+            the channel.
+    """
+
+    def __init__(self, connect: Optional[Callable[[], connection]] = None):
+        self.connect = connect
+        self._subscribers: Set[queue.Queue] = set()
+        self._lock = threading.Lock()
+        self._listener: Optional[threading.Thread] = None
+        self.listening = threading.Event()
+        self.stopped = threading.Event()
+
+    def publish(self, event: Dict[str, Any]) -> None:
+        """
+        Hands an event to every subscriber.
+
+        Args:
+            event (Dict[str, Any]): The change event.
+        """
+        with self._lock:
+            subscribers = list(self._subscribers)
+        for events in subscribers:
+            try:
+                events.put_nowait(event)
+            except queue.Full:
+                # Replace the backlog with a single overflow marker.
+                with events.mutex:
+                    events.queue.clear()
+                events.put_nowait({"op": "OVERFLOW"})
+
+    @contextmanager
+    def subscribe(self) -> Iterator[queue.Queue]:
+        """
+        Registers a client for the duration of the block, starting the
+        listener thread on first use.
+
+        Yields:
+            queue.Queue: Queue receiving the events.
+        """
+        events = queue.Queue(MAX_PENDING_EVENTS)
+        with self._lock:
+            self._subscribers.add(events)
+            if self.connect is not None and self._listener is None:
+                self._listener = threading.Thread(
+                        target=self.listen, name="activity-logs-listener",
+                        daemon=True)
+                self._listener.start()
+        try:
+            yield events
+        finally:
+            with self._lock:
+                self._subscribers.discard(events)
+
+    def listen(self) -> None:
+        """
+        Listener thread body: LISTENs for notifications and publishes them
+        until stop() is called, reconnecting after connection errors.
+        """
+        while not self.stopped.is_set():
+            conn = None
+            try:
+                conn = self.connect()
+                with conn.cursor() as cur:
+                    cur.execute(LISTEN_ACTIVITY_LOGS)
+                self.listening.set()
+                while not self.stopped.is_set():
+                    if select.select([conn], [], [], 1.0) == ([], [], []):
+                        continue
+                    conn.poll()
+                    while conn.notifies:
+                        notify = conn.notifies.pop(0)
+                        self.publish(json.loads(notify.payload))
+            except Exception as e:
+                print(f"Change listener lost its connection: {e}")
+                if self.listening.is_set():
+                    # Changes may have been missed; clients should reload.
+                    self.publish({"op": "OVERFLOW"})
+                self.stopped.wait(RECONNECT_DELAY)
+            finally:
+                self.listening.clear()
+                if conn is not None and not conn.closed:
+                    conn.close()
+
+    def stop(self) -> None:
+        """
+        Stops the listener thread.
+        """
+        self.stopped.set()
+
+# EOF
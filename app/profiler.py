@@ -0,0 +1,155 @@
+# -*- coding: utf-8 -*-
+"""
+app/profiler.py
+
+Opt-in profiling of single requests. With PROFILING_ENABLED=1 on the server,
+a request carrying the header "X-Profile: 1" or the query parameter
+?profile=1 runs under cProfile. Two files per profiled request are written
+to PROFILE_DIR:
+
+    <time>_<endpoint>.prof  raw profile, for pstats, snakeviz and the like
+    <time>_<endpoint>.txt   summary: time in the route, in the database, in
+                            template rendering, per query function, and the
+                            most expensive calls
+
+The name of the files is returned in the X-Profile response header. Only one
+request is profiled at a time; others carrying the flag run normally. Time
+spent streaming a response body after the view returned is not captured.
+"""
+
+# built-in module imports
+import cProfile
+import inspect
+import io
+import os
+import pstats
+import tempfile
+import threading
+import time
+from typing import Callable, Optional
+
+# 3rd party module imports
+from flask import Flask, g, request
+
+# Built-in functions of the database drivers that wait on the database.
+DATABASE_CALLS = ("execute", "executemany", "fetchone", "fetchmany",
+                  "fetchall", "commit", "rollback", "copy_expert")
+QUERY_MODULES = ("activity_queries.py", "unit_queries.py", "user_queries.py",
+                 "search_queries.py")
+# Flask entry points for rendering, including loading the template.
+TEMPLATE_CALLS = ("render_template", "render_template_string")
+TOP_CALLS = 30
+
+_profiling = threading.Lock()
+
+def profiling_enabled() -> bool:
+    """
+    Tells whether requests may ask to be profiled (PROFILING_ENABLED).
+    """
+    return os.getenv("PROFILING_ENABLED", "").lower() in ("1", "true", "yes")
+
+def profile_dir() -> str:
+    """
+    Returns the directory profiles are written to (PROFILE_DIR).
+    """
+    return os.getenv("PROFILE_DIR") or os.path.join(
+        tempfile.gettempdir(), "resolution_tracker_profiles")
+
+def _requested() -> bool:
+    return request.headers.get("X-Profile") == "1" \
+        or request.args.get("profile") == "1"
+
+def summarize(stats: pstats.Stats, view: Optional[Callable]) -> str:
+    """
+    Attributes the profiled time to the route, the database and template
+    rendering.
+
+    Args:
+        stats (pstats.Stats): The request's profile.
+        view (Optional[Callable]): View function that served the request.
+
+    Returns:
+        str: Human readable summary.
+    """
+    view_key = None
+    if view is not None:
+        code = inspect.unwrap(view).__code__
+        view_key = (code.co_filename, code.co_firstlineno, code.co_name)
+    route = database = templates = 0.0
+    queries = []
+    for key, (_, _, tottime, cumtime, _) in stats.stats.items():
+        filename, _, name = key
+        if key == view_key:
+            route = cumtime
+        elif filename == "~" and any(f"'{call}'" in name
+                                     for call in DATABASE_CALLS):
+            database += tottime
+        elif name in TEMPLATE_CALLS and filename.endswith(
+                os.path.join("flask", "templating.py")):
+            templates += cumtime
+        elif os.path.basename(filename) in QUERY_MODULES \
+                and not name.startswith("_"):
+            queries.append((cumtime, name))
+
+    route_name = view_key[2] if view_key else "unknown"
+    lines = [f"route {route_name}: {route * 1000:.1f} ms",
+             f"database: {database * 1000:.1f} ms",
+             f"template rendering: {templates * 1000:.1f} ms",
+             "", "query functions (cumulative, nested calls overlap):"]
+    lines += [f"    {name}: {cumtime * 1000:.1f} ms"
+              for cumtime, name in sorted(queries, reverse=True)]
+    out = io.StringIO()
+    stats.stream = out
+    stats.sort_stats("cumulative").print_stats(TOP_CALLS)
+    return "\n".join(lines) + "\n\n" + out.getvalue()
+
+def install_profiler(app: Flask) -> None:
+    """
+    Registers the request hooks that profile flagged requests. Does nothing
+    unless profiling_enabled(). Install before any other request hook, so
+    those are profiled as well.
+
+    Args:
+        app (Flask): The app to instrument.
+    """
+    if not profiling_enabled():
+        return
+
+    @app.before_request
+    def start_profile():
+        if not _requested() or not _profiling.acquire(blocking=False):
+            return
+        g.profile = cProfile.Profile()
+        g.profile.enable()
+
+    @app.after_request
+    def save_profile(response):
+        profile = g.pop("profile", None)
+        if profile is None:
+            return response
+        profile.disable()
+        _profiling.release()
+
+        endpoint = request.endpoint or "unknown"
+        now = time.time()
+        name = time.strftime("%Y%m%dT%H%M%S", time.localtime(now)) \
+            + f"{now % 1:.3f}"[1:] + "_" + endpoint.replace(".", "_")
+        directory = profile_dir()
+        os.makedirs(directory, exist_ok=True)
+        profile.dump_stats(os.path.join(directory, name + ".prof"))
+        summary = summarize(pstats.Stats(profile),
+                            app.view_functions.get(request.endpoint))
+        with open(os.path.join(directory, name + ".txt"), "w") as f:
+            f.write(f"{request.method} {request.full_path}\n\n{summary}")
+        response.headers["X-Profile"] = name
+        return response
+
+    @app.teardown_request
+    def discard_profile(_):
+        # The request failed before after_request ran.
+        profile = g.pop("profile", None)
+        if profile is not None:
+            profile.disable()
+            _profiling.release()
+
+# EOF
@@ -5,19 +5,70 @@ app/router/activity_logs.py
 Defines the routes for workflow related to activity_logs table.
 """
 
+# built-in module imports
+import json
+import queue
+from datetime import datetime, timedelta
+
 # 3rd party module imports
-from flask import Blueprint, current_app, render_template, request, redirect, \
+from flask import Blueprint, Response, current_app, jsonify, \
+                  render_template, request, redirect, stream_template, \
                   url_for
 
 # local module imports
+from app.analytics import compute_stats, load_series
+from app.budget import request_db, time_budget
+from app.cache import cached_result, render_fragment
 from app.db.activity_queries import delete_activity_log, \
         get_activity_logs_for_type, get_activity_log, get_activity_type, \
-        get_all_activity_types, insert_activity_log, update_activity_log
+        get_all_activity_types, get_recent_activity_logs_for_type, \
+        insert_activity_log, iter_activity_logs_for_type, update_activity_log
 from app.db.unit_queries import get_all_units_by_group, get_all_unit_groups, \
         get_unit, get_unit_group
+from app.routes.users import current_user_id
 
 activity_logs_bp = Blueprint("activity_logs", __name__)
 
+# Rows shown when the full table does not fit in the time budget.
+TRUNCATED_TABLE_ROWS = 200
+# Characters of rendered HTML collected before a streamed chunk is sent.
+STREAM_CHUNK_CHARS = 16 * 1024
+# Seconds between keepalive comments on an idle event stream.
+EVENT_KEEPALIVE_SECONDS = 15
+
+def parse_time_range(args):
+    """
+    Reads the optional start/end bounds from the request arguments. Both
+    accept ISO formatted dates or datetimes. A date-only end bound includes
+    the whole day, so the returned end is always exclusive.
+
+    Args:
+        args: Request argument mapping (request.args or request.form).
+
+    Returns:
+        tuple: (start, end) datetimes, either of which may be None.
+    """
+    start_raw = args.get("start")
+    end_raw = args.get("end")
+    start = datetime.fromisoformat(start_raw) if start_raw else None
+    end = datetime.fromisoformat(end_raw) if end_raw else None
+    if end is not None and len(end_raw) == 10:
+        end += timedelta(days=1)
+    return start, end
+
+def parse_tags(raw):
+    """
+    Splits a comma separated list of tags, e.g. "outdoor, injury".
+
+    Args:
+        raw (Optional[str]): The submitted value.
+
+    Returns:
+        Optional[List[str]]: The tags, or None if none were given.
+    """
+    tags = [tag for tag in (raw or "").split(",") if tag.strip()]
+    return tags or None
+
 # -------------------------------- ENTRY POINT --------------------------------
 
 @activity_logs_bp.route("/action")
@@ -42,28 +93,32 @@ def activity_logs_action_router():
 @activity_logs_bp.route("/update/units")
 def units_dropdown():
     conn = current_app.db
+    user_id = current_user_id()
     activity_type_id = request.args.get("activity_type_id")
-    hx_get_url = request.args.get("hx_get_url")
-    hx_target = request.args.get("hx_target")
 
-    if not activity_type_id:
-        units = []
-    else:
-        activity_type = get_activity_type(conn, activity_type_id)
-        allowed_units = get_all_units_by_group(
+    def load_units():
+        if not activity_type_id:
+            return {"units": []}
+        activity_type = get_activity_type(conn, user_id, activity_type_id)
+        return {"units": get_all_units_by_group(
                 conn,
                 activity_type["unit_group_id"]
-        )
-    return render_template(
+        )}
+
+    return render_fragment(
             "activity_logs/partials/units_dropdown.html",
-            hx_get_url=hx_get_url,
-            hx_target=hx_target,
-            units=allowed_units,
+            ("activity_types", "units"),
+            load_units,
+            user_id=user_id,
+            activity_type_id=activity_type_id,
+            hx_get_url=request.args.get("hx_get_url"),
+            hx_target=request.args.get("hx_target"),
     )
 
 @activity_logs_bp.route("/activity_logs")
 def activity_logs_dropdown():
     conn = current_app.db
+    user_id = current_user_id()
     activity_type_id = request.args.get("activity_type_id")
     hx_get_url = request.args.get("hx_get_url")
     hx_target = request.args.get("hx_target")
@@ -71,10 +126,12 @@ def activity_logs_dropdown():
     if not activity_type_id:
         units = []
     else:
-        ugroup_id = get_activity_type(conn, activity_type_id)["unit_group_id"]
+        ugroup_id = get_activity_type(
+                conn, user_id, activity_type_id)["unit_group_id"]
         display_unit_id = get_unit_group(conn, ugroup_id)["canonical_unit_id"]
         activity_logs = get_activity_logs_for_type(
                 conn,
+                user_id,
                 display_unit_id,
                 activity_type_id
         )
@@ -91,16 +148,22 @@ def activity_logs_dropdown():
 @activity_logs_bp.route("/create", methods=["GET", "POST"])
 def create_activity():
     conn = current_app.db
-    activity_types = get_all_activity_types(conn)
+    user_id = current_user_id()
+    activity_types = get_all_activity_types(conn, user_id)
     if request.method == "POST":
         activity_type_id = request.form["activity_type_id"]
         unit_id = request.form["unit_id"]
         quantity = request.form["quantity"]
-        
+        notes = request.form.get("notes") or None
+        tags = parse_tags(request.form.get("tags"))
+
         activity_id = insert_activity_log(
-                conn, activity_type_id, quantity, unit_id
+                conn, user_id, activity_type_id, quantity, unit_id,
+                notes, tags
         )
-        activity = get_activity_log(conn, unit_id, activity_id)
+        if activity_id is None:
+            return "Invalid activity type", 400
+        activity = get_activity_log(conn, user_id, unit_id, activity_id)
         
         return render_template(
                 "activity_logs/create_result.html",
@@ -117,43 +180,152 @@ def create_activity():
 @activity_logs_bp.route("/view", methods=["GET"])
 def view_activity_logs():
     conn = current_app.db
-    activity_types = get_all_activity_types(conn)
+    user_id = current_user_id()
+    activity_types = get_all_activity_types(conn, user_id)
     return render_template(
             "activity_logs/view.html",
             activity_types=activity_types,
     )
 
-@activity_logs_bp.route("/view/table")
-def view_activity_log_table():
-    conn = current_app.db
+def _load_log_table(load_logs, start, end):
+    """
+    Loads the logs selected by the request arguments with load_logs.
+
+    Returns:
+        tuple: (logs, unit_name); logs is empty and unit_name None unless
+            both an activity type and a unit are selected.
+    """
+    conn = request_db()
+    user_id = current_user_id()
     activity_type_id = request.args.get("activity_type_id")
     unit_id = request.args.get("unit_id")
-    unit_name = get_unit(conn, unit_id)["name"]
-
     if not activity_type_id or not unit_id:
-        logs = []
-    else:
-        logs = get_activity_logs_for_type(
-            conn,
-            unit_id,
-            activity_type_id
-        )
-        for i in range(len(logs)):
-            logs[i]["activity_type_name"] = get_activity_type(
-                    conn, activity_type_id)["name"]
+        return [], None
 
+    unit_name = get_unit(conn, unit_id)["name"]
+    activity_type_name = get_activity_type(
+            conn, user_id, activity_type_id)["name"]
+    logs = load_logs(conn, user_id, unit_id, activity_type_id, start, end,
+                     parse_tags(request.args.get("tags")))
+    # A generator, so streamed logs are named as they go by.
+    logs = ({**log, "activity_type_name": activity_type_name}
+            for log in logs)
+    return logs, unit_name
+
+def _render_log_table(load_logs, truncated=False):
+    try:
+        start, end = parse_time_range(request.args)
+    except ValueError:
+        return "Invalid start or end date", 400
+    logs, unit_name = _load_log_table(load_logs, start, end)
     return render_template(
         "activity_logs/partials/view_table.html",
+        logs=list(logs),
+        unit_name=unit_name,
+        truncated=truncated
+    )
+
+def _in_chunks(pieces):
+    # Jinja yields every literal and expression separately; sending each
+    # on its own would cost a write per table cell.
+    chunk, size = [], 0
+    for piece in pieces:
+        chunk.append(piece)
+        size += len(piece)
+        if size >= STREAM_CHUNK_CHARS:
+            yield "".join(chunk)
+            chunk, size = [], 0
+    yield "".join(chunk)
+
+def view_activity_log_table_truncated():
+    """
+    Fallback for view_activity_log_table: only the latest logs, found with a
+    bounded index scan, plus a notice that the table is incomplete.
+    """
+    return _render_log_table(
+            lambda conn, user_id, unit_id, activity_type_id, start, end, tags:
+                get_recent_activity_logs_for_type(
+                    conn, user_id, unit_id, activity_type_id,
+                    TRUNCATED_TABLE_ROWS, start, end, tags),
+            truncated=True)
+
+@activity_logs_bp.route("/view/table")
+@time_budget(fallback=view_activity_log_table_truncated)
+def view_activity_log_table():
+    return _render_log_table(get_activity_logs_for_type)
+
+@activity_logs_bp.route("/view/table/stream")
+def view_activity_log_table_stream():
+    """
+    The whole log table as a page, streamed while the logs are read from a
+    server-side cursor. Rows show up as soon as the first batch is read and
+    memory use does not grow with the table, so it has no time budget.
+    """
+    try:
+        start, end = parse_time_range(request.args)
+    except ValueError:
+        return "Invalid start or end date", 400
+    logs, unit_name = _load_log_table(iter_activity_logs_for_type, start, end)
+    page = stream_template(
+        "activity_logs/table_page.html",
         logs=logs,
-        unit_name=unit_name
+        unit_name=unit_name,
+        truncated=False
     )
+    return Response(_in_chunks(page), mimetype="text/html")
+
+@activity_logs_bp.route("/stats")
+@time_budget()
+def activity_log_stats():
+    conn = request_db()
+    user_id = current_user_id()
+    activity_type_id = request.args.get("activity_type_id")
+    unit_id = request.args.get("unit_id")
+    if not activity_type_id:
+        return "activity_type_id is required", 400
+    try:
+        start, end = parse_time_range(request.args)
+    except ValueError:
+        return "Invalid start or end date", 400
+
+    factor = get_unit(conn, unit_id)["factor"] if unit_id else 1.0
+    series = cached_result(load_series, conn, user_id, activity_type_id,
+                           start, end, parse_tags(request.args.get("tags")))
+    return jsonify(compute_stats(series, factor))
+
+@activity_logs_bp.route("/events")
+def activity_log_events():
+    """
+    Server-Sent Events stream of changes to the current user's activity
+    logs, fed by the app's ChangeFeed (see app/live.py).
+    """
+    user_id = current_user_id()
+    feed = current_app.extensions["live_feed"]
+
+    def stream():
+        with feed.subscribe() as events:
+            yield "retry: 5000\n\n"
+            while True:
+                try:
+                    event = events.get(timeout=EVENT_KEEPALIVE_SECONDS)
+                except queue.Empty:
+                    yield ": keepalive\n\n"
+                    continue
+                if event.get("user_id", user_id) != user_id:
+                    continue
+                yield f"event: activity_log\ndata: {json.dumps(event)}\n\n"
+
+    return Response(stream(), mimetype="text/event-stream",
+                    headers={"Cache-Control": "no-cache",
+                             "X-Accel-Buffering": "no"})
 
 # ------------------------------- UPDATE ROUTES -------------------------------
 
 @activity_logs_bp.route("/update_start", methods=["GET"])
 def update_activity_log_start():
     conn = current_app.db
-    activity_types = get_all_activity_types(conn)
+    user_id = current_user_id()
+    activity_types = get_all_activity_types(conn, user_id)
     return render_template(
             "activity_logs/update.html",
             activity_types=activity_types,
@@ -162,12 +334,14 @@ def update_activity_log_start():
 @activity_logs_bp.route("/update_form")
 def get_activity_update_form():
     conn = current_app.db
+    user_id = current_user_id()
     activity_id = request.args.get("id")
     activity_type_id = request.args.get("activity_type_id")
-    ugroup_id = get_activity_type(conn, activity_type_id)["unit_group_id"]
+    ugroup_id = get_activity_type(
+            conn, user_id, activity_type_id)["unit_group_id"]
     units = get_all_units_by_group(conn, ugroup_id)
     canonical_unit_id = get_unit_group(conn, ugroup_id)["canonical_unit_id"]
-    activity = get_activity_log(conn, canonical_unit_id, activity_id)
+    activity = get_activity_log(conn, user_id, canonical_unit_id, activity_id)
 
     return render_template(
             "activity_logs/partials/activity_log_update_form.html",
@@ -177,12 +351,16 @@ def get_activity_update_form():
 @activity_logs_bp.route("/update/submit", methods=["POST"])
 def update_activity_log_submit():
     conn = current_app.db
+    user_id = current_user_id()
     activity_type_id = request.form.get("activity_type_id")
     log_id = request.form.get("log_id")
     unit_id = request.form.get("unit_id")
     display_quantity = request.form.get("display_quantity")
-    update_activity_log(conn, log_id, activity_type_id, display_quantity,
-                        unit_id)
+    notes = request.form.get("notes")
+    tags = request.form.get("tags")
+    update_activity_log(conn, user_id, log_id, activity_type_id,
+                        display_quantity, unit_id, notes,
+                        None if tags is None else parse_tags(tags) or [])
 
     return render_template("activity_logs/update_result.html", log_id=log_id)
 
@@ -191,7 +369,8 @@ def update_activity_log_submit():
 @activity_logs_bp.route("/delete_start", methods=["GET"])
 def delete_activity_log_start():
     conn = current_app.db
-    activity_types = get_all_activity_types(conn)
+    user_id = current_user_id()
+    activity_types = get_all_activity_types(conn, user_id)
     return render_template(
             "activity_logs/delete.html",
             activity_types=activity_types,
@@ -200,12 +379,14 @@ def delete_activity_log_start():
 @activity_logs_bp.route("/delete_form")
 def get_activity_delete_form():
     conn = current_app.db
+    user_id = current_user_id()
     activity_id = request.args.get("id")
     activity_type_id = request.args.get("activity_type_id")
-    ugroup_id = get_activity_type(conn, activity_type_id)["unit_group_id"]
+    ugroup_id = get_activity_type(
+            conn, user_id, activity_type_id)["unit_group_id"]
     units = get_all_units_by_group(conn, ugroup_id)
     canonical_unit_id = get_unit_group(conn, ugroup_id)["canonical_unit_id"]
-    activity = get_activity_log(conn, canonical_unit_id, activity_id)
+    activity = get_activity_log(conn, user_id, canonical_unit_id, activity_id)
 
     return render_template(
             "activity_logs/partials/activity_log_delete_form.html",
@@ -214,8 +395,9 @@ def get_activity_delete_form():
 @activity_logs_bp.route("/delete/submit", methods=["POST"])
 def delete_activity_log_submit():
     conn = current_app.db
+    user_id = current_user_id()
     log_id = request.form.get("log_id")
-    delete_activity_log(conn, log_id)
+    delete_activity_log(conn, user_id, log_id)
 
     return render_template("activity_logs/delete_result.html",
                            log_id=log_id)
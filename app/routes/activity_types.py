@@ -10,9 +10,12 @@ from flask import Blueprint, current_app, render_template, request, redirect, \
                   url_for
 
 # local module imports
+from app.cache import render_fragment
 from app.db.activity_queries import delete_activity_type, get_activity_type, \
         get_all_activity_types, insert_activity_type, update_activity_type
+from app.db.search_queries import search_activity_types
 from app.db.unit_queries import get_all_unit_groups, get_unit_group
+from app.routes.users import current_user_id
 
 activity_types_bp = Blueprint("activity_types", __name__)
 
@@ -36,6 +39,7 @@ def activity_types_action_router():
 @activity_types_bp.route("/create", methods=["GET", "POST"])
 def create_activity():
     conn = current_app.db
+    user_id = current_user_id()
     if request.method == "POST":
         name = request.form.get("name")
         group_id = request.form.get("group_id")
@@ -51,7 +55,8 @@ def create_activity():
             return "goal_quantity must be numbers."
 
         try:
-            new_id = insert_activity_type(conn, group_id, name, goal_quantity)
+            new_id = insert_activity_type(conn, user_id, group_id, name,
+                                          goal_quantity)
         except Exception as e:
             return f"Error creating activity: {e}"
         
@@ -69,7 +74,8 @@ def create_activity():
 @activity_types_bp.route("/view", methods=["GET"])
 def view_activity_types():
     conn = current_app.db
-    activity_types = get_all_activity_types(conn)
+    user_id = current_user_id()
+    activity_types = get_all_activity_types(conn, user_id)
     for i in range(len(activity_types)):
         activity_types[i]["unit_group_name"] = get_unit_group(
             conn, activity_types[i]["unit_group_id"])["name"] 
@@ -85,12 +91,9 @@ def delete_activity_type_start():
     return manipulate_activity_type_start("delete")
 
 def manipulate_activity_type_start(action):
-    conn = current_app.db
-    activity_types = get_all_activity_types(conn)
-
+    # The dropdown is loaded by the page itself through get_activity_types.
     return render_template(
         f"activity_types/{action}.html",
-        activity_types=activity_types,
         hx_get_url=f"/activity_types/{action}/get_activity_types",
         hx_target="#activity-types-dropdown"
     )
@@ -99,7 +102,7 @@ def manipulate_activity_type_start(action):
 @activity_types_bp.route("/delete/get_activity_types")
 def get_activity_types():
     conn = current_app.db
-    activity_types = get_all_activity_types(conn)
+    user_id = current_user_id()
     workflow = "/".join(request.path.split("/")[:3])
     match workflow:
         case "/activity_types/update":
@@ -110,18 +113,40 @@ def get_activity_types():
             hx_target="#activity-type-delete-form"
         case _:
             raise ValueError(f"Unexpected worfklow: {workflow}")
-    return render_template(
+    return render_fragment(
             "activity_types/partials/activity_types_dropdown.html",
-            activity_types=activity_types,
+            ("activity_types",),
+            lambda: {"activity_types": get_all_activity_types(conn, user_id)},
+            user_id=user_id,
             hx_get_url=hx_get_url,
             hx_target=hx_target
     )
 
+@activity_types_bp.route("/search")
+def search_activity_types_options():
+    """
+    Typeahead endpoint: the <option>s of the activity types best matching
+    the text in q, or of all of them once q is cleared.
+    """
+    conn = current_app.db
+    user_id = current_user_id()
+    text = request.args.get("q", "")
+    return render_fragment(
+            "activity_types/partials/activity_type_options.html",
+            ("activity_types",),
+            lambda: {"activity_types": search_activity_types(
+                conn, user_id, text) if text.strip()
+                else get_all_activity_types(conn, user_id)},
+            user_id=user_id,
+            q=text
+    )
+
 @activity_types_bp.route("/update/get_activity_type_form")
 def get_activity_update_form():
     activity_id = request.args.get("id")
     conn = current_app.db
-    activity = get_activity_type(conn, activity_id)
+    user_id = current_user_id()
+    activity = get_activity_type(conn, user_id, activity_id)
     groups = get_all_unit_groups(conn)
 
     return render_template(
@@ -131,12 +156,13 @@ def get_activity_update_form():
 @activity_types_bp.route("/update/submit", methods=["POST"])
 def update_activity_type_submit():
     conn = current_app.db
+    user_id = current_user_id()
     activity_id = request.form.get("id")
     activity_name = request.form.get("name")
     unit_group_id = request.form.get("group_id")
     goal_quantity = request.form.get("goal_quantity")
-    update_activity_type(conn, activity_id, activity_name, unit_group_id,
-                      goal_quantity)
+    update_activity_type(conn, user_id, activity_id, activity_name,
+                         unit_group_id, goal_quantity)
 
     return render_template("activity_types/update_result.html",
                            name=activity_name)
@@ -145,7 +171,8 @@ def update_activity_type_submit():
 def get_activity_delete_form():
     activity_id = request.args.get("id")
     conn = current_app.db
-    activity = get_activity_type(conn, activity_id)
+    user_id = current_user_id()
+    activity = get_activity_type(conn, user_id, activity_id)
 
     return render_template(
             "activity_types/partials/activity_type_delete_form.html",
@@ -154,9 +181,10 @@ def get_activity_delete_form():
 @activity_types_bp.route("/delete/submit", methods=["POST"])
 def delete_activity_type_submit():
     conn = current_app.db
+    user_id = current_user_id()
     activity_id = request.form.get("id")
     activity_name = request.form.get("name")
-    delete_activity_type(conn, activity_id)
+    delete_activity_type(conn, user_id, activity_id)
 
     return render_template("activity_types/delete_result.html",
                            name=activity_name)
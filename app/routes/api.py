@@ -0,0 +1,345 @@
+# -*- coding: utf-8 -*-
+"""
+app/routes/api.py
+
+Versioned JSON API over the same tables as the HTML routes, for scripts and
+the dashboard. Every collection accepts
+
+    ids=1,2,3      fetch exactly these records with one query
+    fields=id,name return only these fields
+
+and is answered with compact JSON: {"<resource>": [record, ...]}. Single
+records are served at /<resource>/<id>. Activity types and logs are those
+of the current user.
+
+/activity_types/<id>/heatmap?year=2026 returns the total logged per day of
+a year in canonical units, {"year": 2026, "days": [...366 totals]}, with
+day 1 of the year first. It is served from the heatmap cache (app/heatmap.py).
+
+/changes?after=<cursor>&limit=500 is the change feed (see
+app/db/change_queries.py): every insert, update, delete and truncate of the
+four tables visible to the current user, oldest first,
+{"changes": [...], "cursor": "..."}. Passing the returned cursor as after=
+fetches only what changed since.
+
+/result_cache reports the hits, misses and memory use of the dashboard
+result cache (app/cache.py), {"hits": ..., "misses": ..., "entries": ...,
+"bytes": ..., "max_bytes": ...}.
+
+Logs matching a filter can be deleted or moved to another activity type in
+bulk by POSTing a JSON filter to /activity_logs/bulk_delete or
+/activity_logs/bulk_reassign; "dry_run": true only counts them. Log listings
+exceeding the query time budget are answered with 503.
+"""
+
+# built-in module imports
+import json
+from datetime import MAXYEAR, MINYEAR, date, datetime
+from typing import Any, Callable, Dict, List, Optional
+
+# 3rd party module imports
+from flask import Blueprint, current_app, request
+
+# local module imports
+from app.budget import TIMEOUT_MESSAGE, request_db, time_budget
+from app.db.activity_queries import bulk_delete_activity_logs, \
+        bulk_reassign_activity_logs, get_activity_logs_by_ids, \
+        get_activity_logs_for_type, get_activity_type, \
+        get_activity_types_by_ids, get_all_activity_types
+from app.db.change_queries import CHANGES_LIMIT, MAX_CHANGES_LIMIT, \
+        get_changes
+from app.db.unit_queries import get_all_unit_groups, get_all_units, \
+        get_all_units_by_group, get_unit_group, get_unit_groups_by_ids, \
+        get_units_by_ids
+from app.db.timezone import local_today
+from app.routes.activity_logs import parse_tags, parse_time_range
+from app.routes.users import current_user_id
+
+api_bp = Blueprint("api", __name__)
+
+# Upper bound for the number of ids in one batch request.
+MAX_BATCH_SIZE = 1000
+
+FIELDS = {
+    "units": ("id", "name", "group_id", "factor", "shift", "is_canonical"),
+    "unit_groups": ("id", "name"),
+    "activity_types": ("id", "name", "unit_group_id", "goal_quantity"),
+    "activity_logs": ("id", "activity_type_id", "canonical_quantity",
+                      "timestamp", "notes", "tags"),
+}
+
+class ApiError(Exception):
+    """
+    Client error answered with a JSON error document.
+    """
+
+    def __init__(self, message: str, status: int = 400):
+        super().__init__(message)
+        self.status = status
+
+def _serialize(value: Any) -> Any:
+    if isinstance(value, (datetime, date)):
+        return value.isoformat()
+    raise TypeError(f"{type(value).__name__} is not JSON serializable")
+
+def json_response(payload: Any, status: int = 200):
+    """
+    Serializes payload without whitespace and wraps it in a response.
+    """
+    body = json.dumps(payload, separators=(",", ":"), default=_serialize)
+    return current_app.response_class(body, status=status,
+                                      mimetype="application/json")
+
+def _int_list(raw: str, name: str) -> List[int]:
+    try:
+        values = [int(value) for value in raw.split(",") if value]
+    except ValueError:
+        raise ApiError(f"{name} must be a comma separated list of integers")
+    if len(values) > MAX_BATCH_SIZE:
+        raise ApiError(f"At most {MAX_BATCH_SIZE} ids per request")
+    return values
+
+def requested_ids() -> Optional[List[int]]:
+    """
+    Returns the ids of a batch request, or None if none were given.
+    """
+    raw = request.args.get("ids")
+    return None if raw is None else _int_list(raw, "ids")
+
+def select_fields(resource: str,
+        records: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    """
+    Reduces records to the fields requested with fields=, or to the public
+    fields of the resource by default.
+    """
+    raw = request.args.get("fields")
+    fields = FIELDS[resource]
+    if raw:
+        unknown = set(raw.split(",")) - set(fields)
+        if unknown:
+            raise ApiError(f"Unknown fields: {', '.join(sorted(unknown))}")
+        fields = raw.split(",")
+    return [{field: record[field] for field in fields} for record in records]
+
+def _collection(resource: str,
+        load_all: Callable[[], List[Dict[str, Any]]],
+        load_ids: Callable[[List[int]], List[Dict[str, Any]]]):
+    ids = requested_ids()
+    records = load_all() if ids is None else load_ids(ids)
+    return json_response({resource: select_fields(resource, records)})
+
+def _single(resource: str, record_id: int,
+        load_ids: Callable[[List[int]], List[Dict[str, Any]]]):
+    records = load_ids([record_id])
+    if not records:
+        raise ApiError(f"No {resource} record with id {record_id}", 404)
+    return json_response(select_fields(resource, records)[0])
+
+@api_bp.errorhandler(ApiError)
+def handle_api_error(error: ApiError):
+    return json_response({"error": str(error)}, error.status)
+
+# ---------------------------------- UNITS ------------------------------------
+
+@api_bp.route("/units")
+def list_units():
+    conn = current_app.db
+    group_id = request.args.get("group_id")
+    if group_id:
+        load_all = lambda: get_all_units_by_group(conn, group_id)
+    else:
+        load_all = lambda: get_all_units(conn)
+    return _collection("units", load_all,
+                       lambda ids: get_units_by_ids(conn, ids))
+
+@api_bp.route("/units/<int:unit_id>")
+def get_unit_record(unit_id):
+    conn = current_app.db
+    return _single("units", unit_id, lambda ids: get_units_by_ids(conn, ids))
+
+# ------------------------------- UNIT GROUPS ---------------------------------
+
+@api_bp.route("/unit_groups")
+def list_unit_groups():
+    conn = current_app.db
+    return _collection("unit_groups", lambda: get_all_unit_groups(conn),
+                       lambda ids: get_unit_groups_by_ids(conn, ids))
+
+@api_bp.route("/unit_groups/<int:group_id>")
+def get_unit_group_record(group_id):
+    conn = current_app.db
+    return _single("unit_groups", group_id,
+                   lambda ids: get_unit_groups_by_ids(conn, ids))
+
+# ------------------------------ ACTIVITY TYPES -------------------------------
+
+@api_bp.route("/activity_types")
+def list_activity_types():
+    conn = current_app.db
+    user_id = current_user_id()
+    return _collection(
+            "activity_types",
+            lambda: get_all_activity_types(conn, user_id),
+            lambda ids: get_activity_types_by_ids(conn, user_id, ids))
+
+@api_bp.route("/activity_types/<int:activity_type_id>")
+def get_activity_type_record(activity_type_id):
+    conn = current_app.db
+    user_id = current_user_id()
+    return _single("activity_types", activity_type_id,
+                   lambda ids: get_activity_types_by_ids(conn, user_id, ids))
+
+@api_bp.route("/activity_types/<int:activity_type_id>/heatmap")
+def get_activity_type_heatmap(activity_type_id):
+    conn = current_app.db
+    user_id = current_user_id()
+    try:
+        year = int(request.args.get("year", local_today().year))
+    except ValueError:
+        raise ApiError("year must be an integer")
+    if not MINYEAR < year < MAXYEAR:
+        raise ApiError(f"year must be between {MINYEAR + 1} and "
+                       f"{MAXYEAR - 1}")
+    heatmaps = current_app.extensions["heatmaps"]
+    # Years are only cached for types the user owns, so a hit needs no
+    # ownership check.
+    if heatmaps.entries.get((user_id, activity_type_id, year)) is None \
+            and get_activity_type(conn, user_id, activity_type_id) is None:
+        raise ApiError(f"No activity_types record with id {activity_type_id}",
+                       404)
+    days = heatmaps.year(conn, user_id, activity_type_id, year)
+    return json_response({"year": year, "days": days.tolist()})
+
+# ------------------------------ ACTIVITY LOGS --------------------------------
+
+def _timed_out():
+    raise ApiError(TIMEOUT_MESSAGE, 503)
+
+@api_bp.route("/activity_logs")
+@time_budget(fallback=_timed_out)
+def list_activity_logs():
+    """
+    Logs are listed either by ids= or for one activity_type_id, optionally
+    within start/end and restricted to logs carrying all of tags=a,b.
+    """
+    conn = request_db()
+    user_id = current_user_id()
+
+    def load_for_type():
+        activity_type_id = request.args.get("activity_type_id")
+        if not activity_type_id:
+            raise ApiError("activity_type_id or ids is required")
+        try:
+            start, end = parse_time_range(request.args)
+        except ValueError:
+            raise ApiError("Invalid start or end date")
+        activity_type = get_activity_type(conn, user_id, activity_type_id)
+        if activity_type is None:
+            raise ApiError(f"No activity_types record with id "
+                           f"{activity_type_id}", 404)
+        canonical_unit_id = get_unit_group(
+                conn, activity_type["unit_group_id"])["canonical_unit_id"]
+        return get_activity_logs_for_type(
+                conn, user_id, canonical_unit_id, activity_type_id, start,
+                end, parse_tags(request.args.get("tags")))
+
+    return _collection(
+            "activity_logs",
+            load_for_type,
+            lambda ids: get_activity_logs_by_ids(conn, user_id, ids))
+
+@api_bp.route("/activity_logs/<int:log_id>")
+def get_activity_log_record(log_id):
+    conn = current_app.db
+    user_id = current_user_id()
+    return _single("activity_logs", log_id,
+                   lambda ids: get_activity_logs_by_ids(conn, user_id, ids))
+
+def _is_id(value: Any) -> bool:
+    # JSON true and false are ints to Python.
+    return isinstance(value, int) and not isinstance(value, bool)
+
+def _bulk_filter() -> Dict[str, Any]:
+    body = request.get_json(silent=True)
+    if not isinstance(body, dict):
+        raise ApiError("Expected a JSON object")
+    try:
+        start, end = parse_time_range(body)
+    except (TypeError, ValueError):
+        raise ApiError("Invalid start or end date")
+    activity_type_id = body.get("activity_type_id")
+    if activity_type_id is not None and not _is_id(activity_type_id):
+        raise ApiError("activity_type_id must be an integer")
+    log_ids = body.get("ids")
+    if log_ids is not None:
+        if not isinstance(log_ids, list) \
+                or not all(_is_id(i) for i in log_ids):
+            raise ApiError("ids must be a list of integers")
+    return {
+        "activity_type_id": activity_type_id,
+        "start": start,
+        "end": end,
+        "log_ids": log_ids,
+        "dry_run": bool(body.get("dry_run")),
+    }
+
+def _bulk_write(write: Callable[..., int], conn, *args: Any,
+        **kwargs: Any) -> int:
+    # A failed statement leaves the shared connection in an aborted
+    # transaction; roll it back so that later requests can use it.
+    try:
+        return write(conn, *args, **kwargs)
+    except ValueError as e:
+        conn.rollback()
+        raise ApiError(str(e))
+    except Exception:
+        conn.rollback()
+        raise
+
+@api_bp.route("/activity_logs/bulk_delete", methods=["POST"])
+def bulk_delete_logs():
+    conn = current_app.db
+    user_id = current_user_id()
+    log_filter = _bulk_filter()
+    count = _bulk_write(bulk_delete_activity_logs, conn, user_id,
+                        **log_filter)
+    return json_response({"count": count, "dry_run": log_filter["dry_run"]})
+
+@api_bp.route("/activity_logs/bulk_reassign", methods=["POST"])
+def bulk_reassign_logs():
+    conn = current_app.db
+    user_id = current_user_id()
+    log_filter = _bulk_filter()
+    new_activity_type_id = request.get_json().get("new_activity_type_id")
+    if new_activity_type_id is None:
+        raise ApiError("new_activity_type_id is required")
+    if not _is_id(new_activity_type_id):
+        raise ApiError("new_activity_type_id must be an integer")
+    count = _bulk_write(bulk_reassign_activity_logs, conn, user_id,
+                        new_activity_type_id, **log_filter)
+    return json_response({"count": count, "dry_run": log_filter["dry_run"]})
+
+# --------------------------------- CHANGES -----------------------------------
+
+@api_bp.route("/changes")
+def list_changes():
+    try:
+        limit = int(request.args.get("limit", CHANGES_LIMIT))
+    except ValueError:
+        raise ApiError("limit must be an integer")
+    if not 0 < limit <= MAX_CHANGES_LIMIT:
+        raise ApiError(f"limit must be between 1 and {MAX_CHANGES_LIMIT}")
+    try:
+        changes, cursor = get_changes(current_app.db, current_user_id(),
+                                      request.args.get("after"), limit)
+    except ValueError:
+        raise ApiError("Invalid cursor")
+    return json_response({"changes": changes, "cursor": cursor})
+
+# ---------------------------------- CACHES -----------------------------------
+
+@api_bp.route("/result_cache")
+def get_result_cache_stats():
+    return json_response(current_app.result_cache.stats())
+
+# EOF
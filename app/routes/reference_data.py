@@ -0,0 +1,77 @@
+# -*- coding: utf-8 -*-
+"""
+app/routes/reference_data.py
+
+Serves all reference data (the current user's activity types, unit groups
+and units) as one compact JSON document, so pages can fill dependent
+dropdowns locally instead of asking the server after every selection.
+"""
+
+# built-in module imports
+import hashlib
+import json
+
+# 3rd party module imports
+from flask import Blueprint, current_app, request
+
+# local module imports
+from app.db.activity_queries import get_all_activity_types
+from app.db.events import data_version
+from app.db.unit_queries import get_all_unit_groups, get_all_units
+from app.routes.users import current_user_id
+
+reference_data_bp = Blueprint("reference_data", __name__)
+
+TABLES = ("activity_types", "unit_groups", "units")
+FIELDS = {
+    "activity_types": ("id", "name", "unit_group_id", "goal_quantity"),
+    "unit_groups": ("id", "name"),
+    "units": ("id", "name", "group_id", "factor", "shift", "is_canonical"),
+}
+
+def build_payload(conn, user_id):
+    """
+    Builds the reference data document of a user. Each table is sent as a
+    list of field names plus a list of rows, which keeps the JSON small.
+
+    Returns:
+        tuple: (version, body) where version is a digest of the content.
+    """
+    records = {
+        "activity_types": get_all_activity_types(conn, user_id),
+        "unit_groups": get_all_unit_groups(conn),
+        "units": get_all_units(conn),
+    }
+    tables = {
+        table: {
+            "fields": FIELDS[table],
+            "rows": [[record[field] for field in FIELDS[table]]
+                     for record in sorted(rows, key=lambda r: r["id"])],
+        }
+        for table, rows in records.items()
+    }
+    content = json.dumps(tables, separators=(",", ":"), sort_keys=True)
+    # The version is derived from the content rather than from the in-process
+    # data version counters, so it stays stable across restarts and workers.
+    version = hashlib.sha1(content.encode()).hexdigest()[:16]
+    body = f'{{"version":"{version}",{content[1:]}'
+    return version, body
+
+@reference_data_bp.route("/")
+def reference_data():
+    conn = current_app.db
+    user_id = current_user_id()
+    cached = current_app.extensions.setdefault("reference_data", {}) \
+            .setdefault(user_id, {})
+    current = data_version(*TABLES)
+    if cached.get("data_version") != current:
+        cached["version"], cached["body"] = build_payload(conn, user_id)
+        cached["data_version"] = current
+
+    response = current_app.response_class(
+            cached["body"], mimetype="application/json")
+    response.set_etag(cached["version"])
+    response.cache_control.no_cache = True
+    return response.make_conditional(request)
+
+# EOF
@@ -10,6 +10,7 @@ from flask import Blueprint, current_app, render_template, request, redirect, \
                   url_for
 
 # local module imports
+from app.cache import render_fragment
 from app.db.unit_queries import delete_unit_group, get_all_unit_groups, \
         get_unit_group, insert_unit_group, update_unit_group
 
@@ -79,7 +80,6 @@ def manipulate_unit_group_start(action):
 @unit_groups_bp.route("/delete/get_unit_groups")
 def get_unit_groups():
     conn = current_app.db
-    unit_groups = get_all_unit_groups(conn)
     workflow = "/".join(request.path.split("/")[:3])
     match workflow:
         case "/unit_groups/update":
@@ -90,11 +90,12 @@ def get_unit_groups():
             hx_target="#unit-group-delete-form"
         case _:
             raise ValueError(f"Unexpected worfklow: {workflow}")
-    print(hx_get_url)
-    return render_template("unit_groups/partials/unit_group_dropdown.html",
-                           unit_groups=unit_groups,
-                           hx_get_url=hx_get_url,
-                           hx_target=hx_target
+    return render_fragment(
+            "unit_groups/partials/unit_group_dropdown.html",
+            ("unit_groups",),
+            lambda: {"unit_groups": get_all_unit_groups(conn)},
+            hx_get_url=hx_get_url,
+            hx_target=hx_target
     )
 
 @unit_groups_bp.route("/update/get_unit_group_form")
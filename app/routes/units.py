@@ -10,9 +10,11 @@ from flask import Blueprint, current_app, render_template, request, redirect, \
                   url_for
 
 # local module imports
+from app.cache import render_fragment
 from app.db.unit_queries import delete_unit, get_all_units, \
         get_all_unit_groups, get_unit, get_all_units_by_group, insert_unit, \
         update_unit
+from app.db.search_queries import search_units
 
 units_bp = Blueprint("units", __name__)
 
@@ -80,7 +82,6 @@ def update_unit_start():
 def get_units_for_group():
     group_id = request.args.get("group_id")
     conn = current_app.db
-    units = get_all_units_by_group(conn, group_id)
     workflow = "/".join(request.path.split("/")[:3])
     match workflow:
         case "/units/update":
@@ -91,10 +92,37 @@ def get_units_for_group():
             hx_target="#unit-delete-form"
         case _:
             raise ValueError(f"Unexpected worfklow: {workflow}")
-    return render_template("units/partials/unit_dropdown.html",
-                           units=units,
-                           hx_get_url=hx_get_url,
-                           hx_target=hx_target
+    return render_fragment(
+            "units/partials/unit_dropdown.html",
+            ("units",),
+            lambda: {"units": get_all_units_by_group(conn, group_id)},
+            group_id=group_id,
+            hx_get_url=hx_get_url,
+            hx_target=hx_target
+    )
+
+@units_bp.route("/search")
+def search_units_options():
+    """
+    Typeahead endpoint: the <option>s of the units best matching the text in
+    q, optionally within group_id. Once q is cleared, all units of the group
+    are listed again.
+    """
+    conn = current_app.db
+    text = request.args.get("q", "")
+    group_id = request.args.get("group_id", type=int)
+
+    def load_units():
+        if text.strip() or group_id is None:
+            return {"units": search_units(conn, text, group_id)}
+        return {"units": get_all_units_by_group(conn, group_id)}
+
+    return render_fragment(
+            "units/partials/unit_options.html",
+            ("units",),
+            load_units,
+            group_id=group_id,
+            q=text
     )
 
 @units_bp.route("/update/get_unit_form")
@@ -0,0 +1,86 @@
+# -*- coding: utf-8 -*-
+"""
+app/router/users.py
+
+Defines the routes for selecting and creating users. The selected user is
+kept in the session; every activity type and log route works on that user's
+data only. Selecting a user takes their password, if they have one. Users
+created here always have one; the default user and users created before
+passwords existed get one with "python -m app.cli password".
+"""
+
+# built-in module imports
+import sqlite3
+
+# 3rd party module imports
+import psycopg2
+from flask import Blueprint, current_app, render_template, request, \
+                  redirect, session, url_for
+
+# local module imports
+from app.db.schema import DEFAULT_USER_ID
+from app.db.user_queries import check_user_password, get_all_users, \
+        insert_user, is_password_protected
+
+users_bp = Blueprint("users", __name__)
+
+def current_user_id() -> int:
+    """
+    Returns the id of the user selected in this session, or the default user
+    if none was selected.
+    """
+    return session.get("user_id", DEFAULT_USER_ID)
+
+def require_user():
+    """
+    Request hook keeping sessions without a selected user off the data of a
+    password protected default user. Pages redirect to the user selection,
+    API requests are answered with 401.
+    """
+    if "user_id" in session or request.blueprint == "users" \
+            or request.endpoint == "static":
+        return None
+    if not is_password_protected(current_app.db, DEFAULT_USER_ID):
+        return None
+    if request.path.startswith("/api/"):
+        return "Select a user first", 401
+    return redirect(url_for("users.select_user_start"))
+
+@users_bp.route("/", methods=["GET"])
+def select_user_start():
+    conn = current_app.db
+    return render_template("users/select.html",
+                           users=get_all_users(conn),
+                           current_user_id=current_user_id())
+
+@users_bp.route("/select", methods=["POST"])
+def select_user():
+    conn = current_app.db
+    try:
+        user_id = int(request.form.get("user_id", ""))
+    except ValueError:
+        return "Invalid user", 400
+    if not check_user_password(conn, user_id, request.form.get("password")):
+        return "Unknown user or wrong password", 403
+    # A fresh session, so that nothing of the previous user carries over.
+    session.clear()
+    session["user_id"] = user_id
+    return redirect(url_for("home"))
+
+@users_bp.route("/create", methods=["POST"])
+def create_user():
+    conn = current_app.db
+    name = (request.form.get("name") or "").strip()
+    password = request.form.get("password") or ""
+    if not name or not password:
+        return "A user name and a password are required", 400
+    try:
+        user_id = insert_user(conn, name, password)
+    except (psycopg2.IntegrityError, sqlite3.IntegrityError):
+        conn.rollback()
+        return "A user with this name already exists", 400
+    session.clear()
+    session["user_id"] = user_id
+    return redirect(url_for("home"))
+
+# EOF
@@ -0,0 +1,77 @@
+// app/static/heatmap.js
+//
+// Draws the calendar heatmap of the selected activity type on the view page:
+// one cell per day, weeks as columns, darker for larger totals. The daily
+// totals come from /api/v1/activity_types/<id>/heatmap in canonical units
+// and are converted to the selected unit with the reference data. The map
+// is redrawn whenever the log table below it reloads.
+(function () {
+  const container = document.querySelector("#activity-heatmap");
+  if (!container) {
+    return;
+  }
+  const COLORS = ["#ebedf0", "#9be9a8", "#40c463", "#30a14e", "#216e39"];
+  const DAY_MS = 24 * 60 * 60 * 1000;
+
+  function field(name) {
+    const input = document.querySelector(`[name=${name}]`);
+    return input ? input.value : "";
+  }
+
+  async function unitFactor() {
+    const data = await window.referenceData;
+    const factor = data.units.fields.indexOf("factor");
+    const row = data.units.rows.find(
+      (unit) => String(unit[0]) === field("unit_id"));
+    return row ? row[factor] : 1;
+  }
+
+  async function draw() {
+    const typeId = field("activity_type_id");
+    if (!typeId) {
+      container.replaceChildren();
+      return;
+    }
+    const year = field("heatmap_year") || new Date().getFullYear();
+    const response = await fetch(
+      `/api/v1/activity_types/${typeId}/heatmap?year=${year}`);
+    if (!response.ok) {
+      container.replaceChildren();
+      return;
+    }
+    const heatmap = await response.json();
+    const factor = await unitFactor();
+    const first = new Date(Date.UTC(heatmap.year, 0, 1));
+    const days = (Date.UTC(heatmap.year + 1, 0, 1) - first) / DAY_MS;
+    const max = Math.max(...heatmap.days);
+
+    const cells = [];
+    for (let i = 0; i < days; i++) {
+      const total = heatmap.days[i];
+      const level = total > 0 ? Math.ceil(4 * total / max) : 0;
+      const cell = document.createElement("div");
+      const day = new Date(first.getTime() + i * DAY_MS);
+      cell.title = `${day.toISOString().slice(0, 10)}: ` +
+        `${+(total / factor).toFixed(2)}`;
+      cell.style.background = COLORS[level];
+      // Weeks start on Sunday; the first column starts at January 1.
+      cell.style.gridRow = day.getUTCDay() + 1;
+      cell.style.gridColumn =
+        Math.floor((i + first.getUTCDay()) / 7) + 1;
+      cells.push(cell);
+    }
+    container.replaceChildren(...cells);
+  }
+
+  document.addEventListener("change", (event) => {
+    if (["activity_type_id", "unit_id", "heatmap_year"]
+        .includes(event.target.name)) {
+      draw();
+    }
+  });
+  document.addEventListener("htmx:afterSwap", (event) => {
+    if (event.target.id === "activity-log-table") {
+      draw();
+    }
+  });
+})();
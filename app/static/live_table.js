@@ -0,0 +1,107 @@
+// app/static/live_table.js
+//
+// Keeps the activity log table of the view page current without polling.
+// It subscribes to /activity_logs/events (Server-Sent Events) and applies
+// every change to the rendered rows: logs matching the current filters are
+// inserted in timestamp order, updated logs are replaced and deleted ones
+// removed. Events carry no notes or tags, which are fetched from the API
+// for inserted and updated logs. Events without row data (SQLite backend)
+// or signalling missed events make the table reload itself instead.
+(function () {
+  const container = document.querySelector("#activity-log-table");
+  if (!container || !window.EventSource) {
+    return;
+  }
+
+  function field(name) {
+    const input = document.querySelector(`[name=${name}]`);
+    return input ? input.value : "";
+  }
+
+  function records(table) {
+    return table.rows.map((row) =>
+      Object.fromEntries(table.fields.map((name, i) => [name, row[i]])));
+  }
+
+  function reload() {
+    htmx.trigger(container, "refresh");
+  }
+
+  function matches(log) {
+    const start = field("start");
+    const end = field("end");
+    const tags = field("tags").split(",")
+      .map((tag) => tag.trim().toLowerCase())
+      .filter((tag) => tag);
+    return String(log.activity_type_id) === field("activity_type_id")
+      && (!start || log.timestamp >= start)
+      && (!end || log.timestamp.slice(0, 10) <= end)
+      && tags.every((tag) => log.tags.includes(tag));
+  }
+
+  async function renderRow(log) {
+    const data = await window.referenceData;
+    const type = records(data.activity_types)
+      .find((act) => act.id === log.activity_type_id);
+    const unit = records(data.units)
+      .find((u) => String(u.id) === field("unit_id"));
+    const row = document.createElement("tr");
+    row.dataset.logId = log.id;
+    row.dataset.timestamp = log.timestamp;
+    [
+      log.id,
+      type ? type.name : "",
+      unit ? log.canonical_quantity / unit.factor : log.canonical_quantity,
+      log.timestamp.replace("T", " "),
+      log.tags.join(", "),
+      log.notes || "",
+    ].forEach((value) => {
+      const cell = row.insertCell();
+      cell.textContent = value;
+    });
+    return row;
+  }
+
+  async function withAnnotations(event) {
+    const response = await fetch(`/api/v1/activity_logs/${event.id}`);
+    if (!response.ok) {
+      // Deleted since; its DELETE event follows.
+      return null;
+    }
+    const row = await response.json();
+    return { ...event, notes: row.notes, tags: row.tags };
+  }
+
+  async function apply(event) {
+    const body = container.querySelector("tbody");
+    if (!body || !field("unit_id")) {
+      return;
+    }
+    const log = event.op === "DELETE" ? event : await withAnnotations(event);
+    if (!log) {
+      return;
+    }
+    const existing = body.querySelector(`tr[data-log-id="${log.id}"]`);
+    if (existing) {
+      existing.remove();
+    }
+    if (log.op === "DELETE" || !matches(log)) {
+      return;
+    }
+    const row = await renderRow(log);
+    const next = Array.from(body.rows)
+      .find((other) => other.dataset.timestamp > log.timestamp);
+    body.insertBefore(row, next || null);
+  }
+
+  const source = new EventSource("/activity_logs/events");
+  source.addEventListener("activity_log", (message) => {
+    const event = JSON.parse(message.data);
+    if (event.op === "INSERT" || event.op === "UPDATE"
+        || event.op === "DELETE") {
+      apply(event);
+    } else {
+      reload();
+    }
+  });
+})();
@@ -0,0 +1,47 @@
+// app/static/reference_data.js
+//
+// Keeps the reference data document (activity types, unit groups, units) in
+// localStorage. On page load it revalidates with the server using the stored
+// version as ETag, which costs an empty 304 response unless the data changed.
+// Selects marked with data-units-target get their dependent units dropdown
+// filled locally instead of through an htmx request.
+(function () {
+  const STORAGE_KEY = "reference_data";
+
+  function records(table) {
+    return table.rows.map((row) =>
+      Object.fromEntries(table.fields.map((field, i) => [field, row[i]])));
+  }
+
+  async function load() {
+    const cached = JSON.parse(localStorage.getItem(STORAGE_KEY) || "null");
+    const headers = cached ? { "If-None-Match": `"${cached.version}"` } : {};
+    const response = await fetch("/reference_data/", { headers });
+    if (response.status === 304 && cached) {
+      return cached;
+    }
+    const data = await response.json();
+    localStorage.setItem(STORAGE_KEY, JSON.stringify(data));
+    return data;
+  }
+
+  window.referenceData = load();
+
+  document.addEventListener("change", async (event) => {
+    const select = event.target;
+    if (!select.dataset || !select.dataset.unitsTarget) {
+      return;
+    }
+    const data = await window.referenceData;
+    const type = records(data.activity_types)
+      .find((act) => String(act.id) === select.value);
+    const target = document.querySelector(select.dataset.unitsTarget);
+    target.replaceChildren(new Option("-- Select Unit --", ""));
+    if (!type) {
+      return;
+    }
+    records(data.units)
+      .filter((unit) => unit.group_id === type.unit_group_id)
+      .forEach((unit) => target.add(new Option(unit.name, unit.id)));
+  });
+})();
@@ -1,50 +1,175 @@
 # -*- coding: utf-8 -*-
-# tests/confttest.py
+# tests/conftest.py
+#
+# Database fixtures. The schema is built once per test run into a template
+# database. Every pytest-xdist worker clones its own database from the
+# template (CREATE DATABASE ... TEMPLATE is a file level copy, so it is much
+# faster than replaying the DDL), and every test runs inside a transaction
+# that is rolled back afterwards. Tests can therefore run in parallel
+# (pytest -n auto) against a single Postgres server.
 
 import os
+import uuid
+from datetime import datetime
+
 import pytest
 import psycopg2
+from psycopg2.extensions import connection
 from psycopg2.extras import RealDictCursor
 
+from app.db import activity_queries, unit_queries
+from app.db.schema import DEFAULT_USER_ID, initialize_schema
+
 TEST_DB_NAME = "testdb"
 TEST_USER = "testuser"
 TEST_PASSWORD = "testpass"
 TEST_HOST = os.getenv("TEST_DB_HOST") or "testdb"
 TEST_PORT = "5432"
 
-print("REACHED FIXTURE DESTINATION")
+TEMPLATE_DB_NAME = "testdb_template"
+WORKER_ID = os.getenv("PYTEST_XDIST_WORKER", "main")
+# Shared by all workers of one run, so the template is only built once.
+TEST_RUN_ID = os.getenv("PYTEST_XDIST_TESTRUNUID") or uuid.uuid4().hex
+
+class TransactionalConnection(connection):
+    """
+    Connection whose commit and rollback stay inside the transaction opened
+    for the current test. A commit by the code under test only moves a
+    savepoint forward, so everything it wrote is discarded at teardown.
+    """
+    in_test = False
+
+    def commit(self):
+        if not self.in_test:
+            return super().commit()
+        with self.cursor() as cur:
+            cur.execute("RELEASE SAVEPOINT test; SAVEPOINT test;")
+
+    def rollback(self):
+        if not self.in_test:
+            return super().rollback()
+        with self.cursor() as cur:
+            cur.execute("ROLLBACK TO SAVEPOINT test;")
+
+def admin_connect():
+    """
+    Opens an autocommit connection to the maintenance database, used for
+    creating and dropping databases.
+    """
+    admin = psycopg2.connect(
+        dbname="postgres",
+        user=TEST_USER,
+        password=TEST_PASSWORD,
+        host=TEST_HOST,
+        port=TEST_PORT
+    )
+    admin.autocommit = True
+    return admin
+
+def build_template(admin):
+    """
+    Creates the template database with the full schema, unless another
+    worker of the same test run already did.
+    """
+    with admin.cursor() as cur:
+        # Serializes the workers; the first one in builds the template.
+        cur.execute("SELECT pg_advisory_lock(hashtext(%s));",
+                    (TEMPLATE_DB_NAME,))
+        try:
+            cur.execute("""
+                SELECT shobj_description(oid, 'pg_database') AS run_id
+                FROM pg_database WHERE datname = %s;
+            """, (TEMPLATE_DB_NAME,))
+            row = cur.fetchone()
+            if row and row[0] == TEST_RUN_ID:
+                return
+            if row:
+                cur.execute(f"ALTER DATABASE {TEMPLATE_DB_NAME} "
+                            "IS_TEMPLATE false;")
+            cur.execute(f"DROP DATABASE IF EXISTS {TEMPLATE_DB_NAME};")
+            cur.execute(f"CREATE DATABASE {TEMPLATE_DB_NAME};")
+            template = psycopg2.connect(
+                dbname=TEMPLATE_DB_NAME,
+                user=TEST_USER,
+                password=TEST_PASSWORD,
+                host=TEST_HOST,
+                port=TEST_PORT,
+                cursor_factory=RealDictCursor
+            )
+            initialize_schema(template)
+            template.close()
+            cur.execute(f"COMMENT ON DATABASE {TEMPLATE_DB_NAME} IS %s;",
+                        (TEST_RUN_ID,))
+            cur.execute(f"ALTER DATABASE {TEMPLATE_DB_NAME} IS_TEMPLATE true;")
+        finally:
+            cur.execute("SELECT pg_advisory_unlock(hashtext(%s));",
+                        (TEMPLATE_DB_NAME,))
 
 @pytest.fixture(scope="session", autouse=True)
 def set_test_db_env():
-    os.environ["DB_NAME"] = TEST_DB_NAME
+    os.environ["DB_NAME"] = f"{TEST_DB_NAME}_{WORKER_ID}"
     os.environ["DB_USER"] = TEST_USER
     os.environ["DB_PASSWORD"] = TEST_PASSWORD
     os.environ["DB_HOST"] = TEST_HOST
     os.environ["DB_PORT"] = TEST_PORT
+    os.environ.setdefault("SECRET_KEY", "test")
 
 @pytest.fixture(scope="session")
-def conn():
+def worker_conn(set_test_db_env):
+    """
+    Session connection to this worker's clone of the template database.
+    """
+    worker_db = f"{TEST_DB_NAME}_{WORKER_ID}"
+    admin = admin_connect()
+    build_template(admin)
+    with admin.cursor() as cur:
+        cur.execute(f"DROP DATABASE IF EXISTS {worker_db};")
+        cur.execute(f"CREATE DATABASE {worker_db} "
+                    f"TEMPLATE {TEMPLATE_DB_NAME};")
+
     conn = psycopg2.connect(
-        dbname="postgres",
-        user=os.getenv("DB_USER"),
-        password=os.getenv("DB_PASSWORD"),
-        host=os.getenv("DB_HOST"),
-        port=os.getenv("DB_PORT"),
-        cursor_factory=RealDictCursor
+        dbname=worker_db,
+        user=TEST_USER,
+        password=TEST_PASSWORD,
+        host=TEST_HOST,
+        port=TEST_PORT,
+        cursor_factory=RealDictCursor,
+        connection_factory=TransactionalConnection
     )
     yield conn
     conn.close()
+    with admin.cursor() as cur:
+        cur.execute(f"DROP DATABASE IF EXISTS {worker_db};")
+    admin.close()
 
-@pytest.fixture(autouse=True)
-def test_db(conn):
-    with conn.cursor() as cur:
-        try:
-            cur.execute("TRUNCATE activity_logs RESTART IDENTITY CASCADE;")
-            cur.execute("TRUNCATE activity_types RESTART IDENTITY CASCADE;")
-        except psycopg2.errors.UndefinedTable:
-            # Tables don't exist
-            conn.rollback()
-        else:
-            conn.commit()
+@pytest.fixture
+def conn(worker_conn):
+    """
+    The worker connection, wrapped in a transaction that is rolled back when
+    the test ends.
+    """
+    with worker_conn.cursor() as cur:
+        cur.execute("SAVEPOINT test;")
+    worker_conn.in_test = True
+    yield worker_conn
+    worker_conn.in_test = False
+    worker_conn.rollback()
+
+@pytest.fixture
+def logged_type(conn):
+    group_id = unit_queries.insert_unit_group(conn, "time", "minutes")
+    unit_id = unit_queries.get_unit_group(conn, group_id)["canonical_unit_id"]
+    type_id = activity_queries.insert_activity_type(
+            conn, DEFAULT_USER_ID, group_id, "yoga")
+    for day, quantity in ((1, 10), (5, 20), (9, 30)):
+        log_id = activity_queries.insert_activity_log(
+                conn, DEFAULT_USER_ID, type_id, quantity, unit_id)
+        with conn.cursor() as cur:
+            cur.execute(
+                "UPDATE activity_logs SET timestamp = %s WHERE id = %s;",
+                (datetime(2026, 1, day, 12), log_id)
+            )
+    conn.commit()
+    return type_id, unit_id
 
 # EOF
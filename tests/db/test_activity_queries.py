@@ -1,9 +1,12 @@
 # -*- coding: utf-8 -*-
 # tests/db/test_activity_queries.py
 
+from datetime import datetime
+
 import pytest
 
-from app.db import activity_queries
+from app.db import activity_queries, user_queries
+from app.db.schema import DEFAULT_USER_ID as USER
 
 def test_insert_andd_Get_activity_type(conn):
     # Test needs to be re-written because activity_type's attributes have
@@ -13,3 +16,119 @@ def test_insert_andd_Get_activity_type(conn):
     #row = queries.get_activity_type(conn, 1)
     # assert row is not None
     pass
+
+def test_get_activity_logs_for_type_time_range(conn, logged_type):
+    type_id, unit_id = logged_type
+
+    logs = activity_queries.get_activity_logs_for_type(
+            conn, USER, unit_id, type_id)
+    assert [log["display_quantity"] for log in logs] == [10, 20, 30]
+
+    logs = activity_queries.get_activity_logs_for_type(
+            conn, USER, unit_id, type_id,
+            start=datetime(2026, 1, 5), end=datetime(2026, 1, 9))
+    assert [log["display_quantity"] for log in logs] == [20]
+
+    logs = activity_queries.get_activity_logs_for_type(
+            conn, USER, unit_id, type_id, start=datetime(2026, 1, 5))
+    assert [log["display_quantity"] for log in logs] == [20, 30]
+
+def test_activity_data_is_scoped_to_user(conn, logged_type):
+    type_id, unit_id = logged_type
+    other = user_queries.insert_user(conn, "someone else")
+
+    assert activity_queries.get_activity_type(conn, other, type_id) is None
+    assert activity_queries.get_all_activity_types(conn, other) == []
+    assert activity_queries.get_activity_logs_for_type(
+            conn, other, unit_id, type_id) == []
+    assert activity_queries.insert_activity_log(
+            conn, other, type_id, 5, unit_id) is None
+
+    # Users may reuse each other's activity type names.
+    other_type = activity_queries.insert_activity_type(
+            conn, other, activity_queries.get_activity_type(
+                conn, USER, type_id)["unit_group_id"], "yoga")
+    activity_queries.insert_activity_log(conn, other, other_type, 5, unit_id)
+    assert sum(activity_queries.get_daily_totals(
+            conn, other, other_type).values()) == 5
+    assert activity_queries.get_daily_totals(conn, USER, other_type) == {}
+
+def test_bulk_delete_and_reassign(conn, logged_type):
+    type_id, unit_id = logged_type
+    group_id = activity_queries.get_activity_type(
+            conn, USER, type_id)["unit_group_id"]
+    other_type = activity_queries.insert_activity_type(
+            conn, USER, group_id, "stretching")
+
+    with pytest.raises(ValueError):
+        activity_queries.bulk_delete_activity_logs(conn, USER)
+    assert activity_queries.bulk_reassign_activity_logs(
+            conn, USER, other_type, activity_type_id=type_id,
+            start=datetime(2026, 1, 5), dry_run=True) == 2
+    assert activity_queries.bulk_reassign_activity_logs(
+            conn, USER, other_type, activity_type_id=type_id,
+            start=datetime(2026, 1, 5), chunk_size=1) == 2
+    assert list(activity_queries.get_daily_totals(
+            conn, USER, other_type).values()) == [20, 30]
+
+    logs = activity_queries.get_activity_logs_for_type(
+            conn, USER, unit_id, other_type)
+    assert activity_queries.bulk_delete_activity_logs(
+            conn, USER, log_ids=[log["id"] for log in logs],
+            dry_run=True) == 2
+    assert activity_queries.bulk_delete_activity_logs(
+            conn, USER, activity_type_id=other_type, chunk_size=1) == 2
+    assert activity_queries.get_activity_logs_for_type(
+            conn, USER, unit_id, other_type) == []
+    assert len(activity_queries.get_activity_logs_for_type(
+            conn, USER, unit_id, type_id)) == 1
+
+def test_tags_filter_logs_and_aggregations(conn, logged_type):
+    type_id, unit_id = logged_type
+    log_id = activity_queries.insert_activity_log(
+            conn, USER, type_id, 40, unit_id, "knee felt off",
+            [" Outdoor", "injury", "outdoor"])
+    other_id = activity_queries.insert_activity_log(
+            conn, USER, type_id, 50, unit_id, tags=["outdoor"])
+
+    log = activity_queries.get_activity_log(conn, USER, unit_id, log_id)
+    assert (log["notes"], log["tags"]) == ("knee felt off",
+                                           ["injury", "outdoor"])
+    logs = activity_queries.get_activity_logs_for_type(
+            conn, USER, unit_id, type_id, tags=["OUTDOOR"])
+    assert [log["id"] for log in logs] == [log_id, other_id]
+    logs = activity_queries.get_activity_logs_for_type(
+            conn, USER, unit_id, type_id, tags=["outdoor", "injury"])
+    assert [log["id"] for log in logs] == [log_id]
+
+    _, quantities = activity_queries.get_activity_series(
+            conn, USER, type_id, tags=["injury"])
+    assert quantities == [40]
+    totals = activity_queries.get_daily_totals(conn, USER, type_id,
+                                               tags=["outdoor"])
+    assert sum(totals.values()) == 90
+
+    # Without new values the annotations are kept.
+    activity_queries.update_activity_log(conn, USER, log_id, type_id, 45,
+                                         unit_id)
+    log = activity_queries.get_activity_log(conn, USER, unit_id, log_id)
+    assert (log["notes"], log["tags"]) == ("knee felt off",
+                                           ["injury", "outdoor"])
+    activity_queries.update_activity_log(conn, USER, log_id, type_id, 45,
+                                         unit_id, tags=[])
+    log = activity_queries.get_activity_log(conn, USER, unit_id, log_id)
+    assert log["tags"] == []
+
+def test_iter_activity_logs_streams_in_batches(conn, logged_type):
+    type_id, unit_id = logged_type
+    with pytest.MonkeyPatch.context() as mp:
+        mp.setattr(activity_queries, "STREAM_BATCH_SIZE", 2)
+        logs = activity_queries.iter_activity_logs_for_type(
+                conn, USER, unit_id, type_id)
+        first = next(logs)
+        # The server-side cursor survives a commit on the same connection.
+        conn.commit()
+        rest = list(logs)
+    assert [log["display_quantity"] for log in [first] + rest] == [10, 20, 30]
+    assert rest == activity_queries.get_activity_logs_for_type(
+            conn, USER, unit_id, type_id)[1:]
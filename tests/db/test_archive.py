@@ -0,0 +1,145 @@
+# -*- coding: utf-8 -*-
+# tests/db/test_archive.py
+
+import json
+from datetime import date, datetime, timezone
+
+from app.db import activity_queries, archive, unit_queries
+from app.db.schema import DEFAULT_USER_ID as USER, initialize_schema
+from app.db.archive import archive_activity_logs, archive_cutoff
+from app.db.sqlite_backend import sqlite_connect
+from app.db.timezone import localize
+
+def test_archived_logs_are_read_back_past_cutoff(conn, logged_type, tmp_path,
+        monkeypatch):
+    monkeypatch.setenv("ACTIVITY_LOGS_ARCHIVE_DIR", str(tmp_path))
+    type_id, unit_id = logged_type
+
+    assert archive_activity_logs(conn, datetime(2026, 1, 6)) == 2
+    assert archive_cutoff() == localize(datetime(2026, 1, 6))
+    with conn.cursor() as cur:
+        cur.execute("SELECT count(*) AS n FROM activity_logs;")
+        assert cur.fetchone()["n"] == 1
+
+    logs = activity_queries.get_activity_logs_for_type(
+            conn, USER, unit_id, type_id)
+    assert [log["display_quantity"] for log in logs] == [10, 20, 30]
+
+    logs = activity_queries.get_activity_logs_for_type(
+            conn, USER, unit_id, type_id, start=datetime(2026, 1, 6))
+    assert [log["display_quantity"] for log in logs] == [30]
+
+    totals = activity_queries.get_daily_totals(
+            conn, USER, type_id, start=datetime(2026, 1, 2))
+    assert totals == {date(2026, 1, 5): 20, date(2026, 1, 9): 30}
+
+def test_archive_runs_in_batches_after_interrupted_run(conn, logged_type,
+        tmp_path, monkeypatch):
+    type_id, unit_id = logged_type
+    monkeypatch.setattr(archive, "ARCHIVE_BATCH_SIZE", 1)
+    # Left over from a run interrupted before run.json was written.
+    (tmp_path / "run_20260106T000000_1").mkdir()
+    (tmp_path / "run_20260106T000000_1" / "logs_1.jsonl.gz").write_bytes(b"")
+
+    assert archive_activity_logs(conn, datetime(2026, 1, 6),
+                                 str(tmp_path)) == 2
+    with open(tmp_path / "manifest.json") as f:
+        runs = json.load(f)["runs"]
+    assert len(runs) == 2
+    assert sorted(path.name for path in tmp_path.iterdir()) \
+        == sorted([run["name"] for run in runs] + ["manifest.json"])
+
+    monkeypatch.setenv("ACTIVITY_LOGS_ARCHIVE_DIR", str(tmp_path))
+    logs = activity_queries.get_activity_logs_for_type(
+            conn, USER, unit_id, type_id)
+    assert [log["display_quantity"] for log in logs] == [10, 20, 30]
+
+def test_cutoff_is_compared_as_a_point_in_time(conn, logged_type, tmp_path,
+        monkeypatch):
+    monkeypatch.setenv("APP_TIMEZONE", "America/New_York")
+    # Naive cutoff of an older archive: 08:00 UTC, later than the new one
+    # although its text sorts first.
+    (tmp_path / "manifest.json").write_text(
+        json.dumps({"cutoff": "2026-01-06T03:00:00", "runs": []}))
+
+    assert archive_activity_logs(
+        conn, datetime(2026, 1, 6, 5, tzinfo=timezone.utc),
+        str(tmp_path)) == 2
+    assert archive_cutoff(str(tmp_path)) \
+        == datetime(2026, 1, 6, 8, tzinfo=timezone.utc)
+    with open(tmp_path / "manifest.json") as f:
+        assert json.load(f)["cutoff"] == "2026-01-06T08:00:00+00:00"
+
+def test_archival_is_logged_apart_from_deletes(conn, logged_type, tmp_path):
+    archive_activity_logs(conn, datetime(2026, 1, 6), str(tmp_path))
+    with conn.cursor() as cur:
+        cur.execute("DELETE FROM activity_logs;")
+        cur.execute("SELECT op FROM change_log "
+                    "WHERE op IN ('ARCHIVE', 'DELETE') "
+                    "ORDER BY id;")
+        assert [row["op"] for row in cur.fetchall()] \
+            == ["ARCHIVE", "ARCHIVE", "DELETE"]
+
+def test_sqlite_archival_is_logged_apart_from_deletes(tmp_path):
+    conn = sqlite_connect(str(tmp_path / "test.db"))
+    initialize_schema(conn)
+    group_id = unit_queries.insert_unit_group(conn, "time", "minutes")
+    unit_id = unit_queries.get_unit_group(conn, group_id)["canonical_unit_id"]
+    type_id = activity_queries.insert_activity_type(conn, USER, group_id,
+                                                    "yoga")
+    for day in (1, 9):
+        log_id = activity_queries.insert_activity_log(
+                conn, USER, type_id, 10, unit_id)
+        with conn.cursor() as cur:
+            cur.execute(
+                "UPDATE activity_logs SET timestamp = %s WHERE id = %s;",
+                (datetime(2026, 1, day, 12), log_id))
+    conn.commit()
+
+    archive_activity_logs(conn, datetime(2026, 1, 6),
+                          str(tmp_path / "archive"))
+    with conn.cursor() as cur:
+        cur.execute("DELETE FROM activity_logs;")
+        cur.execute("SELECT op FROM change_log "
+                    "WHERE op IN ('ARCHIVE', 'DELETE') "
+                    "ORDER BY id;")
+        assert [row["op"] for row in cur.fetchall()] == ["ARCHIVE", "DELETE"]
+    conn.close()
+
+def test_manifest_is_parsed_again_only_once_changed(tmp_path, monkeypatch):
+    loads = []
+    load = json.load
+    monkeypatch.setattr(archive.json, "load",
+                        lambda f: loads.append(f.name) or load(f))
+    manifest = {"cutoff": "2026-01-06T00:00:00+00:00", "runs": []}
+    (tmp_path / "manifest.json").write_text(json.dumps(manifest))
+
+    for _ in range(3):
+        assert archive_cutoff(str(tmp_path)) \
+            == datetime(2026, 1, 6, tzinfo=timezone.utc)
+    assert len(loads) == 1
+
+    manifest["cutoff"] = "2026-02-01T00:00:00+00:00"
+    archive._write_manifest(str(tmp_path), manifest)
+    assert archive_cutoff(str(tmp_path)) \
+        == datetime(2026, 2, 1, tzinfo=timezone.utc)
+    assert len(loads) == 2
+
+def test_whole_history_streams_archived_logs(conn, logged_type, tmp_path,
+        monkeypatch):
+    monkeypatch.setenv("ACTIVITY_LOGS_ARCHIVE_DIR", str(tmp_path))
+    monkeypatch.setattr(archive, "ARCHIVE_BATCH_SIZE", 1)
+    type_id, _ = logged_type
+    with conn.cursor() as cur:
+        # Runs are cut in id order, so these overlap in time.
+        cur.execute("UPDATE activity_logs SET timestamp = %s "
+                    "WHERE canonical_quantity = 10;",
+                    (datetime(2026, 1, 7, 12),))
+    conn.commit()
+    archive_activity_logs(conn, datetime(2026, 1, 8))
+    archive._load_logs.cache_clear()
+
+    count, rows = activity_queries.iter_activity_series(conn, USER, type_id)
+    assert count == 3
+    assert [row["canonical_quantity"] for row in rows] == [20, 10, 30]
+    assert archive._load_logs.cache_info().currsize == 0
@@ -0,0 +1,212 @@
+# -*- coding: utf-8 -*-
+# tests/db/test_change_log.py
+
+import os
+import time
+from datetime import datetime, timezone
+
+import psycopg2
+import pytest
+from psycopg2.extras import RealDictCursor
+
+from app.cache import ResultCache
+from app.db import activity_queries, events, unit_queries
+from app.db.change_queries import ExternalWrites, get_changes
+from app.db.schema import DEFAULT_USER_ID as USER, initialize_schema
+from app.db.sqlite_backend import sqlite_connect
+
+SCRATCH_DB_NAME = \
+    f"change_log_testdb_{os.getenv('PYTEST_XDIST_WORKER', 'main')}"
+
+def _connect(dbname, **kwargs):
+    return psycopg2.connect(
+        dbname=dbname,
+        user=os.getenv("DB_USER"),
+        password=os.getenv("DB_PASSWORD"),
+        host=os.getenv("DB_HOST"),
+        port=os.getenv("DB_PORT"),
+        cursor_factory=RealDictCursor,
+        **kwargs
+    )
+
+@pytest.fixture
+def scratch_conn():
+    # The feed only returns entries of finished transactions, which the
+    # savepoint based conn fixture never has.
+    admin = _connect("postgres")
+    admin.autocommit = True
+    with admin.cursor() as cur:
+        cur.execute(f"DROP DATABASE IF EXISTS {SCRATCH_DB_NAME};")
+        cur.execute(f"CREATE DATABASE {SCRATCH_DB_NAME};")
+    scratch = _connect(SCRATCH_DB_NAME)
+    initialize_schema(scratch)
+    yield scratch
+    scratch.close()
+    with admin.cursor() as cur:
+        cur.execute(f"DROP DATABASE IF EXISTS {SCRATCH_DB_NAME};")
+    admin.close()
+
+def _log_changes(conn):
+    group_id = unit_queries.insert_unit_group(conn, "time", "minutes")
+    unit_id = unit_queries.get_unit_group(conn, group_id)["canonical_unit_id"]
+    type_id = activity_queries.insert_activity_type(conn, USER, group_id,
+                                                    "yoga")
+    log_id = activity_queries.insert_activity_log(conn, USER, type_id, 10,
+                                                  unit_id, tags=["am"])
+    activity_queries.update_activity_log(conn, USER, log_id, type_id, 15,
+                                         unit_id)
+    activity_queries.delete_activity_log(conn, USER, log_id)
+    return log_id
+
+def _read(conn, user_id, count, cursor=None, limit=100):
+    # Entries are held back while any transaction of the cluster that
+    # started before them is open, such as those of parallel test workers.
+    changes, deadline = [], time.monotonic() + 30
+    while len(changes) < count and time.monotonic() < deadline:
+        page, cursor = get_changes(conn, user_id, cursor, limit)
+        changes.extend(page)
+        if not page:
+            time.sleep(0.05)
+    return changes, cursor
+
+def test_changes_are_fed_in_commit_order(scratch_conn):
+    conn = scratch_conn
+    log_id = _log_changes(conn)
+
+    changes, cursor = _read(conn, USER, 7, limit=2)
+    assert [(c["table_name"], c["op"]) for c in changes] == [
+        ("unit_groups", "INSERT"), ("units", "INSERT"),
+        ("units", "UPDATE"), ("activity_types", "INSERT"),
+        ("activity_logs", "INSERT"), ("activity_logs", "UPDATE"),
+        ("activity_logs", "DELETE")]
+    logged = changes[-3:]
+    assert all(c["row_id"] == log_id for c in logged)
+    assert logged[0]["data"]["tags"] == ["am"]
+    assert [c["data"]["canonical_quantity"] for c in logged] == [10, 15, 15]
+    assert get_changes(conn, USER, cursor) == ([], cursor)
+    with conn.cursor() as cur:
+        cur.execute("INSERT INTO users (name) VALUES ('other') RETURNING id;")
+        other = cur.fetchone()["id"]
+    conn.commit()
+    assert [c["table_name"] for c in _read(conn, other, 3)[0]] \
+        == ["unit_groups", "units", "units"]
+
+    # A transaction that started first but commits last must not be skipped
+    # by a consumer that has already read past its entry ids.
+    slow = _connect(SCRATCH_DB_NAME)
+    try:
+        with slow.cursor() as cur:
+            cur.execute("INSERT INTO unit_groups (name) VALUES ('slow');")
+        unit_queries.insert_unit_group(conn, "distance", "km")
+        page, cursor = get_changes(conn, USER, cursor)
+        assert page == []
+        slow.commit()
+        page, cursor = _read(conn, USER, 4, cursor)
+        assert [c["data"]["name"] for c in page if c["op"] == "INSERT"
+                and c["table_name"] == "unit_groups"] == ["slow", "distance"]
+    finally:
+        slow.close()
+
+def test_truncate_is_fed(scratch_conn):
+    conn = scratch_conn
+    _log_changes(conn)
+    _, cursor = _read(conn, USER, 7)
+    with conn.cursor() as cur:
+        cur.execute("TRUNCATE activity_logs;")
+    conn.commit()
+    changes, _ = _read(conn, USER, 1, cursor)
+    assert [(c["table_name"], c["op"], c["row_id"]) for c in changes] \
+        == [("activity_logs", "TRUNCATE", None)]
+
+def test_writes_of_other_processes_invalidate_caches(scratch_conn,
+        monkeypatch):
+    conn = scratch_conn
+    monkeypatch.setattr(events, "_callbacks", [])
+    cache = ResultCache(1024 * 1024)
+    events.on_write(cache.apply)
+    writes = ExternalWrites(0)
+    writes.start(conn)
+    calls = []
+
+    def count_calls(conn, user_id):
+        calls.append(user_id)
+        return len(calls)
+
+    assert cache.call(count_calls, conn, USER) == 1
+    assert cache.call(count_calls, conn, USER) == 1
+    version = events.data_version("unit_groups")
+    own = _connect(SCRATCH_DB_NAME,
+                   application_name=events.process_origin())
+    other = _connect(SCRATCH_DB_NAME)
+    try:
+        for writer, name in ((own, "own"), (other, "other")):
+            with writer.cursor() as cur:
+                cur.execute("INSERT INTO unit_groups (name) VALUES (%s);",
+                            (name,))
+            writer.commit()
+    finally:
+        own.close()
+        other.close()
+
+    external, deadline = 0, time.monotonic() + 30
+    while not external and time.monotonic() < deadline:
+        assert writes.due()
+        external = writes.poll(conn)
+        time.sleep(0.05)
+    # Only the other process's write is recorded; this process recorded
+    # its own when making it.
+    assert external == 1
+    assert events.data_version("unit_groups") == (version[0] + 1,)
+    assert cache.call(count_calls, conn, USER) == 2
+
+def test_logs_written_by_other_processes_are_passed_on(scratch_conn,
+        monkeypatch):
+    conn = scratch_conn
+    type_id = activity_queries.insert_activity_type(
+            conn, USER, unit_queries.insert_unit_group(conn, "time", "min"),
+            "yoga")
+    writes = ExternalWrites(0)
+    writes.start(conn)
+    recorded = []
+    # The setup writes may be read back too while parallel test workers
+    # hold back the feed.
+    monkeypatch.setattr(events, "_callbacks", [
+        lambda table, changes, external: table == "activity_logs"
+        and recorded.append((changes, external))])
+    other = _connect(SCRATCH_DB_NAME)
+    try:
+        with other.cursor() as cur:
+            cur.execute("""
+                INSERT INTO activity_logs
+                    (user_id, activity_type_id, canonical_quantity,
+                     timestamp)
+                VALUES (%s, %s, 5, '2026-01-01 12:00+00');
+            """, (USER, type_id))
+        other.commit()
+    finally:
+        other.close()
+
+    deadline = time.monotonic() + 30
+    while not recorded and time.monotonic() < deadline:
+        writes.poll(conn)
+        time.sleep(0.05)
+    [([(old, new)], external)] = recorded
+    assert (old, external) == (None, True)
+    assert (new["activity_type_id"], new["canonical_quantity"]) \
+        == (type_id, 5)
+    assert new["timestamp"] == datetime(2026, 1, 1, 12, tzinfo=timezone.utc)
+
+def test_sqlite_changes_are_fed(tmp_path):
+    conn = sqlite_connect(str(tmp_path / "test.db"))
+    initialize_schema(conn)
+    log_id = _log_changes(conn)
+
+    changes, cursor = _read(conn, USER, 7, limit=3)
+    assert [(c["table_name"], c["op"]) for c in changes][-3:] == [
+        ("activity_logs", "INSERT"), ("activity_logs", "UPDATE"),
+        ("activity_logs", "DELETE")]
+    assert changes[-3]["row_id"] == log_id
+    assert changes[-3]["data"]["tags"] == ["am"]
+    assert changes[-1]["data"]["canonical_quantity"] == 15
+    assert cursor == f"0-{changes[-1]['id']}"
+    conn.close()
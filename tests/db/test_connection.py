@@ -3,7 +3,12 @@
 
 import os
 from unittest.mock import patch, MagicMock
-from app.db.connection import db_connect, db_close
+
+import pytest
+
+from app.db.connection import ConnectionPool, QueryTimeout, db_connect, \
+        db_close, primary_connect, statement_timeout
+from app.db.events import process_origin
 
 def test_db_connect():
     with patch.dict(
@@ -12,7 +17,8 @@ def test_db_connect():
          "DB_USER": "testuser",
          "DB_PASSWORD": "testpass",
          "DB_HOST": "localhost",
-         "DB_PORT": "5432"}):
+         "DB_PORT": "5432",
+         "APP_TIMEZONE": "Europe/Berlin"}):
 
             with patch("app.db.connection.connect") as mock_connect:
                 mock_conn = MagicMock()
@@ -26,6 +32,8 @@ def test_db_connect():
                     password="testpass",
                     host="localhost",
                     port="5432",
+                    options="-c TimeZone=Europe/Berlin",
+                    application_name=process_origin(),
                     cursor_factory=mock_connect.call_args \
                                                .kwargs["cursor_factory"]
                 )
@@ -44,3 +52,33 @@ def test_db_close_when_closed():
     mock_conn.closed = True
     db_close(mock_conn)
     mock_conn.close.assert_not_called()
+
+def test_statement_timeout_cancels_slow_query(conn):
+    with pytest.raises(QueryTimeout):
+        with statement_timeout(conn, 50), conn.cursor() as cur:
+            cur.execute("SELECT pg_sleep(1);")
+    # The connection is usable again and the limit has been lifted.
+    with conn.cursor() as cur:
+        cur.execute("SHOW statement_timeout;")
+        assert cur.fetchone()["statement_timeout"] == "0"
+
+def test_pooled_budget_ends_with_its_transaction():
+    pool = ConnectionPool(primary_connect, size=1)
+    with pool.connection() as conn:
+        with statement_timeout(conn, 50), conn.cursor() as cur:
+            cur.execute("SHOW statement_timeout;")
+            assert cur.fetchone()["statement_timeout"] == "50ms"
+        # Set with SET LOCAL, so the commit lifted it.
+        with conn.cursor() as cur:
+            cur.execute("SHOW statement_timeout;")
+            assert cur.fetchone()["statement_timeout"] == "0"
+            cur.execute("CREATE TEMPORARY TABLE left_open (id int);")
+        first = conn
+    with pool.connection() as conn:
+        assert conn is first
+        # The uncommitted work was rolled back on return.
+        with conn.cursor() as cur:
+            cur.execute("SELECT to_regclass('left_open') IS NULL AS gone;")
+            assert cur.fetchone()["gone"]
+    pool.close()
+    assert first.closed
@@ -0,0 +1,110 @@
+# -*- coding: utf-8 -*-
+# tests/db/test_replica.py
+#
+# The routing tests need a streaming replica of the test server, given by
+# TEST_REPLICA_HOST and TEST_REPLICA_PORT, e.g. one made with
+#   pg_basebackup -h <test server> -D <dir> -R -X stream
+# and started on another port.
+
+import os
+import time
+
+import psycopg2
+import pytest
+from psycopg2.extras import RealDictCursor
+
+from app.db import unit_queries
+from app.db.connection import RoutedConnection, replica_connect
+from app.db.schema import initialize_schema
+
+REPLICA_HOST = os.getenv("TEST_REPLICA_HOST")
+REPLICA_PORT = os.getenv("TEST_REPLICA_PORT", "5432")
+SCRATCH_DB_NAME = f"replica_testdb_{os.getenv('PYTEST_XDIST_WORKER', 'main')}"
+
+def replica_dsn(host, port):
+    return (f"dbname={SCRATCH_DB_NAME} user={os.getenv('DB_USER')} "
+            f"password={os.getenv('DB_PASSWORD')} host={host} port={port}")
+
+@pytest.fixture
+def scratch_primary(worker_conn):
+    admin = psycopg2.connect(
+        dbname="postgres",
+        user=os.getenv("DB_USER"),
+        password=os.getenv("DB_PASSWORD"),
+        host=os.getenv("DB_HOST"),
+        port=os.getenv("DB_PORT")
+    )
+    admin.autocommit = True
+    with admin.cursor() as cur:
+        cur.execute(f"DROP DATABASE IF EXISTS {SCRATCH_DB_NAME};")
+        cur.execute(f"CREATE DATABASE {SCRATCH_DB_NAME};")
+    primary = psycopg2.connect(
+        replica_dsn(os.getenv("DB_HOST"), os.getenv("DB_PORT")),
+        cursor_factory=RealDictCursor
+    )
+    initialize_schema(primary)
+    yield primary
+    primary.close()
+    with admin.cursor() as cur:
+        cur.execute(f"DROP DATABASE IF EXISTS {SCRATCH_DB_NAME};")
+    admin.close()
+
+def connect_replica():
+    # The new database shows up on the replica once its creation replayed.
+    for _ in range(50):
+        try:
+            return replica_connect(replica_dsn(REPLICA_HOST, REPLICA_PORT))
+        except psycopg2.OperationalError:
+            time.sleep(0.1)
+    raise TimeoutError("Replica did not catch up")
+
+def test_reads_fall_back_to_primary_without_standby(scratch_primary):
+    # A second connection to the primary is not in recovery, so it is never
+    # trusted as a replica.
+    not_a_standby = replica_connect(
+            replica_dsn(os.getenv("DB_HOST"), os.getenv("DB_PORT")))
+    conn = RoutedConnection(scratch_primary, not_a_standby)
+    unit_queries.get_all_unit_groups(conn)
+    assert conn.reads == {"primary": 1, "replica": 0}
+    conn.close()
+
+def test_only_committed_writes_are_waited_for(scratch_primary):
+    conn = RoutedConnection(scratch_primary, replica_connect(
+            replica_dsn(os.getenv("DB_HOST"), os.getenv("DB_PORT"))))
+    with conn.cursor() as cur:
+        cur.execute("SELECT count(*) FROM unit_groups;")
+    conn.commit()
+    conn.commit()
+    assert conn.writes.lsn is None
+
+    unit_queries.insert_unit_group(conn, "time", "minutes")
+    assert conn.writes.lsn is not None
+    conn.close()
+
+@pytest.mark.skipif(REPLICA_HOST is None, reason="No replica configured")
+def test_reads_are_routed_to_caught_up_replica(scratch_primary):
+    conn = RoutedConnection(scratch_primary, connect_replica())
+
+    group_id = unit_queries.insert_unit_group(conn, "time", "minutes")
+    # Read-your-writes: whichever side serves it, the new group is there.
+    assert unit_queries.get_unit_group(conn, group_id)["name"] == "time"
+
+    for _ in range(50):
+        assert unit_queries.get_all_unit_groups(conn)
+        if conn.reads["replica"]:
+            break
+        time.sleep(0.1)
+    assert conn.reads["replica"] > 0
+
+    with conn.replica.cursor() as cur:
+        cur.execute("SELECT pg_wal_replay_pause();")
+    try:
+        unit_queries.insert_unit_group(conn, "distance", "km")
+        reads_on_replica = conn.reads["replica"]
+        names = [g["name"] for g in unit_queries.get_all_unit_groups(conn)]
+        assert "distance" in names
+        assert conn.reads["replica"] == reads_on_replica
+    finally:
+        with conn.replica.cursor() as cur:
+            cur.execute("SELECT pg_wal_replay_resume();")
+    conn.close()
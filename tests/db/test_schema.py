@@ -7,7 +7,12 @@ import os
 import pytest
 import psycopg2
 from psycopg2.extensions import connection
-from app.db.schema import initialize_schema, table_exists
+from psycopg2.extras import RealDictCursor
+from datetime import date, datetime, timezone
+from app.db.activity_queries import GET_DAILY_TOTALS, get_daily_totals
+from app.db.schema import apply_app_timezone, detach_partition, \
+        initialize_schema, index_exists, is_partitioned, list_partitions, \
+        migrate_activity_logs_to_partitioned, table_exists
 
 TEST_DB_NAME = "testdb"
 TEST_USER = "testuser"
@@ -72,13 +77,214 @@ def connect_test_db():
 """
 
 @pytest.fixture(scope="module")
-def test_db(conn):
-    create_test_database(conn)
+def test_db(worker_conn):
+    create_test_database(worker_conn)
     yield
-    drop_test_database(conn)
+    drop_test_database(worker_conn)
 
 def test_schema_initialization_create_tables(test_db, conn):
     initialize_schema(conn)
 
     assert table_exists(conn, "activity_types")
     assert table_exists(conn, "activity_logs")
+
+SCRATCH_DB_NAME = f"partition_testdb_{os.getenv('PYTEST_XDIST_WORKER', 'main')}"
+
+@pytest.fixture
+def scratch_conn():
+    admin = psycopg2.connect(
+        dbname="postgres",
+        user=os.getenv("DB_USER"),
+        password=os.getenv("DB_PASSWORD"),
+        host=os.getenv("DB_HOST"),
+        port=os.getenv("DB_PORT")
+    )
+    admin.autocommit = True
+    with admin.cursor() as cur:
+        cur.execute(f"DROP DATABASE IF EXISTS {SCRATCH_DB_NAME};")
+        cur.execute(f"CREATE DATABASE {SCRATCH_DB_NAME};")
+    scratch = psycopg2.connect(
+        dbname=SCRATCH_DB_NAME,
+        user=os.getenv("DB_USER"),
+        password=os.getenv("DB_PASSWORD"),
+        host=os.getenv("DB_HOST"),
+        port=os.getenv("DB_PORT"),
+        cursor_factory=RealDictCursor
+    )
+    yield scratch
+    scratch.close()
+    with admin.cursor() as cur:
+        cur.execute(f"DROP DATABASE IF EXISTS {SCRATCH_DB_NAME};")
+    admin.close()
+
+def test_migrate_activity_logs_to_partitioned(scratch_conn):
+    conn = scratch_conn
+    initialize_schema(conn)
+    with conn.cursor() as cur:
+        cur.execute("INSERT INTO unit_groups (name) VALUES ('time');")
+        cur.execute("""
+            INSERT INTO activity_types (user_id, name, unit_group_id)
+            VALUES (1, 'yoga', 1);
+        """)
+        cur.execute("""
+            INSERT INTO activity_logs
+                (user_id, activity_type_id, canonical_quantity, timestamp)
+            SELECT 1, 1, n, TIMESTAMP '2025-11-15' + n * INTERVAL '1 day'
+            FROM generate_series(1, 90) n;
+        """)
+    conn.commit()
+
+    migrate_activity_logs_to_partitioned(conn, "month", batch_size=25)
+
+    assert is_partitioned(conn, "activity_logs")
+    with conn.cursor() as cur:
+        cur.execute("""
+            SELECT tgname FROM pg_trigger
+            WHERE tgrelid = 'activity_logs'::regclass AND NOT tgisinternal
+            ORDER BY tgname;
+        """)
+        assert [row["tgname"] for row in cur.fetchall()] == [
+            "activity_logs_notify", "change_log_record",
+            "change_log_truncate"]
+    names = [p["name"] for p in list_partitions(conn)]
+    assert "activity_logs_y2026m01" in names
+    with conn.cursor() as cur:
+        cur.execute("SELECT count(*) AS n FROM activity_logs;")
+        assert cur.fetchone()["n"] == 90
+        cur.execute("""
+            INSERT INTO activity_logs
+                (user_id, activity_type_id, canonical_quantity)
+            VALUES (1, 1, 1) RETURNING id;
+        """)
+        assert cur.fetchone()["id"] == 91
+        cur.execute("SELECT count(*) AS n FROM activity_logs_default;")
+        assert cur.fetchone()["n"] == 0
+    conn.commit()
+
+    detach_partition(conn, "activity_logs_y2026m01")
+    with conn.cursor() as cur:
+        cur.execute("SELECT count(*) AS n FROM activity_logs;")
+        assert cur.fetchone()["n"] == 91 - 31
+
+def test_single_user_schema_is_migrated(scratch_conn):
+    conn = scratch_conn
+    with conn.cursor() as cur:
+        cur.execute("""
+            CREATE TABLE unit_groups (id SERIAL PRIMARY KEY,
+                                      name TEXT UNIQUE NOT NULL);
+            CREATE TABLE activity_types (
+                id SERIAL PRIMARY KEY,
+                name TEXT UNIQUE NOT NULL,
+                unit_group_id INTEGER NOT NULL REFERENCES unit_groups(id),
+                goal_quantity DOUBLE PRECISION);
+            CREATE TABLE activity_logs (
+                id SERIAL PRIMARY KEY,
+                activity_type_id INTEGER NOT NULL
+                    REFERENCES activity_types(id),
+                canonical_quantity DOUBLE PRECISION NOT NULL,
+                timestamp TIMESTAMP NOT NULL DEFAULT NOW());
+            INSERT INTO unit_groups (name) VALUES ('time');
+            INSERT INTO activity_types (name, unit_group_id)
+            VALUES ('yoga', 1);
+            INSERT INTO activity_logs (activity_type_id, canonical_quantity)
+            VALUES (1, 10);
+        """)
+    conn.commit()
+
+    initialize_schema(conn)
+
+    assert index_exists(conn, "activity_logs_user_type_timestamp")
+    with conn.cursor() as cur:
+        cur.execute("SELECT user_id FROM activity_logs;")
+        assert cur.fetchone()["user_id"] == 1
+        cur.execute("INSERT INTO users (name) VALUES ('second') "
+                    "RETURNING id;")
+        second = cur.fetchone()["id"]
+        cur.execute("""
+            INSERT INTO activity_types (user_id, name, unit_group_id)
+            VALUES (%s, 'yoga', 1);
+        """, (second,))
+    conn.commit()
+
+def test_days_are_bucketed_in_app_timezone(scratch_conn, monkeypatch):
+    conn = scratch_conn
+    monkeypatch.setenv("APP_TIMEZONE", "Europe/Berlin")
+    with conn.cursor() as cur:
+        cur.execute("""
+            CREATE TABLE unit_groups (id SERIAL PRIMARY KEY,
+                                      name TEXT UNIQUE NOT NULL);
+            CREATE TABLE activity_types (
+                id SERIAL PRIMARY KEY,
+                name TEXT UNIQUE NOT NULL,
+                unit_group_id INTEGER NOT NULL REFERENCES unit_groups(id),
+                goal_quantity DOUBLE PRECISION);
+            CREATE TABLE activity_logs (
+                id SERIAL PRIMARY KEY,
+                activity_type_id INTEGER NOT NULL
+                    REFERENCES activity_types(id),
+                canonical_quantity DOUBLE PRECISION NOT NULL,
+                timestamp TIMESTAMP NOT NULL DEFAULT NOW());
+            INSERT INTO unit_groups (name) VALUES ('time');
+            INSERT INTO activity_types (name, unit_group_id)
+            VALUES ('yoga', 1);
+            INSERT INTO activity_logs
+                (activity_type_id, canonical_quantity, timestamp)
+            VALUES (1, 10, '2026-01-01 23:30');
+        """)
+    conn.commit()
+
+    # The naive wall time was Berlin time.
+    initialize_schema(conn)
+    with conn.cursor() as cur:
+        cur.execute("SELECT timestamp FROM activity_logs;")
+        assert cur.fetchone()["timestamp"] \
+            == datetime(2026, 1, 1, 22, 30, tzinfo=timezone.utc)
+        cur.execute("""
+            INSERT INTO activity_logs
+                (user_id, activity_type_id, canonical_quantity, timestamp)
+            VALUES (1, 1, 5, %s);
+        """, (datetime(2026, 1, 1, 23, 30, tzinfo=timezone.utc),))
+    conn.commit()
+    start, end = datetime(2026, 1, 1), datetime(2026, 1, 3)
+    assert get_daily_totals(conn, 1, 1, start, end) \
+        == {date(2026, 1, 1): 10, date(2026, 1, 2): 5}
+
+    with conn.cursor() as cur:
+        cur.execute("SET LOCAL enable_seqscan = off;"
+                    "SET LOCAL enable_sort = off;"
+                    "SET LOCAL enable_hashagg = off;")
+        cur.execute("EXPLAIN " + GET_DAILY_TOTALS,
+                    (1, 1, start, start, end, end, start, start, end, end,
+                     None, None))
+        plan = "\n".join(row["QUERY PLAN"] for row in cur.fetchall())
+    conn.rollback()
+    assert "activity_logs_user_type_local_day" in plan
+
+    # Changing the zone rebuilds the index for the new days.
+    monkeypatch.setenv("APP_TIMEZONE", "UTC")
+    apply_app_timezone(conn)
+    assert get_daily_totals(conn, 1, 1) == {date(2026, 1, 1): 15}
+
+def test_partitioned_local_day_index_follows_app_timezone(scratch_conn,
+        monkeypatch):
+    conn = scratch_conn
+    monkeypatch.setenv("APP_TIMEZONE", "Europe/Berlin")
+    initialize_schema(conn, "month")
+    assert is_partitioned(conn, "activity_logs")
+    with conn.cursor() as cur:
+        cur.execute("INSERT INTO unit_groups (name) VALUES ('time');")
+        cur.execute("""
+            INSERT INTO activity_types (user_id, name, unit_group_id)
+            VALUES (1, 'yoga', 1);
+            INSERT INTO activity_logs
+                (user_id, activity_type_id, canonical_quantity, timestamp)
+            VALUES (1, 1, 10, '2026-01-01 23:30+00');
+        """)
+    conn.commit()
+    assert get_daily_totals(conn, 1, 1) == {date(2026, 1, 2): 10}
+
+    monkeypatch.setenv("APP_TIMEZONE", "UTC")
+    apply_app_timezone(conn)
+    assert index_exists(conn, "activity_logs_user_type_local_day")
+    assert get_daily_totals(conn, 1, 1) == {date(2026, 1, 1): 10}
+
@@ -0,0 +1,48 @@
+# -*- coding: utf-8 -*-
+# tests/db/test_search_queries.py
+
+import pytest
+
+from app.db import activity_queries, unit_queries
+from app.db.schema import DEFAULT_USER_ID as USER, initialize_schema
+from app.db.search_queries import search_activity_types, search_units, \
+        trigram_search_available
+from app.db.sqlite_backend import sqlite_connect
+
+@pytest.fixture
+def named_types(conn):
+    group_id = unit_queries.insert_unit_group(conn, "time", "minutes")
+    for name in ("yoga", "power yoga", "cycling", "100% effort"):
+        activity_queries.insert_activity_type(conn, USER, group_id, name)
+    return group_id
+
+def names(rows):
+    return [row["name"] for row in rows]
+
+def test_search_ranks_prefix_matches_first(conn, named_types):
+    assert names(search_activity_types(conn, USER, "YOG"))[:2] \
+        == ["yoga", "power yoga"]
+    assert names(search_activity_types(conn, USER, "", limit=2)) \
+        == ["100% effort", "cycling"]
+
+def test_search_escapes_like_wildcards(conn, named_types):
+    assert names(search_activity_types(conn, USER, "0%")) == ["100% effort"]
+
+def test_search_units_within_group(conn, named_types):
+    other = unit_queries.insert_unit_group(conn, "distance", "minimeters")
+    assert names(search_units(conn, "min", named_types)) == ["minutes"]
+    assert set(names(search_units(conn, "min"))) == {"minutes", "minimeters"}
+
+def test_search_tolerates_typos_with_trigrams(conn, named_types):
+    if not trigram_search_available(conn):
+        pytest.skip("pg_trgm is not installed")
+    assert "cycling" in names(search_activity_types(conn, USER, "cyclign"))
+
+def test_search_on_sqlite(tmp_path):
+    conn = sqlite_connect(str(tmp_path / "test.db"))
+    initialize_schema(conn)
+    group_id = unit_queries.insert_unit_group(conn, "time", "minutes")
+    activity_queries.insert_activity_type(conn, USER, group_id, "Power Yoga")
+    assert names(search_activity_types(conn, USER, "yo")) == ["Power Yoga"]
+    assert names(search_units(conn, "MIN", group_id)) == ["minutes"]
+    conn.close()
@@ -0,0 +1,83 @@
+# -*- coding: utf-8 -*-
+# tests/db/test_snapshot.py
+
+import json
+from datetime import datetime
+
+import pytest
+from psycopg2.extras import RealDictCursor
+
+from app.db import activity_queries
+from app.db.connection import primary_connect
+from app.db.schema import DEFAULT_USER_ID as USER
+from app.db.snapshot import dump_snapshot, restore_snapshot
+from app.db.timezone import localize
+from app.importer import import_csv, load_config
+
+def test_import_csv_converts_units(conn, logged_type, tmp_path):
+    type_id, unit_id = logged_type
+    csv_path = tmp_path / "export.csv"
+    csv_path.write_text("Date;Workout;Hours\n"
+                        "02/01/2026 07:30;Yoga;1.5\n"
+                        "03/01/2026 07:30;Yoga;0.5\n")
+    config_path = tmp_path / "mapping.json"
+    config_path.write_text(json.dumps({
+        "delimiter": ";",
+        "activity_type": {"column": "Workout", "values": {"Yoga": "yoga"}},
+        "quantity": {"column": "Hours"},
+        "unit": {"value": "minutes"},
+        "timestamp": {"column": "Date", "format": "%d/%m/%Y %H:%M"},
+    }))
+
+    config = load_config(str(config_path))
+    assert import_csv(conn, USER, str(csv_path), config) == 2
+    logs = activity_queries.get_activity_logs_for_type(
+            conn, USER, unit_id, type_id, start=datetime(2026, 1, 2),
+            end=datetime(2026, 1, 4))
+    assert [log["canonical_quantity"] for log in logs] == [1.5, 0.5]
+    assert logs[0]["timestamp"] == localize(datetime(2026, 1, 2, 7, 30))
+
+    csv_path.write_text("Date;Workout;Hours\n02/01/2026 07:30;Run;1\n")
+    with pytest.raises(ValueError, match="Line 2"):
+        import_csv(conn, USER, str(csv_path), config)
+
+def test_snapshot_round_trip(conn, logged_type, tmp_path):
+    type_id, unit_id = logged_type
+    dump_snapshot(conn, str(tmp_path))
+
+    activity_queries.bulk_delete_activity_logs(
+            conn, USER, activity_type_id=type_id)
+    restore_snapshot(conn, str(tmp_path))
+
+    logs = activity_queries.get_activity_logs_for_type(
+            conn, USER, unit_id, type_id)
+    assert [log["display_quantity"] for log in logs] == [10, 20, 30]
+    # Sequences continue after the restored ids.
+    new_id = activity_queries.insert_activity_log(
+            conn, USER, type_id, 1, unit_id)
+    assert new_id > max(log["id"] for log in logs)
+
+def test_dump_reads_one_snapshot(tmp_path):
+    # Plain connections, since the dump has to start a transaction of its
+    # own and the concurrent write has to commit.
+    dumping, writer = primary_connect(), primary_connect()
+
+    class WriteAfterUsers(RealDictCursor):
+        def copy_expert(self, sql, file):
+            super().copy_expert(sql, file)
+            if "FROM users " in sql:
+                with writer.cursor() as cur:
+                    cur.execute("INSERT INTO unit_groups (name) "
+                                "VALUES ('concurrent');")
+                writer.commit()
+
+    dumping.cursor_factory = WriteAfterUsers
+    try:
+        dump_snapshot(dumping, str(tmp_path))
+        assert "concurrent" not in (tmp_path / "unit_groups.csv").read_text()
+    finally:
+        with writer.cursor() as cur:
+            cur.execute("DELETE FROM unit_groups WHERE name = 'concurrent';")
+        writer.commit()
+        writer.close()
+        dumping.close()
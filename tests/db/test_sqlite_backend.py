@@ -0,0 +1,188 @@
+# -*- coding: utf-8 -*-
+# tests/db/test_sqlite_backend.py
+
+from datetime import date, datetime, timezone
+
+import pytest
+
+from app.db import activity_queries, unit_queries
+from app.db.archive import archive_activity_logs
+from app.db.connection import QueryTimeout, statement_timeout
+from app.db.schema import DEFAULT_USER_ID as USER, initialize_schema, \
+        table_exists
+from app.db.sqlite_backend import split_statements, sqlite_connect, \
+        translate
+from app.db.timezone import localize
+
+@pytest.fixture
+def sqlite_conn(tmp_path):
+    conn = sqlite_connect(str(tmp_path / "test.db"))
+    initialize_schema(conn)
+    yield conn
+    conn.close()
+
+def test_translate():
+    assert translate("SELECT 1 WHERE id = %s;") == "SELECT 1 WHERE id = ?;"
+    assert translate("DELETE FROM t WHERE id = ANY(%s);") \
+        == "DELETE FROM t WHERE id IN (SELECT value FROM json_each(?));"
+    assert translate("SELECT * FROM t FOR UPDATE;") == "SELECT * FROM t;"
+
+def test_batched_statements_stay_in_transaction(sqlite_conn):
+    assert split_statements("SELECT ';'; CREATE TRIGGER t AFTER INSERT ON "
+                            "users BEGIN SELECT 1; END;") == [
+        "SELECT ';';",
+        "CREATE TRIGGER t AFTER INSERT ON users BEGIN SELECT 1; END;"]
+    with sqlite_conn.cursor() as cur:
+        cur.execute("INSERT INTO users (name) VALUES ('pending');")
+        cur.execute("SELECT 1; SELECT 2 AS two;")
+        assert cur.fetchone() == {"two": 2}
+    sqlite_conn.rollback()
+    with sqlite_conn.cursor() as cur:
+        cur.execute("SELECT count(*) AS n FROM users WHERE name = 'pending';")
+        assert cur.fetchone()["n"] == 0
+
+def test_sqlite_schema_and_queries(sqlite_conn, tmp_path, monkeypatch):
+    conn = sqlite_conn
+    assert table_exists(conn, "activity_logs")
+    initialize_schema(conn)
+
+    group_id = unit_queries.insert_unit_group(conn, "distance", "km")
+    km = unit_queries.get_unit_group(conn, group_id)["canonical_unit_id"]
+    m = unit_queries.insert_unit(conn, "m", group_id, 0.001, 0)
+    type_id = activity_queries.insert_activity_type(
+            conn, USER, group_id, "cycling")
+    log_ids = [activity_queries.insert_activity_log(conn, USER, type_id, q,
+                                                    km)
+               for q in (10, 20, 30)]
+    for day, log_id in zip((1, 5, 9), log_ids):
+        with conn.cursor() as cur:
+            cur.execute(
+                "UPDATE activity_logs SET timestamp = %s WHERE id = %s;",
+                (datetime(2026, 1, day, 12), log_id))
+    conn.commit()
+
+    activity_queries.update_activity_log(
+            conn, USER, log_ids[0], type_id, 500, m)
+    log = activity_queries.get_activity_log(conn, USER, m, log_ids[0])
+    assert log["canonical_quantity"] == pytest.approx(0.5)
+    assert log["timestamp"] == localize(datetime(2026, 1, 1, 12))
+
+    logs = activity_queries.get_activity_logs_for_type(
+            conn, USER, km, type_id, start=datetime(2026, 1, 5))
+    assert [l["display_quantity"] for l in logs] == [20, 30]
+
+    monkeypatch.setenv("ACTIVITY_LOGS_ARCHIVE_DIR", str(tmp_path / "arch"))
+    assert archive_activity_logs(conn, datetime(2026, 1, 2)) == 1
+    totals = activity_queries.get_daily_totals(conn, USER, type_id)
+    assert totals == {date(2026, 1, 1): pytest.approx(0.5),
+                      date(2026, 1, 5): 20, date(2026, 1, 9): 30}
+
+    for log_id in log_ids[1:]:
+        activity_queries.delete_activity_log(conn, USER, log_id)
+    unit_queries.delete_unit_group(conn, group_id)
+    assert activity_queries.get_all_activity_types(conn, USER) == []
+
+def test_single_user_sqlite_schema_is_migrated(tmp_path):
+    conn = sqlite_connect(str(tmp_path / "legacy.db"))
+    with conn.cursor() as cur:
+        cur.execute("""
+            CREATE TABLE unit_groups (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                name TEXT UNIQUE NOT NULL);
+            CREATE TABLE activity_types (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                name TEXT UNIQUE NOT NULL,
+                unit_group_id INTEGER NOT NULL REFERENCES unit_groups(id),
+                goal_quantity DOUBLE PRECISION);
+            CREATE TABLE activity_logs (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                activity_type_id INTEGER NOT NULL
+                    REFERENCES activity_types(id),
+                canonical_quantity DOUBLE PRECISION NOT NULL,
+                timestamp TIMESTAMP NOT NULL);
+            INSERT INTO unit_groups (name) VALUES ('time');
+            INSERT INTO activity_types (name, unit_group_id)
+            VALUES ('yoga', 1);
+            INSERT INTO activity_logs
+                (activity_type_id, canonical_quantity, timestamp)
+            VALUES (1, 10, '2026-01-01 12:00:00');
+        """)
+    conn.commit()
+
+    initialize_schema(conn)
+
+    assert [t["name"] for t in
+            activity_queries.get_all_activity_types(conn, USER)] == ["yoga"]
+    assert activity_queries.get_daily_totals(conn, USER, 1) \
+        == {date(2026, 1, 1): 10}
+    conn.close()
+
+def test_sqlite_tag_filter(sqlite_conn):
+    conn = sqlite_conn
+    group_id = unit_queries.insert_unit_group(conn, "time", "minutes")
+    unit_id = unit_queries.get_unit_group(conn, group_id)["canonical_unit_id"]
+    type_id = activity_queries.insert_activity_type(conn, USER, group_id,
+                                                    "yoga")
+    tagged = activity_queries.insert_activity_log(
+            conn, USER, type_id, 10, unit_id, "in the park",
+            ["outdoor", "morning"])
+    activity_queries.insert_activity_log(conn, USER, type_id, 20, unit_id)
+
+    logs = activity_queries.get_activity_logs_for_type(
+            conn, USER, unit_id, type_id, tags=["morning", "outdoor"])
+    assert [(log["id"], log["tags"]) for log in logs] \
+        == [(tagged, ["morning", "outdoor"])]
+    assert activity_queries.get_activity_logs_for_type(
+            conn, USER, unit_id, type_id, tags=["outdoor", "evening"]) == []
+    assert len(activity_queries.get_activity_logs_for_type(
+            conn, USER, unit_id, type_id)) == 2
+
+def test_sqlite_days_follow_app_timezone(tmp_path, monkeypatch):
+    monkeypatch.setenv("APP_TIMEZONE", "Europe/Berlin")
+    conn = sqlite_connect(str(tmp_path / "berlin.db"))
+    initialize_schema(conn)
+    group_id = unit_queries.insert_unit_group(conn, "time", "minutes")
+    unit_id = unit_queries.get_unit_group(conn, group_id)["canonical_unit_id"]
+    type_id = activity_queries.insert_activity_type(conn, USER, group_id,
+                                                    "yoga")
+    log_id = activity_queries.insert_activity_log(conn, USER, type_id, 10,
+                                                  unit_id)
+    with conn.cursor() as cur:
+        cur.execute("UPDATE activity_logs SET timestamp = %s WHERE id = %s;",
+                    (datetime(2026, 1, 1, 23, 30, tzinfo=timezone.utc),
+                     log_id))
+        cur.execute("SELECT timestamp || '' AS stored FROM activity_logs;")
+        assert cur.fetchone()["stored"] == "2026-01-01 23:30:00"
+        # INDEXED BY fails unless the expression can use the index.
+        cur.execute("""
+            SELECT sum(canonical_quantity) AS total
+            FROM activity_logs INDEXED BY activity_logs_user_type_local_day
+            WHERE user_id = %s AND activity_type_id = %s
+                AND local_day(timestamp) = '2026-01-02';
+        """, (USER, type_id))
+        assert cur.fetchone()["total"] == 10
+    conn.commit()
+
+    assert activity_queries.get_daily_totals(conn, USER, type_id) \
+        == {date(2026, 1, 2): 10}
+    conn.close()
+
+    # Reopened in another zone, the index is rebuilt for its days.
+    monkeypatch.setenv("APP_TIMEZONE", "UTC")
+    conn = sqlite_connect(str(tmp_path / "berlin.db"))
+    initialize_schema(conn)
+    assert activity_queries.get_daily_totals(conn, USER, type_id) \
+        == {date(2026, 1, 1): 10}
+    conn.close()
+
+def test_statement_timeout_interrupts_sqlite_query(sqlite_conn):
+    slow = """
+    WITH RECURSIVE n(i) AS (SELECT 1 UNION ALL SELECT i + 1 FROM n)
+    SELECT count(*) FROM n;
+    """
+    with pytest.raises(QueryTimeout):
+        with statement_timeout(sqlite_conn, 50), sqlite_conn.cursor() as cur:
+            cur.execute(slow)
+            cur.fetchall()
+    assert sqlite_conn.statement_timeout is None
+    assert unit_queries.get_all_unit_groups(sqlite_conn) == []
@@ -0,0 +1,41 @@
+# -*- coding: utf-8 -*-
+"""
+tests/test_analytics.py
+"""
+
+from datetime import date, datetime
+
+import numpy as np
+
+from app.analytics import ActivitySeries, compute_stats, rolling_average, \
+        streaks
+
+def make_series(days_and_quantities):
+    return ActivitySeries(
+        np.array([datetime(2026, 1, d, 8) for d, _ in days_and_quantities],
+                 dtype="datetime64[us]"),
+        np.array([q for _, q in days_and_quantities], dtype=np.float64),
+    )
+
+def test_rolling_average():
+    daily = np.array([7.0, 0, 0, 0, 0, 0, 0, 14])
+    assert rolling_average(daily, 7)[-1] == 2.0
+    assert rolling_average(daily, 30)[0] == 7.0
+
+def test_streaks():
+    assert streaks(np.array([1, 1, 0, 1, 1, 1, 0])) == (3, 3)
+    assert streaks(np.array([1, 1, 1, 0, 0, 1])) == (1, 3)
+    assert streaks(np.array([1, 0, 0])) == (0, 1)
+    assert streaks(np.zeros(4)) == (0, 0)
+
+def test_compute_stats():
+    # 2026-01-05 is a Monday.
+    series = make_series([(5, 10), (5, 20), (6, 30), (12, 40)])
+    stats = compute_stats(series, factor=10, today=date(2026, 1, 12))
+    assert stats["sessions"] == 4
+    assert stats["total"] == 10
+    assert stats["current_streak"] == 1
+    assert stats["longest_streak"] == 2
+    assert stats["weekdays"]["Monday"] == {"total": 7.0, "average": 3.5}
+    assert stats["rolling_average_7"] == 1.0
+    assert stats["session_percentiles"]["50"] == 2.5
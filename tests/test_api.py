@@ -0,0 +1,88 @@
+# -*- coding: utf-8 -*-
+"""
+tests/test_api.py
+"""
+
+import pytest
+from unittest.mock import patch
+
+from psycopg2.errors import DivisionByZero
+
+from app.interface import create_app
+
+@pytest.fixture
+def client(conn):
+    with patch("app.interface.db_connect", return_value=conn):
+        app = create_app()
+        app.config["TESTING"] = True
+        return app.test_client()
+
+def test_batch_read_with_field_selection(client, logged_type):
+    type_id, unit_id = logged_type
+    response = client.get(f"/api/v1/activity_logs?activity_type_id={type_id}"
+                          f"&start=2026-01-05&fields=id,canonical_quantity")
+    logs = response.get_json()["activity_logs"]
+    assert [log["canonical_quantity"] for log in logs] == [20, 30]
+    assert set(logs[0]) == {"id", "canonical_quantity"}
+    assert b" " not in response.data
+
+    ids = ",".join(str(log["id"]) for log in logs)
+    response = client.get(f"/api/v1/activity_logs?ids={ids},0")
+    assert [log["id"] for log in response.get_json()["activity_logs"]] \
+        == [log["id"] for log in logs]
+    assert response.get_json()["activity_logs"][0]["timestamp"] \
+        == "2026-01-05T12:00:00+00:00"
+
+    response = client.get(f"/api/v1/units/{unit_id}?fields=name")
+    assert response.get_json() == {"name": "minutes"}
+
+def test_api_errors(client, logged_type):
+    assert client.get("/api/v1/units?ids=a,b").status_code == 400
+    assert client.get("/api/v1/units?fields=secret").status_code == 400
+    assert client.get("/api/v1/activity_logs").status_code == 400
+    assert client.get("/api/v1/changes?after=x").status_code == 400
+    assert client.get("/api/v1/changes?limit=0").status_code == 400
+    response = client.get("/api/v1/unit_groups/0")
+    assert response.status_code == 404
+    assert "error" in response.get_json()
+
+def test_bulk_delete_by_filter(client, logged_type):
+    type_id, _ = logged_type
+    body = {"activity_type_id": type_id, "end": "2026-01-05", "dry_run": True}
+    response = client.post("/api/v1/activity_logs/bulk_delete", json=body)
+    assert response.get_json() == {"count": 2, "dry_run": True}
+
+    body["dry_run"] = False
+    response = client.post("/api/v1/activity_logs/bulk_delete", json=body)
+    assert response.get_json()["count"] == 2
+    response = client.get(f"/api/v1/activity_logs?activity_type_id={type_id}")
+    assert len(response.get_json()["activity_logs"]) == 1
+
+    response = client.post("/api/v1/activity_logs/bulk_delete", json={})
+    assert response.status_code == 400
+
+def test_bulk_endpoints_reject_bad_ids(client, logged_type):
+    type_id, _ = logged_type
+    for body in ({"activity_type_id": "abc"}, {"activity_type_id": True},
+                 {"ids": [1, False]}):
+        response = client.post("/api/v1/activity_logs/bulk_delete",
+                               json=body)
+        assert response.status_code == 400
+    for new_type_id in ("abc", True, [type_id]):
+        response = client.post("/api/v1/activity_logs/bulk_reassign",
+                               json={"activity_type_id": type_id,
+                                     "new_activity_type_id": new_type_id})
+        assert response.status_code == 400
+
+def test_failed_bulk_write_is_rolled_back(client, logged_type):
+    def fail(conn, *args, **kwargs):
+        with conn.cursor() as cur:
+            cur.execute("SELECT 1 / 0;")
+
+    with patch("app.routes.api.bulk_delete_activity_logs", fail), \
+            pytest.raises(DivisionByZero):
+        client.post("/api/v1/activity_logs/bulk_delete", json={"ids": [1]})
+    # The shared connection is not stuck in the aborted transaction.
+    assert client.get("/api/v1/unit_groups").status_code == 200
+
+# EOF
@@ -0,0 +1,118 @@
+# -*- coding: utf-8 -*-
+"""
+tests/test_cache.py
+"""
+
+from unittest.mock import patch
+
+import numpy as np
+import pytest
+from flask import Flask
+
+from app.cache import FragmentCache, LRUCache, ResultCache
+from app.db import activity_queries
+from app.db.events import record_write
+from app.db.schema import DEFAULT_USER_ID as USER
+from app.interface import create_app
+
+@pytest.fixture
+def client(conn):
+    with patch("app.interface.db_connect", return_value=conn):
+        app = create_app()
+        app.config["TESTING"] = True
+        app.secret_key = "test"
+        return app.test_client()
+
+def test_lru_cache_evicts_least_recently_used():
+    cache = LRUCache(10, sizeof=len)
+    cache.put("a", "xxxx")
+    cache.put("b", "xxxx")
+    assert cache.get("a") == "xxxx"
+    cache.put("c", "xxxx")
+    assert cache.get("b") is None
+    assert cache.get("a") == "xxxx"
+    assert cache.size == 8
+    cache.put("d", "x" * 11)
+    assert cache.get("d") is None
+
+def test_fragment_cache_invalidated_by_write():
+    app = Flask("app.interface")
+    cache = FragmentCache(4096)
+    calls = []
+
+    def loader():
+        calls.append(1)
+        return {"units": [{"id": 1, "name": "km"}]}
+
+    def render():
+        return cache.render("activity_logs/partials/units_dropdown.html",
+                            ("units",), loader,
+                            hx_get_url="/x", hx_target="#y")
+
+    with app.app_context():
+        html = render()
+        assert "km" in html
+        assert render() == html
+        assert len(calls) == 1
+        record_write("units")
+        render()
+        assert len(calls) == 2
+
+def test_result_cache_invalidates_only_written_scopes():
+    cache = ResultCache(1024 * 1024)
+    calls = []
+
+    def daily_totals(conn, user_id, activity_type_id, tags=None):
+        calls.append(activity_type_id)
+        return {"type": activity_type_id}
+
+    def forecasts(conn, user_id):
+        calls.append("user")
+        return [user_id]
+
+    cache.call(daily_totals, None, 1, 7, ["a"])
+    assert cache.call(daily_totals, None, 1, 7, tags=["a"]) == {"type": 7}
+    cache.call(daily_totals, None, 1, 8)
+    cache.call(forecasts, None, 1)
+    assert calls == [7, 8, "user"]
+    assert (cache.hits, cache.misses) == (1, 3)
+
+    cache.apply("activity_logs",
+                [(None, {"user_id": 1, "activity_type_id": 7})])
+    cache.call(daily_totals, None, 1, 7, ["a"])
+    cache.call(daily_totals, None, 1, 8)
+    cache.call(forecasts, None, 1)
+    assert calls == [7, 8, "user", 7, "user"]
+
+    cache.apply("activity_types", None)
+    cache.call(daily_totals, None, 1, 8)
+    assert calls[-1] == 8
+    assert cache.stats()["misses"] == 6
+
+def test_result_cache_respects_memory_ceiling():
+    cache = ResultCache(3 * 8000)
+
+    def series(conn, activity_type_id):
+        return np.zeros(1000)
+
+    for type_id in range(5):
+        cache.call(series, None, type_id)
+    stats = cache.stats()
+    assert stats["entries"] == 2 and stats["bytes"] <= stats["max_bytes"]
+    cache.call(series, None, 4)
+    assert cache.call(series, None, 0) is not None
+    assert (cache.hits, cache.misses) == (1, 6)
+
+def test_stats_route_is_cached_until_a_log_is_written(client, conn,
+                                                       logged_type):
+    type_id, unit_id = logged_type
+    url = f"/activity_logs/stats?activity_type_id={type_id}"
+    first = client.get(url).get_json()
+    assert client.get(url).get_json() == first
+    stats = client.get("/api/v1/result_cache").get_json()
+    assert (stats["hits"], stats["misses"]) == (1, 1)
+
+    activity_queries.insert_activity_log(conn, USER, type_id, 5, unit_id)
+    assert client.get(url).get_json()["sessions"] \
+        == first["sessions"] + 1
+    assert client.get("/api/v1/result_cache").get_json()["misses"] == 2
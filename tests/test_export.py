@@ -0,0 +1,46 @@
+# -*- coding: utf-8 -*-
+# tests/test_export.py
+
+import json
+
+import numpy as np
+
+from app import export
+from app.db import activity_queries, unit_queries
+from app.db.schema import DEFAULT_USER_ID as USER
+from app.export import export_history
+
+def test_history_is_exported_as_memory_mapped_columns(conn, logged_type,
+                                                      tmp_path, monkeypatch):
+    type_id, unit_id = logged_type
+    group_id = unit_queries.get_unit(conn, unit_id)["group_id"]
+    hours = unit_queries.insert_unit(conn, "hours", group_id, 60, 0)
+    empty_id = activity_queries.insert_activity_type(conn, USER, group_id,
+                                                     "stretching")
+    # Several batches per type.
+    monkeypatch.setattr(export, "STREAM_BATCH_SIZE", 2)
+
+    entries = export_history(conn, USER, str(tmp_path))
+
+    with open(tmp_path / "manifest.json") as f:
+        manifest = json.load(f)
+    assert manifest["activity_types"] == entries
+    entry = next(e for e in entries if e["id"] == type_id)
+    assert entry["rows"] == 3 and entry["canonical_unit_id"] == unit_id
+    assert entry["units"] == {str(unit_id): "minutes", str(hours): "hours"}
+
+    columns = tmp_path / entry["directory"]
+    timestamps = np.load(columns / "timestamp.npy", mmap_mode="r")
+    assert isinstance(timestamps, np.memmap)
+    assert timestamps.dtype == np.dtype("datetime64[us]")
+    assert list(timestamps) == [np.datetime64(f"2026-01-0{day}T12:00")
+                                for day in (1, 5, 9)]
+    assert np.load(columns / "canonical_quantity.npy").tolist() \
+        == [10, 20, 30]
+    assert np.load(columns / f"quantity_{hours}.npy").tolist() \
+        == [10 / 60, 20 / 60, 30 / 60]
+
+    empty = next(e for e in entries if e["id"] == empty_id)
+    assert empty["rows"] == 0
+    assert np.load(tmp_path / empty["directory"] / "timestamp.npy").shape \
+        == (0,)
@@ -0,0 +1,44 @@
+# -*- coding: utf-8 -*-
+"""
+tests/test_forecast.py
+"""
+
+from datetime import date, datetime, timedelta
+
+import numpy as np
+import pytest
+
+from app.db import activity_queries, unit_queries
+from app.db.schema import DEFAULT_USER_ID
+from app.forecast import WINDOW_DAYS, fit_trends, forecast_all
+
+def test_fit_trends_batches_types():
+    t = np.arange(WINDOW_DAYS)
+    daily = np.vstack((np.full(WINDOW_DAYS, 2.0), t * 0.5))
+    projected, spread = fit_trends(daily, 10)
+    assert projected[0] == pytest.approx(20)
+    future = np.arange(WINDOW_DAYS + 1, WINDOW_DAYS + 11)
+    assert projected[1] == pytest.approx((future * 0.5).sum())
+    assert spread == pytest.approx([0, 0])
+
+def test_forecast_all(conn):
+    group_id = unit_queries.insert_unit_group(conn, "time", "minutes")
+    unit_id = unit_queries.get_unit_group(conn, group_id)["canonical_unit_id"]
+    type_id = activity_queries.insert_activity_type(
+            conn, DEFAULT_USER_ID, group_id, "yoga", 1000)
+    today = date(2026, 12, 21)
+    for offset in range(1, 31):
+        log_id = activity_queries.insert_activity_log(
+                conn, DEFAULT_USER_ID, type_id, 10, unit_id)
+        with conn.cursor() as cur:
+            cur.execute(
+                "UPDATE activity_logs SET timestamp = %s WHERE id = %s;",
+                (datetime.combine(today - timedelta(days=offset),
+                                  datetime.min.time()), log_id))
+    conn.commit()
+
+    [forecast] = forecast_all(conn, DEFAULT_USER_ID, today)
+    assert forecast["year_to_date"] == 300
+    assert forecast["unit_name"] == "minutes"
+    assert forecast["low"] <= forecast["projected"] <= forecast["high"]
+    assert not forecast["on_track"]
@@ -0,0 +1,85 @@
+# -*- coding: utf-8 -*-
+# tests/test_heatmap.py
+
+from datetime import date, datetime
+from unittest.mock import patch
+
+import pytest
+
+from app.db import activity_queries, user_queries
+from app.db.events import write_in_progress
+from app.db.schema import DEFAULT_USER_ID as USER
+from app.heatmap import HeatmapCache, day_index
+from app.interface import create_app
+
+@pytest.fixture
+def client(conn):
+    with patch("app.interface.db_connect", return_value=conn):
+        app = create_app()
+        app.config["TESTING"] = True
+        app.secret_key = "test"
+        return app.test_client()
+
+def test_heatmap_endpoint(client, conn, logged_type):
+    type_id, _ = logged_type
+    response = client.get(f"/api/v1/activity_types/{type_id}/heatmap"
+                          f"?year=2026")
+    assert response.status_code == 200
+    heatmap = response.get_json()
+    assert heatmap["year"] == 2026 and len(heatmap["days"]) == 366
+    assert {i: total for i, total in enumerate(heatmap["days"]) if total} \
+        == {0: 10, 4: 20, 8: 30}
+
+    other = user_queries.insert_user(conn, "someone else")
+    with client.session_transaction() as session:
+        session["user_id"] = other
+    response = client.get(f"/api/v1/activity_types/{type_id}/heatmap")
+    assert response.status_code == 404
+
+def test_heatmap_is_patched_in_place(conn, logged_type):
+    type_id, unit_id = logged_type
+    heatmaps = HeatmapCache(16)
+    today = date.today()
+    heatmaps.year(conn, USER, type_id, today.year)
+
+    with patch("app.db.events._callbacks", [heatmaps.apply]):
+        log_id = activity_queries.insert_activity_log(
+                conn, USER, type_id, 5, unit_id)
+        activity_queries.update_activity_log(conn, USER, log_id, type_id, 7,
+                                             unit_id)
+        second = activity_queries.insert_activity_log(
+                conn, USER, type_id, 2, unit_id)
+        activity_queries.delete_activity_log(conn, USER, second)
+
+    with patch("app.heatmap.get_daily_totals",
+               side_effect=AssertionError("cache miss")):
+        days = heatmaps.year(conn, USER, type_id, today.year)
+    assert days[day_index(today)] == 7
+
+def test_heatmap_drops_years_written_by_other_processes(conn, logged_type):
+    type_id, _ = logged_type
+    heatmaps = HeatmapCache(16)
+    heatmaps.year(conn, USER, type_id, 2026)
+    # As committed by another process: the row is already in the table
+    # when the write is reported.
+    with conn.cursor() as cur:
+        cur.execute("""
+            INSERT INTO activity_logs
+                (user_id, activity_type_id, canonical_quantity, timestamp)
+            VALUES (%s, %s, 5, %s)
+            RETURNING *;
+        """, (USER, type_id, datetime(2026, 1, 1, 18)))
+        log = cur.fetchone()
+    conn.commit()
+    heatmaps.apply("activity_logs", [(None, log)], external=True)
+    assert len(heatmaps.entries) == 0
+    assert heatmaps.year(conn, USER, type_id, 2026)[0] == 15
+
+def test_heatmap_read_during_write_is_not_kept(conn, logged_type):
+    type_id, _ = logged_type
+    heatmaps = HeatmapCache(16)
+    with write_in_progress("activity_logs"):
+        heatmaps.year(conn, USER, type_id, 2026)
+    assert len(heatmaps.entries) == 0
+    heatmaps.year(conn, USER, type_id, 2026)
+    assert len(heatmaps.entries) == 1
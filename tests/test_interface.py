@@ -4,6 +4,10 @@ tests/test_interface.py
 """
 
 import pytest
+from app.db import activity_queries, unit_queries, user_queries
+from app.db.schema import DEFAULT_USER_ID
+from app.db.search_queries import SEARCH_LIMIT
+from app.db.connection import QueryTimeout
 from app.interface import create_app
 from unittest.mock import patch
 
@@ -12,10 +16,114 @@ def client(conn):
     with patch("app.interface.db_connect", return_value=conn):
         app = create_app()
         app.config["TESTING"] = True
+        app.secret_key = "test"
         return app.test_client()
 
 def test_home_render(client):
     response = client.get("/")
     assert response.status_code == 200 # HTTP CODE 200 == "OK"
 
+def test_reference_data_revalidates_by_version(client, conn):
+    response = client.get("/reference_data/")
+    assert response.status_code == 200
+    payload = response.get_json()
+    assert set(payload) == {"version", "activity_types", "unit_groups",
+                            "units"}
+    assert payload["units"]["fields"][0] == "id"
+
+    response = client.get("/reference_data/",
+                          headers={"If-None-Match": response.headers["ETag"]})
+    assert response.status_code == 304
+
+    unit_queries.insert_unit_group(conn, "distance", "km")
+    response = client.get("/reference_data/",
+                          headers={"If-None-Match": response.headers["ETag"]})
+    assert response.status_code == 200
+    assert response.get_json()["units"]["rows"][0][1] == "km"
+
+def test_switching_user_scopes_activity_types(client, logged_type):
+    rows = client.get("/reference_data/").get_json()["activity_types"]["rows"]
+    assert [row[1] for row in rows] == ["yoga"]
+
+    response = client.post("/users/create",
+                           data={"name": "second", "password": "pw"})
+    assert response.status_code == 302
+    rows = client.get("/reference_data/").get_json()["activity_types"]["rows"]
+    assert rows == []
+
+    response = client.post("/users/create",
+                           data={"name": "second", "password": "pw"})
+    assert response.status_code == 400
+    assert response.data == b"A user with this name already exists"
+    for data in ({"name": " ", "password": "pw"}, {"name": "third"}):
+        assert client.post("/users/create", data=data).status_code == 400
+
+def test_full_dropdowns_are_not_capped(client, conn, logged_type):
+    type_id, _ = logged_type
+    group_id = activity_queries.get_activity_type(
+            conn, DEFAULT_USER_ID, type_id)["unit_group_id"]
+    for n in range(SEARCH_LIMIT + 5):
+        activity_queries.insert_activity_type(conn, DEFAULT_USER_ID,
+                                              group_id, f"type {n:02d}")
+    for url in ("/activity_logs/create", "/activity_logs/update_start",
+                "/activity_types/update/get_activity_types",
+                "/activity_types/search?q="):
+        assert f"type {SEARCH_LIMIT + 4:02d}".encode() \
+            in client.get(url).data
+    assert b"type 00" in client.get("/activity_types/search?q=type").data
+
+def test_app_refuses_to_start_without_secret_key(conn, monkeypatch):
+    monkeypatch.delenv("SECRET_KEY")
+    with patch("app.interface.db_connect", return_value=conn), \
+            pytest.raises(RuntimeError, match="SECRET_KEY"):
+        create_app()
+
+def test_selecting_a_user_takes_their_password(client, conn, logged_type):
+    second = user_queries.insert_user(conn, "second", "secret")
+    for password in (None, "wrong"):
+        response = client.post("/users/select", data={
+            "user_id": second, "password": password or ""})
+        assert response.status_code == 403
+    response = client.post("/users/select",
+                           data={"user_id": second, "password": "secret"})
+    assert response.status_code == 302
+    rows = client.get("/reference_data/").get_json()["activity_types"]["rows"]
+    assert rows == []
+
+    # Once the default user has a password, sessions must pick a user.
+    user_queries.set_user_password(conn, DEFAULT_USER_ID, "default")
+    with client.session_transaction() as session:
+        session.clear()
+    assert client.get("/api/v1/activity_types").status_code == 401
+    assert client.get("/").headers["Location"] == "/users/"
+    assert client.get("/users/").status_code == 200
+
 # EOF
+
+def test_slow_log_table_falls_back_to_latest_logs(client, logged_type):
+    type_id, unit_id = logged_type
+    with patch("app.routes.activity_logs.get_activity_logs_for_type",
+               side_effect=QueryTimeout), \
+         patch("app.routes.activity_logs.TRUNCATED_TABLE_ROWS", 2):
+        response = client.get(f"/activity_logs/view/table?activity_type_id="
+                              f"{type_id}&unit_id={unit_id}")
+    assert response.status_code == 200
+    html = response.get_data(as_text=True)
+    assert "Showing only the latest 2 logs" in html
+    assert "2026-01-09" in html and "2026-01-01" not in html
+
+def test_activity_type_typeahead(client, logged_type):
+    type_id, _ = logged_type
+    html = client.get("/activity_types/search?q=YOG").get_data(as_text=True)
+    assert f'<option value="{type_id}">yoga</option>' in html
+    html = client.get("/activity_types/search?q=xyz").get_data(as_text=True)
+    assert "yoga" not in html
+
+def test_full_log_table_is_streamed(client, logged_type):
+    type_id, unit_id = logged_type
+    response = client.get(f"/activity_logs/view/table/stream?activity_type_id="
+                          f"{type_id}&unit_id={unit_id}&start=2026-01-02")
+    assert response.is_streamed
+    html = response.get_data(as_text=True)
+    assert html.index("2026-01-05") < html.index("2026-01-09")
+    assert "2026-01-01" not in html and "</table>" in html
@@ -0,0 +1,79 @@
+# -*- coding: utf-8 -*-
+# tests/test_live.py
+
+import json
+from unittest.mock import patch
+
+import pytest
+
+from app.db import activity_queries, unit_queries
+from app.db.connection import listen_connect, primary_connect
+from app.db.schema import DEFAULT_USER_ID
+from app.interface import create_app
+from app.live import MAX_PENDING_EVENTS, ChangeFeed
+
+@pytest.fixture
+def client(conn):
+    with patch("app.interface.db_connect", return_value=conn):
+        app = create_app()
+        app.config["TESTING"] = True
+        app.secret_key = "test"
+        return app.test_client()
+
+def test_feed_fans_out_and_marks_overflow():
+    feed = ChangeFeed()
+    with feed.subscribe() as first, feed.subscribe() as second:
+        feed.publish({"op": "WRITE"})
+        assert first.get_nowait() == second.get_nowait() == {"op": "WRITE"}
+        for _ in range(MAX_PENDING_EVENTS + 1):
+            feed.publish({"op": "WRITE"})
+        assert first.get_nowait() == {"op": "OVERFLOW"}
+        assert first.empty()
+    feed.publish({"op": "WRITE"})
+
+def test_committed_log_writes_are_notified(worker_conn):
+    feed = ChangeFeed(listen_connect)
+    writer = primary_connect()
+    try:
+        with feed.subscribe() as events:
+            assert feed.listening.wait(5)
+            group_id = unit_queries.insert_unit_group(writer, "time",
+                                                      "minutes")
+            unit_id = unit_queries.get_unit_group(
+                    writer, group_id)["canonical_unit_id"]
+            type_id = activity_queries.insert_activity_type(
+                    writer, DEFAULT_USER_ID, group_id, "yoga")
+            # Far beyond the 8000 byte notification limit.
+            log_id = activity_queries.insert_activity_log(
+                    writer, DEFAULT_USER_ID, type_id, 30, unit_id,
+                    notes="x" * 10000,
+                    tags=[f"tag{i}" for i in range(2000)])
+            activity_queries.delete_activity_log(writer, DEFAULT_USER_ID,
+                                                 log_id)
+
+            inserted = events.get(timeout=5)
+            assert (inserted["op"], inserted["id"],
+                    inserted["canonical_quantity"]) == ("INSERT", log_id, 30)
+            assert "tags" not in inserted and "notes" not in inserted
+            assert events.get(timeout=5)["op"] == "DELETE"
+    finally:
+        feed.stop()
+        with writer.cursor() as cur:
+            cur.execute("DELETE FROM unit_groups;")
+        writer.commit()
+        writer.close()
+
+def test_event_stream_only_sends_own_logs(client):
+    feed = ChangeFeed()
+    client.application.extensions["live_feed"] = feed
+    response = client.get("/activity_logs/events", buffered=False)
+    assert response.mimetype == "text/event-stream"
+    chunks = iter(response.response)
+    assert next(chunks).startswith(b"retry:")
+
+    feed.publish({"op": "INSERT", "id": 7, "user_id": DEFAULT_USER_ID + 1})
+    feed.publish({"op": "INSERT", "id": 8, "user_id": DEFAULT_USER_ID})
+    event = next(chunks).decode()
+    assert event.startswith("event: activity_log\n")
+    assert json.loads(event.split("data: ")[1])["id"] == 8
+    response.close()
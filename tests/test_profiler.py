@@ -0,0 +1,48 @@
+# -*- coding: utf-8 -*-
+# tests/test_profiler.py
+
+import os
+from unittest.mock import patch
+
+import pytest
+
+from app.interface import create_app
+
+@pytest.fixture
+def client(conn, tmp_path, monkeypatch):
+    monkeypatch.setenv("PROFILING_ENABLED", "1")
+    monkeypatch.setenv("PROFILE_DIR", str(tmp_path))
+    with patch("app.interface.db_connect", return_value=conn):
+        app = create_app()
+        app.config["TESTING"] = True
+        app.secret_key = "test"
+        return app.test_client()
+
+def test_only_flagged_requests_are_profiled(client, tmp_path):
+    response = client.get("/activity_logs/view/table")
+    assert response.status_code == 200
+    assert "X-Profile" not in response.headers
+    assert not os.listdir(tmp_path)
+
+    response = client.get("/activity_logs/view/table?profile=1")
+    name = response.headers["X-Profile"]
+    assert sorted(os.listdir(tmp_path)) == [name + ".prof", name + ".txt"]
+    summary = (tmp_path / (name + ".txt")).read_text()
+    assert "route view_activity_log_table:" in summary
+
+    response = client.get("/", headers={"X-Profile": "1"})
+    name = response.headers["X-Profile"]
+    assert name.endswith("_home")
+    summary = (tmp_path / (name + ".txt")).read_text()
+    assert "route home:" in summary
+    assert "    get_all_activity_types:" in summary
+
+def test_profiling_needs_server_flag(conn, tmp_path, monkeypatch):
+    monkeypatch.delenv("PROFILING_ENABLED", raising=False)
+    monkeypatch.setenv("PROFILE_DIR", str(tmp_path))
+    with patch("app.interface.db_connect", return_value=conn):
+        app = create_app()
+    app.config["TESTING"] = True
+    response = app.test_client().get("/", headers={"X-Profile": "1"})
+    assert "X-Profile" not in response.headers
+    assert not os.listdir(tmp_path)